@@ -0,0 +1,132 @@
+"""Small on-disk cache shared by the hooks.
+
+All files are stored as json in a `.pre_commit_hooks_cache` directory in the
+current working directory. The location can be changed with the
+`PRE_COMMIT_HOOKS_CACHE` environment variable.
+
+"""
+################################################################################
+# Imports
+################################################################################
+
+
+from __future__ import annotations
+import os
+import json
+import hashlib
+import pathlib
+import subprocess
+
+
+################################################################################
+# Typing
+################################################################################
+
+
+from typing import Any, Optional, Union, Iterable, Iterator, Dict, List
+Manifest = Dict[str, List[Union[int, str]]]
+
+
+################################################################################
+# Globals
+################################################################################
+
+
+CACHE_DIR_NAME = '.pre_commit_hooks_cache'
+
+
+################################################################################
+# Utils
+################################################################################
+
+
+def cache_dir() -> pathlib.Path:
+    path = os.environ.get('PRE_COMMIT_HOOKS_CACHE')
+    if path is None:
+        path = os.path.join(os.getcwd(), CACHE_DIR_NAME)
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    gitignore = path / '.gitignore'
+    if not gitignore.is_file():
+        gitignore.write_text('*\n')
+    return path
+
+
+def load_json(name: str, default: Optional[Any] = None) -> Any:
+    file = cache_dir() / name
+    try:
+        with open(file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def dump_json(name: str, data: Any) -> None:
+    file = cache_dir() / name
+    tmp = file.with_suffix(file.suffix + f'.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, file)
+
+
+def file_sha(path: Union[str, os.PathLike]) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def python_files(root: Union[str, os.PathLike]) -> Iterator[str]:
+    """Yields the .py files below `root`.
+
+    In a git repository, these are the tracked and untracked files, that
+    aren't ignored, so that virtual environments and build directories are
+    skipped. Otherwise hidden directories are skipped.
+
+    """
+    from . import _git
+    try:
+        out = _git.git('ls-files', '-z', '--cached', '--others',
+                       '--exclude-standard', '--', '*.py', cwd=str(root))
+    except (OSError, subprocess.CalledProcessError):
+        out = None
+    if out is not None:
+        for filename in sorted(set(out.split('\0')) - {''}):
+            yield os.path.join(root, filename)
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames
+                       if not d.startswith('.') and d != '__pycache__']
+        for filename in filenames:
+            if filename.endswith('.py'):
+                yield os.path.join(dirpath, filename)
+
+
+def manifest(paths: Iterable[str],
+             previous: Optional[Manifest] = None) -> Manifest:
+    """Maps files to their mtime, size and sha1.
+
+    Files are only hashed, if their mtime or size differ from the entry
+    in `previous`.
+
+    """
+    previous = previous or {}
+    out = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        old = previous.get(path)
+        if old is not None and old[:2] == [stat.st_mtime_ns, stat.st_size]:
+            out[path] = old
+        else:
+            out[path] = [stat.st_mtime_ns, stat.st_size, file_sha(path)]
+    return out
+
+
+def manifest_changed(old: Manifest, new: Manifest) -> bool:
+    if old.keys() != new.keys():
+        return True
+    return any(old[path][2] != new[path][2] for path in new)
@@ -0,0 +1,222 @@
+"""The `[tool.<hook>]` sections of pyproject.toml shared by the hooks.
+
+Every hook has a schema with the type and default value of its options.
+Parsed pyproject.toml files are cached in `.pre_commit_hooks_cache`, keyed
+by their path, mtime and size, so that an unchanged file isn't parsed again.
+
+"""
+################################################################################
+# Imports
+################################################################################
+
+
+from __future__ import annotations
+import os
+import copy
+import json
+import pathlib
+from . import _cache
+
+
+################################################################################
+# Typing
+################################################################################
+
+
+from typing import Any, Optional, Union, Tuple, Dict, List
+OptionsDict = Dict[str, Any]
+Schema = Dict[str, Tuple[Tuple[type, ...], Any]]
+
+
+################################################################################
+# Globals
+################################################################################
+
+
+PARSE_CACHE = 'pyproject_cache.json'
+# files parsed in this process, so that hooks running in one process
+# (`pre-commit-hooks run`) don't read the cache again
+PARSED: Dict[str, Tuple[List[int], Dict[str, Any]]] = {}
+
+
+NUMBER = (int, float)
+OPTIONAL_NUMBER = (int, float, type(None))
+OPTIONAL_STR = (str, type(None))
+STR_LIST = (list,)
+VERBOSE = (bool, int)
+
+
+SCHEMAS: Dict[str, Schema] = {
+    'run_coverage': {
+        'threshold': (NUMBER, 100),
+        'file': (OPTIONAL_STR, None),
+        'verbose': (VERBOSE, False),
+        'testing': ((bool,), False),
+        'impact': ((bool,), False),
+        'diff_coverage': ((bool,), False),
+        'diff_base': (OPTIONAL_STR, None),
+        'core': (OPTIONAL_STR, None),
+        'cache': ((bool,), False),
+        'discovery_cache': ((bool,), True),
+        'include_tests': (STR_LIST, []),
+        'exclude_tests': (STR_LIST, []),
+        'time_budget': (OPTIONAL_NUMBER, None),
+        'memory_profile': ((bool,), False),
+        'memory_budget': (OPTIONAL_NUMBER, None),
+        'memory_top': ((int,), 3),
+        'isolate': ((bool,), False),
+        'timeout': (OPTIONAL_NUMBER, None),
+        'memory_limit': (OPTIONAL_NUMBER, None),
+        'include': (STR_LIST, []),
+        'omit': (STR_LIST, []),
+        'reports': (STR_LIST, []),
+    },
+    'run_pycodestyle': {
+        'excluded_lines': (STR_LIST, []),
+        'paths': ((list, type(None)), None),
+        'excluded_files': (STR_LIST, []),
+        'excluded_errors': (STR_LIST, []),
+        'max_line_length': ((int,), 79),
+        'verbose': (VERBOSE, False),
+    },
+    'run_run_unittests': {
+        'workers': ((int,), 1),
+        'start_method': ((str,), 'spawn'),
+        'preload': (STR_LIST, []),
+        'affected_only': ((bool,), False),
+        'full_run': (STR_LIST, ['setup.py', '*conftest.py',
+                                'tests/run_unittests.py']),
+        'include_tests': (STR_LIST, []),
+        'exclude_tests': (STR_LIST, []),
+        'verbose': (VERBOSE, 1),
+    },
+    'clear_ipynb_cells': {
+        'excluded_files': (STR_LIST, []),
+        'verbose': (VERBOSE, False),
+    },
+    'run_notebooks': {
+        'excluded_files': (STR_LIST, []),
+        'timeout': (OPTIONAL_NUMBER, None),
+        'kernel': (OPTIONAL_STR, None),
+        'verbose': (VERBOSE, False),
+    },
+}
+
+
+################################################################################
+# Utils
+################################################################################
+
+
+def parse_toml(path: Union[str, pathlib.Path]) -> Dict[str, Any]:
+    """Parses a toml file with `tomllib` or the `toml` package."""
+    try:
+        import tomllib
+    except ImportError:  # python < 3.11
+        import toml
+        with open(path) as f:
+            return toml.load(f)
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def read_toml(path: Union[str, pathlib.Path]) -> Dict[str, Any]:
+    """Returns the content of a toml file, using the parse cache.
+
+    Files containing values, that can't be stored as json (like dates), are
+    parsed every time.
+
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = [stat.st_mtime_ns, stat.st_size]
+    parsed = PARSED.get(path)
+    if parsed is not None and parsed[0] == key:
+        return parsed[1]
+    cache = _cache.load_json(PARSE_CACHE, {})
+    entry = cache.get(path)
+    if entry is not None and entry[:2] == key:
+        PARSED[path] = (key, entry[2])
+        return entry[2]
+    data = parse_toml(path)
+    PARSED[path] = (key, data)
+    try:
+        cache[path] = [*key, json.loads(json.dumps(data))]
+    except (TypeError, ValueError):
+        return data
+    _cache.dump_json(PARSE_CACHE, cache)
+    return data
+
+
+def validate(section: str, settings: OptionsDict) -> List[str]:
+    """Raises a `ValueError` listing the options with wrong types.
+
+    Returns:
+        List[str]: The unknown options, which are ignored with a warning,
+            so that a config written for a newer version still loads.
+
+    """
+    schema = SCHEMAS[section]
+    errors = []
+    unknown = []
+    for key, value in settings.items():
+        if key not in schema:
+            unknown.append(key)
+            continue
+        types, _ = schema[key]
+        if not isinstance(value, types):
+            names = ' or '.join('None' if t is type(None) else t.__name__
+                                for t in types)
+            errors.append(f"{key} must be {names}, got {value!r}.")
+        elif types is STR_LIST and not all(isinstance(v, str) for v in value):
+            errors.append(f"{key} must be a list of strings, got {value!r}.")
+    if errors:
+        raise ValueError(f"Invalid [tool.{section}] section:\n"
+                         + '\n'.join(errors))
+    return unknown
+
+
+################################################################################
+# Main
+################################################################################
+
+
+def load_config(section: str, tomlfile: Optional[str] = None
+                ) -> Tuple[OptionsDict, str]:
+    """Loads the `[tool.<section>]` options of a hook.
+
+    Args:
+        section (str): The name of the hook, e.g. 'run_coverage'.
+        tomlfile (Optional[str]): The toml file. Defaults to None, in which
+            case pyproject.toml in the current directory is used, if present.
+
+    Returns:
+        Tuple[OptionsDict, str]: The options with defaults for all missing
+            options and a sentence telling where the values came from.
+
+    Raises:
+        ValueError: If the section contains options with wrong types.
+
+    """
+    config = {k: copy.deepcopy(v) for k, (_, v) in SCHEMAS[section].items()}
+    default_str = "Default values have been used."
+    if tomlfile is None:
+        toml_path = pathlib.Path("pyproject.toml").resolve()
+        if toml_path.is_file():
+            tomlfile = str(toml_path)
+
+    if tomlfile is not None:
+        data = read_toml(tomlfile)
+        settings = data.get("tool", {}).get(section, {})
+        try:
+            unknown = validate(section, settings)
+        except ValueError as e:
+            raise ValueError(f"{e}\nIn file {tomlfile}.") from None
+        for key in unknown:
+            print(f"Warning: Ignoring unknown option {key!r} of "
+                  f"[tool.{section}] in {tomlfile}. Available options are: "
+                  f"{', '.join(SCHEMAS[section])}.")
+        config.update(copy.deepcopy({k: v for k, v in settings.items()
+                                     if k not in unknown}))
+        default_str = f"Values have been loaded from {tomlfile}"
+    return config, default_str
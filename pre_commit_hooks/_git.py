@@ -0,0 +1,236 @@
+"""Helpers that call the git command line.
+
+"""
+################################################################################
+# Imports
+################################################################################
+
+
+from __future__ import annotations
+import os
+import re
+import subprocess
+import threading
+
+
+################################################################################
+# Typing
+################################################################################
+
+
+from typing import (Optional, Sequence, Iterable, Iterator, Dict, Set, List,
+                    Tuple)
+
+
+################################################################################
+# Globals
+################################################################################
+
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+################################################################################
+# Utils
+################################################################################
+
+
+def git(*args: str, cwd: Optional[str] = None) -> str:
+    proc = subprocess.run(['git', *args], cwd=cwd, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    return proc.stdout
+
+
+def toplevel(cwd: Optional[str] = None) -> str:
+    return os.path.abspath(git('rev-parse', '--show-toplevel', cwd=cwd).strip())
+
+
+def diff_hunks(base: Optional[str] = None, side: str = 'new',
+               cwd: Optional[str] = None) -> Dict[str, Set[int]]:
+    """Returns the lines touched by the staged changes.
+
+    Args:
+        base (Optional[str]): The revision to compare the index against.
+            Defaults to None, in which case HEAD is used.
+        side (str): Either 'new' for line numbers in the staged version
+            of the files or 'old' for line numbers in `base`. Defaults to 'new'.
+        cwd (Optional[str]): The directory to run git in.
+
+    Returns:
+        Dict[str, Set[int]]: A mapping of absolute filenames to line numbers.
+            Files that only exist on the other side map to an empty set.
+
+    """
+    if side not in ('new', 'old'):
+        raise ValueError(f"`side` must be 'new' or 'old', got {side}.")
+    top = toplevel(cwd)
+    args = ['diff', '--cached', '-U0', '--no-color', '--no-ext-diff']
+    if base is not None:
+        args.append(base)
+    out = git(*args, cwd=cwd)
+
+    hunks = {}
+    old_file = new_file = None
+    for line in out.splitlines():
+        if line.startswith('--- '):
+            old_file = None if line[4:] == '/dev/null' else line[6:]
+            continue
+        if line.startswith('+++ '):
+            new_file = None if line[4:] == '/dev/null' else line[6:]
+            if side == 'new':
+                file = new_file or old_file
+            else:
+                file = old_file or new_file
+            hunks.setdefault(os.path.join(top, file), set())
+            continue
+        match = HUNK_HEADER.match(line)
+        if match is None:
+            continue
+        file = new_file if side == 'new' else old_file
+        if file is None:
+            continue
+        old_start, old_count, new_start, new_count = match.groups()
+        if side == 'new':
+            start = int(new_start)
+            count = 1 if new_count is None else int(new_count)
+            lines = set(range(start, start + count))
+        else:
+            start = int(old_start)
+            count = 1 if old_count is None else int(old_count)
+            if count == 0:
+                # pure insertion after line `start`
+                lines = {max(start, 1), start + 1}
+            else:
+                lines = set(range(start, start + count))
+        hunks[os.path.join(top, file)].update(lines)
+    return hunks
+
+
+def blob_shas(paths: Sequence[str], rev: Optional[str] = None,
+              cwd: Optional[str] = None) -> Dict[str, str]:
+    """Returns the git blob shas of files.
+
+    Args:
+        paths (Sequence[str]): The files.
+        rev (Optional[str]): If given, the shas of the files in this revision
+            are returned. Files missing from `rev` are left out. Defaults to
+            None, in which case the files in the working tree are hashed.
+        cwd (Optional[str]): The directory to run git in.
+
+    Returns:
+        Dict[str, str]: A mapping of the absolute filenames to blob shas.
+
+    """
+    paths = [os.path.abspath(p) for p in paths]
+    if not paths:
+        return {}
+    if rev is None:
+        paths = [p for p in paths if os.path.isfile(p)]
+        if not paths:
+            return {}
+        out = git('hash-object', '--', *paths, cwd=cwd)
+        return dict(zip(paths, out.split()))
+    top = toplevel(cwd)
+    rel = [os.path.relpath(p, top) for p in paths]
+    out = git('ls-tree', '-r', '--full-tree', rev, '--', *rel, cwd=top)
+    shas = {}
+    for line in out.splitlines():
+        info, file = line.split('\t', 1)
+        shas[os.path.join(top, file)] = info.split()[2]
+    return shas
+
+
+def cat_blobs(shas: Iterable[str], cwd: Optional[str] = None
+              ) -> Iterator[Tuple[str, bytes]]:
+    """Streams the contents of blobs from a single `git cat-file --batch`.
+
+    The shas are written to git from a thread, while the contents are read.
+    Missing objects are skipped.
+
+    Yields:
+        Tuple[str, bytes]: The sha and the content of every blob.
+
+    """
+    proc = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=cwd,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def write():
+        try:
+            for sha in shas:
+                proc.stdin.write(f'{sha}\n'.encode())
+            proc.stdin.close()
+        except OSError:
+            pass
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    try:
+        while True:
+            header = proc.stdout.readline()
+            if not header:
+                break
+            sha, kind, *size = header.split()
+            if kind == b'missing':
+                continue
+            data = proc.stdout.read(int(size[0]))
+            proc.stdout.read(1)
+            yield sha.decode(), data
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        thread.join()
+        proc.stdout.close()
+        proc.wait()
+
+
+class CommitGraph:
+    """The tags and the ancestry of commits in a repository.
+
+    All tags are resolved to commits with a single `git for-each-ref` and
+    the history of a revision is read with a single `git rev-list --parents`.
+    Membership checks are set lookups.
+
+    Args:
+        cwd (Optional[str]): The directory to run git in.
+
+    """
+    def __init__(self, cwd: Optional[str] = None) -> None:
+        self.cwd = cwd
+        self.parents: Dict[str, List[str]] = {}
+        self._ancestors: Dict[str, Set[str]] = {}
+        self._tags: Optional[Dict[str, str]] = None
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        """Maps tag names to the shas of the commits they point to."""
+        if self._tags is None:
+            out = git('for-each-ref', '--format=%(refname:strip=2) '
+                      '%(objectname) %(*objectname)', 'refs/tags', cwd=self.cwd)
+            self._tags = {}
+            for line in out.splitlines():
+                # annotated tags are peeled to their commit
+                name, sha, *peeled = line.split()
+                self._tags[name] = peeled[0] if peeled else sha
+        return self._tags
+
+    def ancestors(self, rev: str) -> Set[str]:
+        """Returns the shas of `rev` and all its ancestors."""
+        if rev not in self._ancestors:
+            out = git('rev-list', '--parents', rev, '--', cwd=self.cwd)
+            shas = set()
+            for line in out.splitlines():
+                sha, *parents = line.split()
+                self.parents[sha] = parents
+                shas.add(sha)
+            self._ancestors[rev] = shas
+        return self._ancestors[rev]
+
+    def is_ancestor(self, sha: str, rev: str) -> bool:
+        return sha in self.ancestors(rev)
+
+    def tags_in(self, rev: str) -> Dict[str, str]:
+        """Returns the tags pointing to `rev` or one of its ancestors."""
+        ancestors = self.ancestors(rev)
+        return {name: sha for name, sha in self.tags.items()
+                if sha in ancestors}
@@ -0,0 +1,252 @@
+"""Static import dependencies between the python files of a project.
+
+The imports of every file are read from its ast and cached in
+`.pre_commit_hooks_cache`, so that only new or changed files are parsed.
+
+"""
+################################################################################
+# Imports
+################################################################################
+
+
+from __future__ import annotations
+import os
+import ast
+import fnmatch
+from . import _cache
+
+
+################################################################################
+# Typing
+################################################################################
+
+
+from typing import Optional, Iterable, Sequence, List, Dict, Set, Tuple
+
+
+################################################################################
+# Globals
+################################################################################
+
+
+IMPORTS = 'import_graph.json'
+FULL_RUN = ['setup.py', '*conftest.py', 'tests/run_unittests.py']
+# packaging and configuration files, that always affect everything
+GLOBAL_FILES = ['setup.py', 'setup.cfg', 'pyproject.toml']
+
+
+################################################################################
+# Utils
+################################################################################
+
+
+def module_name(path: str, root: str) -> str:
+    """The name of the module in `path`, when `root` is on `sys.path`."""
+    parts = os.path.relpath(path, root)[:-3].split(os.sep)
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    return '.'.join(parts)
+
+
+def imported_names(source: str, name: str, is_package: bool = False
+                   ) -> Tuple[List[str], bool]:
+    """Returns the absolute names of all modules a source could import.
+
+    For `from a import b`, both `a` and `a.b` are returned, because `b` can
+    be a submodule. Relative imports are resolved using `name`.
+
+    Args:
+        source (str): The source code.
+        name (str): The name of the module.
+        is_package (bool): Whether the source is a package's `__init__.py`.
+
+    Returns:
+        Tuple[List[str], bool]: The names and whether the source contains
+            imports, that can't be resolved statically (like
+            `importlib.import_module(name)`).
+
+    """
+    names = set()
+    dynamic = False
+    package = name if is_package else name.rpartition('.')[0]
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ''
+            if node.level:
+                parts = package.split('.') if package else []
+                if node.level - 1 > len(parts):
+                    continue
+                base = '.'.join(parts[:len(parts) - node.level + 1])
+                module = '.'.join(p for p in (base, module) if p)
+            if module:
+                names.add(module)
+            names.update('.'.join(p for p in (module, alias.name) if p)
+                         for alias in node.names if alias.name != '*')
+        elif isinstance(node, ast.Call):
+            func = node.func
+            func = getattr(func, 'attr', getattr(func, 'id', None))
+            if func not in ('import_module', '__import__'):
+                continue
+            arg = node.args[0] if node.args else None
+            if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                names.add(arg.value)
+            else:
+                dynamic = True
+    return sorted(names), dynamic
+
+
+def parse_imports(root: str) -> Dict[str, Tuple[List[str], bool]]:
+    """Returns the imported names of every .py file below `root`.
+
+    Files that can't be parsed are marked as dynamic.
+
+    """
+    cache = _cache.load_json(IMPORTS, {})
+    if cache.get('root') != root:
+        cache = {}
+    old = cache.get('manifest', {})
+    new = _cache.manifest(_cache.python_files(root), old)
+    imports = cache.get('imports', {})
+    out = {}
+    for path, entry in new.items():
+        if path in imports and old.get(path) == entry:
+            out[path] = imports[path]
+            continue
+        try:
+            with open(path, encoding='utf-8') as f:
+                source = f.read()
+            out[path] = imported_names(
+                source, module_name(path, root),
+                os.path.basename(path) == '__init__.py',
+            )
+        except (SyntaxError, ValueError, OSError):
+            out[path] = ([], True)
+    if new != old or out.keys() != imports.keys():
+        _cache.dump_json(IMPORTS, {'root': root, 'manifest': new,
+                                   'imports': out})
+    return {k: (list(v[0]), bool(v[1])) for k, v in out.items()}
+
+
+def dependency_graph(root: str, extra: Iterable[str] = ()
+                     ) -> Tuple[Dict[str, Set[str]], Set[str]]:
+    """Maps every .py file below `root` to the project files it imports.
+
+    Importing `a.b` also depends on `a/__init__.py`. Files in `extra`
+    (e.g. deleted files) can be imported, but have no imports themselves.
+
+    Returns:
+        Tuple[Dict[str, Set[str]], Set[str]]: The graph and the files
+            containing dynamic imports.
+
+    """
+    imports = parse_imports(root)
+    files = {module_name(f, root): f for f in [*imports, *extra]}
+    prefix = os.path.basename(root) + '.'
+    graph = {}
+    dynamic = set()
+    for path, (names, is_dynamic) in imports.items():
+        if is_dynamic:
+            dynamic.add(path)
+        deps = set()
+        for name in names:
+            if name.startswith(prefix) and name not in files:
+                name = name[len(prefix):]
+            parts = name.split('.')
+            for i in range(1, len(parts) + 1):
+                file = files.get('.'.join(parts[:i]))
+                if file is not None and file != path:
+                    deps.add(file)
+        graph[path] = deps
+    return graph, dynamic
+
+
+def dependency_keys(files: Iterable[str], root: str
+                    ) -> Dict[str, Optional[str]]:
+    """Maps `files` to a hash of the project files they import.
+
+    The hash covers the paths and contents of all files imported directly or
+    indirectly, so that it changes with e.g. a base class in another module.
+
+    Returns:
+        Dict[str, Optional[str]]: The hashes. None for files, that depend on
+            a file with dynamic imports, which can't be followed.
+
+    """
+    import hashlib
+    root = os.path.abspath(root)
+    graph, dynamic = dependency_graph(root)
+    # up to date after `dependency_graph`
+    manifest = _cache.load_json(IMPORTS, {}).get('manifest', {})
+    keys = {}
+    for file in files:
+        file = os.path.abspath(file)
+        deps = set()
+        stack = list(graph.get(file, ()))
+        while stack:
+            dep = stack.pop()
+            if dep not in deps:
+                deps.add(dep)
+                stack.extend(graph.get(dep, ()))
+        if (deps | {file}) & dynamic:
+            keys[file] = None
+            continue
+        h = hashlib.sha1()
+        for dep in sorted(deps):
+            entry = manifest.get(dep)
+            h.update(f"{dep} {entry[2] if entry else ''}\n".encode())
+        keys[file] = h.hexdigest()
+    return keys
+
+
+################################################################################
+# Main
+################################################################################
+
+
+def affected_files(changed: Iterable[str], root: str,
+                   full_run: Sequence[str] = FULL_RUN) -> Optional[Set[str]]:
+    """Returns the files, that directly or indirectly import a changed file.
+
+    Files with dynamic imports are always affected. Other non-python files,
+    like docs, notebooks or data, affect nothing.
+
+    Args:
+        changed (Iterable[str]): The changed files.
+        root (str): The project directory. Modules are named relative to it.
+        full_run (Sequence[str]): Globs of files relative to `root`. If one of
+            them or one of `GLOBAL_FILES` changed, everything is affected.
+
+    Returns:
+        Optional[Set[str]]: The absolute filenames of the affected files
+            including the changed python files. None, if everything is
+            affected, because a python file outside of `root` or a file
+            matching `full_run` or `GLOBAL_FILES` changed.
+
+    """
+    root = os.path.abspath(root)
+    changed = {os.path.abspath(f) for f in changed}
+    for file in list(changed):
+        rel = os.path.relpath(file, root)
+        if any(fnmatch.fnmatch(rel, p) for p in [*GLOBAL_FILES, *full_run]):
+            return None
+        if not file.endswith('.py'):
+            changed.discard(file)
+        elif rel.startswith(os.pardir):
+            return None
+    deleted = [f for f in changed if not os.path.isfile(f)]
+    graph, dynamic = dependency_graph(root, deleted)
+    importers = {}
+    for path, deps in graph.items():
+        for dep in deps:
+            importers.setdefault(dep, set()).add(path)
+    affected = set()
+    stack = list(changed | dynamic)
+    while stack:
+        file = stack.pop()
+        if file in affected:
+            continue
+        affected.add(file)
+        stack.extend(importers.get(file, ()))
+    return affected
@@ -0,0 +1,46 @@
+"""Subprocesses started by the hooks.
+
+`pre-commit-hooks run` replaces `sys.stdout` with a stream, that captures the
+output of every hook thread separately. Subprocesses write to the file
+descriptor of the terminal instead, so their output is piped and written to
+`sys.stdout`, which puts it below the name of the hook, that started them.
+
+"""
+################################################################################
+# Imports
+################################################################################
+
+
+from __future__ import annotations
+import sys
+import subprocess
+
+
+################################################################################
+# Typing
+################################################################################
+
+
+from typing import Any, Sequence
+
+
+################################################################################
+# Utils
+################################################################################
+
+
+def call(args: Sequence[str], **kwargs: Any) -> int:
+    """Runs `args` like `subprocess.call` and returns the exit code.
+
+    If `sys.stdout` captures the output per thread (it has a `redirect`
+    method), stdout and stderr of the process are written to it.
+
+    """
+    if getattr(sys.stdout, 'redirect', None) is None:
+        return subprocess.call(args, **kwargs)
+    with subprocess.Popen(args, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, universal_newlines=True,
+                          errors='replace', **kwargs) as proc:
+        for line in proc.stdout:
+            sys.stdout.write(line)
+    return proc.returncode
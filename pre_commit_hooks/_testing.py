@@ -0,0 +1,704 @@
+"""Unittest discovery shared by the hooks running tests.
+
+"""
+################################################################################
+# Imports
+################################################################################
+
+
+from __future__ import annotations
+import os
+import sys
+import json
+import re
+import time
+import heapq
+import statistics
+import tracemalloc
+import queue
+import multiprocessing
+import fnmatch
+import importlib
+import unittest
+from unittest.loader import VALID_MODULE_NAME
+from . import _cache, _imports
+
+
+################################################################################
+# Typing
+################################################################################
+
+
+from typing import Optional, Iterator, List, Dict, Tuple, Sequence, Union
+
+
+################################################################################
+# Globals
+################################################################################
+
+
+INDEX = 'test_index.json'
+DURATIONS = 'test_durations.json'
+# if set, `record_durations` also writes the durations of the run to this file
+RUN_DURATIONS_ENV = 'PRE_COMMIT_HOOKS_RUN_DURATIONS'
+N_DURATIONS = 5
+
+
+################################################################################
+# Utils
+################################################################################
+
+
+class LazySuite(unittest.TestSuite):
+    """A suite of test ids, that are only loaded when the suite is iterated.
+
+    The module containing the tests is imported on the first iteration,
+    which happens when the suite is run.
+
+    """
+    def __init__(self, ids: List[str], loader: unittest.TestLoader) -> None:
+        super().__init__()
+        self.ids = list(ids)
+        self.loader = loader
+        self.loaded = False
+
+    def load(self) -> None:
+        if not self.loaded:
+            self.loaded = True
+            self.addTests(self.loader.loadTestsFromNames(self.ids))
+
+    def __iter__(self) -> Iterator[unittest.TestCase]:
+        self.load()
+        return super().__iter__()
+
+    def countTestCases(self) -> int:
+        if not self.loaded:
+            return len(self.ids)
+        return super().countTestCases()
+
+
+class TestSelector:
+    """Selects tests by their ids and markers.
+
+    Patterns are globs matched against the whole test id
+    (e.g. `'*.test_module.TestClass.*'`), regular expressions prefixed with
+    `'re:'` that are searched in the test id, or marker names prefixed with
+    `'marker:'`. Markers are set as a `markers` attribute (a sequence of str)
+    on test methods or test classes.
+
+    A test is selected, if it matches any of the `include` patterns (or
+    there are none) and none of the `exclude` patterns.
+
+    """
+    def __init__(self, include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+
+    @staticmethod
+    def matches(pattern: str, test_id: str, markers: Sequence[str]) -> bool:
+        if pattern.startswith('marker:'):
+            return pattern[7:] in markers
+        if pattern.startswith('re:'):
+            return re.search(pattern[3:], test_id) is not None
+        return fnmatch.fnmatchcase(test_id, pattern)
+
+    def __call__(self, test_id: str, markers: Sequence[str] = ()) -> bool:
+        if self.include and not any(self.matches(p, test_id, markers)
+                                    for p in self.include):
+            return False
+        return not any(self.matches(p, test_id, markers)
+                       for p in self.exclude)
+
+    def excludes_module(self, name: str) -> bool:
+        """Whether every test in the module `name` is excluded by its id.
+
+        The patterns are matched against placeholder ids, that only wildcards
+        can match, so that excluded modules don't need to be imported.
+
+        """
+        placeholders = [f'{name}.\0.\0', f'{name}.\0\0\0.\0\0\0']
+        for pattern in self.exclude:
+            if pattern.startswith('marker:'):
+                continue
+            if all(self.matches(pattern, p, ()) for p in placeholders):
+                return True
+        return False
+
+
+def test_markers(test: unittest.TestCase) -> List[str]:
+    method = getattr(test, getattr(test, '_testMethodName', ''), None)
+    markers = list(getattr(type(test), 'markers', ()))
+    markers.extend(getattr(method, 'markers', ()))
+    return markers
+
+
+class TimedResultMixin:
+    """Records the wall time of every test in `self.durations`."""
+    def startTest(self, test: unittest.TestCase) -> None:
+        if not hasattr(self, 'durations'):
+            self.durations = {}
+        self._test_start = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test: unittest.TestCase) -> None:
+        super().stopTest(test)
+        self.durations[test.id()] = time.perf_counter() - self._test_start
+
+
+class MemoryResultMixin:
+    """Traces the allocations of every test with tracemalloc.
+
+    The peak of the traced memory during every test is saved in
+    `self.peaks` (in bytes). If `memory_top` is larger than 0, snapshots are
+    taken before and after every test and the sites of the largest
+    allocations, that are still held after the test, are saved in
+    `self.sites`. Tests, whose peak exceeds `memory_budget` (in MB), fail.
+
+    """
+    memory_budget = None
+    memory_top = 3
+
+    def startTestRun(self) -> None:
+        self.peaks = {}
+        self.sites = {}
+        self.over_memory_budget = []
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        super().startTestRun()
+
+    def stopTestRun(self) -> None:
+        super().stopTestRun()
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    def startTest(self, test: unittest.TestCase) -> None:
+        super().startTest(test)
+        self._snapshot = None
+        if self.memory_top > 0:
+            self._snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        self._memory_start = tracemalloc.get_traced_memory()[0]
+
+    def measure_memory(self, test: unittest.TestCase) -> int:
+        """Saves the peak and the allocation sites of `test` once."""
+        if test.id() in self.peaks:
+            return self.peaks[test.id()]
+        peak = tracemalloc.get_traced_memory()[1] - self._memory_start
+        self.peaks[test.id()] = peak
+        if self._snapshot is not None:
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                       tracemalloc.Filter(False, __file__)]
+            stats = tracemalloc.take_snapshot().filter_traces(filters)
+            stats = stats.compare_to(self._snapshot.filter_traces(filters),
+                                     'lineno')
+            self.sites[test.id()] = [
+                f"{s.traceback[0].filename}:{s.traceback[0].lineno} "
+                f"{s.size_diff / 1024:+.1f} KiB"
+                for s in stats[:self.memory_top] if s.size_diff > 0
+            ]
+            self._snapshot = None
+        return peak
+
+    def addSuccess(self, test: unittest.TestCase) -> None:
+        # decided before the success is recorded, so that a test over the
+        # budget only counts as a failure
+        peak = self.measure_memory(test)
+        if (self.memory_budget is not None
+                and peak > self.memory_budget * 1024 ** 2):
+            self.over_memory_budget.append(test.id())
+            try:
+                raise AssertionError(
+                    f"Peak allocation of {peak / 1024 ** 2:.1f} MB exceeds "
+                    f"the memory budget of {self.memory_budget} MB.")
+            except AssertionError:
+                self.addFailure(test, sys.exc_info())
+            return
+        super().addSuccess(test)
+
+    def stopTest(self, test: unittest.TestCase) -> None:
+        self.measure_memory(test)
+        super().stopTest(test)
+
+    def report_memory(self, n: int = 10) -> List[str]:
+        """Prints the tests with the largest peaks and their allocation sites.
+
+        Returns:
+            List[str]: The ids of the tests exceeding the budget.
+
+        """
+        print("\nLargest peak allocations:")
+        for test_id, peak in sorted(self.peaks.items(),
+                                    key=lambda x: -x[1])[:n]:
+            print(f"{peak / 1024 ** 2:10.2f} MB  {test_id}")
+            for site in self.sites.get(test_id, []):
+                print(f"{'':14}{site}")
+        for test_id in self.over_memory_budget:
+            print(f"Test {test_id} exceeds the memory budget of "
+                  f"{self.memory_budget} MB.")
+        return self.over_memory_budget
+
+
+class TimedResult(TimedResultMixin, unittest.TestResult):
+    pass
+
+
+class TimedTextResult(TimedResultMixin, unittest.TextTestResult):
+    pass
+
+
+def load_durations() -> Dict[str, List[float]]:
+    return _cache.load_json(DURATIONS, {})
+
+
+def record_durations(durations: Dict[str, float]) -> Dict[str, List[float]]:
+    """Adds the durations of a run to the history and returns the history.
+
+    The last `N_DURATIONS` durations of every test are kept. If the
+    `RUN_DURATIONS_ENV` environment variable is set, the durations of this
+    run are written to the file it names, so that the process, that started
+    this run, can report them.
+
+    """
+    history = load_durations()
+    for test_id, duration in durations.items():
+        runs = history.get(test_id, []) + [duration]
+        history[test_id] = runs[-N_DURATIONS:]
+    _cache.dump_json(DURATIONS, history)
+    run_file = os.environ.get(RUN_DURATIONS_ENV)
+    if run_file:
+        with open(run_file, 'w') as f:
+            json.dump(durations, f)
+    return history
+
+
+def expected_durations(test_ids: Sequence[str],
+                       history: Dict[str, List[float]]) -> Dict[str, float]:
+    """The median of the recorded durations of every test.
+
+    Tests without history get the median of all other tests.
+
+    """
+    known = {i: statistics.median(history[i]) for i in test_ids
+             if history.get(i)}
+    default = statistics.median(known.values()) if known else 0.0
+    return {i: known.get(i, default) for i in test_ids}
+
+
+def schedule(test_ids: Sequence[str], n_workers: int,
+             history: Dict[str, List[float]]) -> List[List[str]]:
+    """Distributes the test classes to workers, longest classes first.
+
+    The tests of a class are a unit, weighted by their summed expected
+    durations, so that `setUpClass` runs once per class. Every class is
+    given to the worker with the smallest total expected duration so far.
+    The tests of a worker keep the order of `test_ids`, so classes and
+    modules stay contiguous.
+
+    """
+    expected = expected_durations(test_ids, history)
+    units = {}
+    for test_id in test_ids:
+        units.setdefault(test_id.rsplit('.', 1)[0], []).append(test_id)
+    weights = {k: sum(expected[i] for i in v) for k, v in units.items()}
+    heap = [(0.0, i) for i in range(n_workers)]
+    assigned = [set() for _ in range(n_workers)]
+    for unit in sorted(units, key=lambda k: -weights[k]):
+        total, worker = heapq.heappop(heap)
+        assigned[worker].update(units[unit])
+        heapq.heappush(heap, (total + weights[unit], worker))
+    return [[i for i in test_ids if i in ids] for ids in assigned]
+
+
+def report_durations(durations: Dict[str, float], slowest: int = 0,
+                     budget: Optional[Union[int, float]] = None) -> List[str]:
+    """Prints the slowest tests and the tests exceeding the time budget.
+
+    Returns:
+        List[str]: The ids of the tests exceeding the budget.
+
+    """
+    if slowest > 0 and durations:
+        print(f"\nSlowest {min(slowest, len(durations))} tests:")
+        for test_id, duration in sorted(durations.items(),
+                                        key=lambda x: -x[1])[:slowest]:
+            print(f"{duration:8.3f}s  {test_id}")
+    over_budget = []
+    if budget is not None:
+        over_budget = [i for i, d in durations.items() if d > budget]
+        for test_id in over_budget:
+            print(f"Test {test_id} took {durations[test_id]:.3f}s, which "
+                  f"exceeds the time budget of {budget}s.")
+    return over_budget
+
+
+class QueueResult(TimedResult):
+    """Sends the outcome of every test to a multiprocessing queue.
+
+    Every message is a tuple ('test', test_id, outcome, traceback, duration),
+    where outcome is one of 'success', 'failure', 'error', 'skip',
+    'expected_failure' or 'unexpected_success'.
+
+    """
+    def __init__(self, queue_: multiprocessing.Queue) -> None:
+        super().__init__()
+        self.queue = queue_
+        self._test_start = time.perf_counter()
+
+    def send(self, test: unittest.TestCase, outcome: str,
+             traceback: str = '') -> None:
+        duration = time.perf_counter() - self._test_start
+        self.queue.put(('test', test.id(), outcome, traceback, duration))
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self.send(test, 'success')
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self.send(test, 'failure', self.failures[-1][1])
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self.send(test, 'error', self.errors[-1][1])
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self.send(test, 'skip', reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self.send(test, 'expected_failure')
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self.send(test, 'unexpected_success')
+
+    def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
+        if err is not None:
+            if issubclass(err[0], test.failureException):
+                self.send(subtest, 'failure', self.failures[-1][1])
+            else:
+                self.send(subtest, 'error', self.errors[-1][1])
+
+
+def run_shard(test_ids: List[str], top_level_dir: str,
+              queue_: multiprocessing.Queue) -> None:
+    """Target of the worker processes of `run_sharded`."""
+    if top_level_dir not in sys.path:
+        sys.path.insert(0, top_level_dir)
+    try:
+        suite = unittest.TestLoader().loadTestsFromNames(test_ids)
+        suite.run(QueueResult(queue_))
+    finally:
+        queue_.put(('done', os.getpid()))
+
+
+SYMBOLS = {'success': '.', 'failure': 'F', 'error': 'E', 'skip': 's',
+           'expected_failure': 'x', 'unexpected_success': 'u'}
+
+
+def get_context(start_method: str = 'spawn', preload: Sequence[str] = ()
+                ) -> multiprocessing.context.BaseContext:
+    """Returns a multiprocessing context for the test workers.
+
+    With the 'forkserver' start method, the modules in `preload` are imported
+    once by the fork server and every worker is forked from it with warm
+    imports. The start method falls back to 'spawn', if it is not available
+    on this platform.
+
+    """
+    if start_method not in multiprocessing.get_all_start_methods():
+        start_method = 'spawn'
+    ctx = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        ctx.set_forkserver_preload([__name__, *preload])
+    return ctx
+
+
+def stop_forkserver() -> bool:
+    """Stops the fork server, so that the next worker starts a fresh one.
+
+    multiprocessing has no public API for this, so the private `_stop` of
+    the server is used, if it exists.
+
+    Returns:
+        bool: Whether the fork server was stopped.
+
+    """
+    from multiprocessing import forkserver
+    stop = getattr(getattr(forkserver, '_forkserver', None), '_stop', None)
+    if stop is None:
+        return False
+    stop()
+    return True
+
+
+def run_sharded(test_ids: List[str], n_workers: int, top_level_dir: str,
+                verbosity: int = 1, start_method: str = 'spawn',
+                preload: Sequence[str] = ()
+                ) -> Tuple[bool, Dict[str, float]]:
+    """Runs tests in worker processes and merges their results.
+
+    Whole test classes are distributed longest-first using the recorded
+    durations.
+    The results are streamed back to this process, printed as they arrive
+    and summarized like `unittest.TextTestRunner` does.
+
+    Args:
+        test_ids (List[str]): The ids of the tests to run.
+        n_workers (int): The number of worker processes.
+        top_level_dir (str): Added to the `sys.path` of the workers.
+        verbosity (int): Like the verbosity of `unittest.TextTestRunner`.
+            Defaults to 1.
+        start_method (str): The multiprocessing start method of the workers.
+            Defaults to 'spawn'.
+        preload (Sequence[str]): Modules imported once by the fork server.
+            Only used with the 'forkserver' start method. Defaults to ().
+
+    Returns:
+        Tuple[bool, Dict[str, float]]: Whether all tests were successful and
+            the duration of every test.
+
+    """
+    shards = [s for s in schedule(test_ids, n_workers, load_durations()) if s]
+    ctx = get_context(start_method, preload)
+    queue_ = ctx.Queue()
+    start = time.perf_counter()
+    procs = [ctx.Process(target=run_shard, args=(shard, top_level_dir, queue_))
+             for shard in shards]
+    for proc in procs:
+        proc.start()
+
+    outcomes = {k: 0 for k in SYMBOLS}
+    problems = []
+    durations = {}
+    done = set()
+    while len(done) < len(procs):
+        try:
+            message = queue_.get(timeout=0.1)
+        except queue.Empty:
+            for proc in procs:
+                if proc.pid not in done and proc.exitcode not in (None, 0):
+                    done.add(proc.pid)
+                    outcomes['error'] += 1
+                    problems.append(('ERROR', f'worker {proc.pid}',
+                                     f'The worker exited with code '
+                                     f'{proc.exitcode}.\n'))
+            continue
+        if message[0] == 'done':
+            done.add(message[1])
+            continue
+        _, test_id, outcome, traceback, duration = message
+        durations[test_id] = duration
+        outcomes[outcome] += 1
+        if outcome in ('failure', 'error'):
+            kind = 'FAIL' if outcome == 'failure' else 'ERROR'
+            problems.append((kind, test_id, traceback))
+        if verbosity > 1:
+            print(f"{test_id} ... {outcome.replace('_', ' ')}", flush=True)
+        elif verbosity > 0:
+            print(SYMBOLS[outcome], end='', flush=True)
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - start
+
+    if verbosity > 0:
+        print()
+    for kind, test_id, traceback in problems:
+        print('=' * 70)
+        print(f'{kind}: {test_id}')
+        print('-' * 70)
+        print(traceback)
+    n_tests = sum(outcomes.values())
+    print('-' * 70)
+    workers = f"{len(procs)} worker{'s' if len(procs) != 1 else ''}"
+    print(f"Ran {n_tests} tests in {elapsed:.3f}s using {workers}")
+    successful = not (outcomes['failure'] or outcomes['error']
+                      or outcomes['unexpected_success'])
+    infos = [f'{name}={outcomes[key]}' for key, name in
+             [('failure', 'failures'), ('error', 'errors'),
+              ('skip', 'skipped'), ('expected_failure', 'expected failures'),
+              ('unexpected_success', 'unexpected successes')]
+             if outcomes[key]]
+    info = f" ({', '.join(infos)})" if infos else ''
+    print(f"\n{'OK' if successful else 'FAILED'}{info}")
+    return successful, durations
+
+
+def iter_ids(suite: unittest.TestSuite) -> Iterator[str]:
+    """Yields the test ids of a nested suite without loading `LazySuite`s."""
+    for test in suite:
+        if isinstance(test, LazySuite) and not test.loaded:
+            yield from test.ids
+        elif isinstance(test, unittest.TestSuite):
+            yield from iter_ids(test)
+        else:
+            yield test.id()
+
+
+def iter_tests(suite: unittest.TestSuite) -> Iterator[unittest.TestCase]:
+    """Yields the test cases of a nested suite."""
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iter_tests(test)
+        else:
+            yield test
+
+
+def find_test_files(start_dir: str, pattern: str = 'test*.py'
+                    ) -> Optional[List[str]]:
+    """Finds the files, that `unittest.TestLoader.discover` would import.
+
+    Returns:
+        Optional[List[str]]: The test files or None, if a package uses the
+            `load_tests` protocol, which can only be resolved by importing.
+
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(start_dir):
+        init = os.path.join(dirpath, '__init__.py')
+        if os.path.isfile(init):
+            with open(init, errors='replace') as f:
+                if 'load_tests' in f.read():
+                    return None
+        dirnames[:] = sorted(
+            d for d in dirnames
+            if os.path.isfile(os.path.join(dirpath, d, '__init__.py'))
+        )
+        for filename in sorted(filenames):
+            if (VALID_MODULE_NAME.match(filename)
+                    and fnmatch.fnmatch(filename, pattern)):
+                files.append(os.path.join(dirpath, filename))
+    return files
+
+
+def module_name(file: str, top_level_dir: str) -> str:
+    rel = os.path.relpath(os.path.splitext(file)[0], top_level_dir)
+    return rel.replace(os.sep, '.')
+
+
+def load_module(loader: unittest.TestLoader, name: str
+                ) -> Tuple[List[unittest.TestCase], Optional[Dict]]:
+    """Imports a test module and returns its tests and an index entry.
+
+    The entry is None, if the module could not be imported.
+
+    """
+    try:
+        importlib.import_module(name)
+    except unittest.SkipTest as e:
+        suite = unittest.loader._make_skipped_test(name, e, loader.suiteClass)
+        return list(iter_tests(suite)), None
+    except Exception:
+        # reported as a failing test, like `unittest.TestLoader.discover`
+        suite, message = unittest.loader._make_failed_import_test(
+            name, loader.suiteClass)
+        loader.errors.append(message)
+        return list(iter_tests(suite)), None
+    n_errors = len(loader.errors)
+    tests = list(iter_tests(loader.loadTestsFromName(name)))
+    if len(loader.errors) > n_errors:
+        return tests, None
+    module = sys.modules[name]
+    markers = {t.id(): test_markers(t) for t in tests}
+    return tests, {'ids': [t.id() for t in tests],
+                   'markers': {k: v for k, v in markers.items() if v},
+                   'lazy': not hasattr(module, 'load_tests')}
+
+
+################################################################################
+# Main
+################################################################################
+
+
+def discover(loader: unittest.TestLoader, start_dir: str,
+             top_level_dir: Optional[str] = None, pattern: str = 'test*.py',
+             select: Optional[TestSelector] = None,
+             use_index: bool = True) -> unittest.TestSuite:
+    """Discovers tests like `unittest.TestLoader.discover` using an index.
+
+    The ids of the tests in every test file are saved together with the
+    file's mtime, size and hash and a hash of the project files it imports.
+    Only new or changed test files and test files importing changed files are
+    imported during discovery. The tests of all other files are returned as
+    `LazySuite` instances, which import their module when the tests run.
+
+    Args:
+        loader (unittest.TestLoader): The loader. Its `suiteClass` is used for
+            the returned suite.
+        start_dir (str): The directory to start the discovery in.
+        top_level_dir (Optional[str]): The top level directory of the project.
+            Defaults to `start_dir`.
+        pattern (str): The pattern of test files. Defaults to 'test*.py'.
+        select (Optional[TestSelector]): If provided, only the selected tests
+            are returned. Test modules, that are excluded as a whole, are
+            not imported.
+        use_index (bool): Whether to read and write the index. If False, all
+            test files are imported. Defaults to True.
+
+    Returns:
+        unittest.TestSuite: The discovered tests.
+
+    """
+    start_dir = os.path.abspath(start_dir)
+    top_level_dir = os.path.abspath(top_level_dir or start_dir)
+    files = find_test_files(start_dir, pattern)
+    if files is None:
+        suite = loader.discover(start_dir, pattern, top_level_dir)
+        if select is None:
+            return suite
+        return loader.suiteClass([t for t in iter_tests(suite)
+                                  if select(t.id(), test_markers(t))])
+    if top_level_dir not in sys.path:
+        sys.path.insert(0, top_level_dir)
+    if select is None:
+        select = TestSelector()
+
+    index = _cache.load_json(INDEX, {}) if use_index else {}
+    entries = index.get('files', {})
+    old_signatures = {f: e['signature'] for f, e in entries.items()}
+    signatures = _cache.manifest(files, old_signatures)
+    # the ids also depend on the imported modules, e.g. of base classes
+    deps = _imports.dependency_keys(files, start_dir) if use_index else {}
+
+    suites = []
+    new_entries = {}
+    for file in files:
+        name = module_name(file, top_level_dir)
+        entry = entries.get(file)
+        if (entry is not None and file in signatures
+                and entry['module'] == name
+                and entry['signature'][2] == signatures[file][2]
+                and deps.get(file) is not None
+                and entry.get('deps') == deps[file]):
+            new_entries[file] = dict(entry, signature=signatures[file])
+            markers = entry.get('markers', {})
+            ids = [i for i in entry['ids'] if select(i, markers.get(i, ()))]
+            if not ids:
+                continue
+            if entry['lazy']:
+                suites.append(LazySuite(ids, loader))
+            else:
+                tests = loader.loadTestsFromNames(ids)
+                suites.append(loader.suiteClass(tests))
+            continue
+        if select.excludes_module(name):
+            continue
+        tests, entry = load_module(loader, name)
+        if entry is None:
+            # the failed import is reported, whatever the selection
+            suites.append(loader.suiteClass(tests))
+            continue
+        if file in signatures:
+            new_entries[file] = dict(entry, module=name,
+                                     signature=signatures[file],
+                                     deps=deps.get(file))
+        suites.append(loader.suiteClass(
+            [t for t in tests if select(t.id(), test_markers(t))]))
+
+    if use_index and new_entries != entries:
+        _cache.dump_json(INDEX, {'files': new_entries})
+    return loader.suiteClass(suites)
@@ -7,19 +7,18 @@
 
 from __future__ import annotations
 import argparse
-import io
 import textwrap
 from pathlib import Path
 import sys
 import re
-import subprocess
-import requests
+import threading
 import json
-from unittest import mock
-import setuptools
-from git import Repo
 import ast
-from packaging import version
+import itertools
+if __name__ == '__main__':
+    # run as a script, e.g. `python pre_commit_hooks/assert_version_advance.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from pre_commit_hooks import _config, _git
 
 
 ################################################################################
@@ -27,7 +26,12 @@ from packaging import version
 ################################################################################
 
 
-from typing import Optional, Sequence
+from typing import (Optional, Sequence, Iterable, List, Dict, Set, Union, Tuple,
+                    TYPE_CHECKING)
+if TYPE_CHECKING:
+    # imported where they are used to keep the startup of the hook fast
+    from git import Repo
+    from packaging import version
 
 
 ################################################################################
@@ -49,17 +53,22 @@ class MyParser(argparse.ArgumentParser):
 
 # prepare semver regex
 R = re.compile(
-    "^(?P<major>0|[1-9]\d*)\.(?P<minor>0|[1-9]\d*)\.(?P<patch>0|[1-9]\d*)(?:-(?P<prerelease>(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+(?P<buildmetadata>[0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?$"
+    r"^(?P<major>0|[1-9]\d*)\.(?P<minor>0|[1-9]\d*)\.(?P<patch>0|[1-9]\d*)(?:-(?P<prerelease>(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+(?P<buildmetadata>[0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?$"
 )
 
 
 class VersionVisitor(ast.NodeVisitor):
-    def visit(self, node: AST) -> Any:
+    def visit(self, node: ast.AST) -> List[str]:
         self.versions = []
         super().visit(node)
         return self.versions
 
-    def visit_Assign(self, node: Assign) -> Any:
+    def generic_visit(self, node: ast.AST) -> None:
+        # don't reset `self.versions` for child nodes
+        for child in ast.iter_child_nodes(node):
+            super().visit(child)
+
+    def visit_Assign(self, node: ast.Assign) -> None:
         if isinstance(node.value, ast.Constant):
             try:
                 targets = [t.id for t in node.targets]
@@ -73,61 +82,624 @@ class VersionVisitor(ast.NodeVisitor):
 version_visitor = VersionVisitor()
 
 
-################################################################################
-# Main
-################################################################################
+# cheap check, whether a blob can contain a version assignment at all
+VERSION_ASSIGNMENT = re.compile(rb"\b(?:__version__|version)\s*=")
 
 
-def assert_version_advance(
-    filenames: Sequence[str],
-    branch: str = "main",
-    remote: str = "origin",
-    version_file: Optional[str] = None,
-) -> int:
-    cwd = Path(".").resolve()
-    repo = Repo(cwd)
-    branch = getattr(repo.branches, branch)
+# the number of blobs parsed per task of the process pool
+PARSE_CHUNK = 256
+# the maximal number of commits, whose blobs are read together while
+# searching the history newest-first
+SCAN_CHUNK = 256
 
-    # get the current version in setup.py
-    with mock.patch.object(setuptools, "setup") as mock_setup:
-        import setup
-    _ = mock_setup.call_args
-    if _ is None:
-        raise Exception("Could not determine the local version.")
-    else:
-        args, kwargs = _
-    local_version = kwargs.get("version")
-
-    # get a list of commits in branch
-    local_commits = []
-    for commit in repo.iter_commits(rev=branch):
-        local_commits.append(commit)
-
-    # get all tags sorted by commits and filter using the commits list
-    tagmap = {}
-    for tag in repo.tags:
-        tagmap.setdefault(repo.commit(tag), []).append(tag)
-    tagmap = {k: v for k, v in tagmap.items() if k in local_commits}
-
-    # get all versions matching semver
-    local_tags_semvers = []
-    for commit, tags in tagmap.items():
-        for tag in tags:
-            if R.match(str(tag)):
-                local_tags_semvers.append(str(tag))
 
-    # get remote tags and remote setup.py versions
-    # if setup.py has weird constructs for version try to resolve them
+# the number of shas in one query of the index, below SQLite's limit of
+# 999 parameters
+QUERY_CHUNK = 500
+
+
+# the versions found in scanned commits, trees and blobs, keyed by their sha
+VERSIONS_BY_SHA: Dict[str, List[str]] = {}
+
+
+# a version assignment in files, that aren't python
+VERSION_TEXT = re.compile(r"""(?:__version__|version)\s*[=:]\s*['"]([^'"]+)['"]""")
+
+
+# the index of scanned objects, relative to the .git directory
+INDEX_FILE = "pre_commit_hooks/version_index.sqlite"
+
+
+# the cached responses of the GitHub API, relative to the .git directory
+ETAG_FILE = "pre_commit_hooks/github_etags.json"
+
+
+GITHUB_API = "https://api.github.com"
+
+
+# owner and name of a repository in ssh and https urls
+GITHUB_REPO = re.compile(r"[:/]([^/:]+)/([^/]+?)(?:\.git)?/?$")
+
+
+def blob_versions(data: bytes) -> List[str]:
+    """Returns the semver versions assigned to `__version__` or `version`."""
+    if VERSION_ASSIGNMENT.search(data) is None:
+        return []
+    try:
+        nodes = ast.parse(data)
+    except (SyntaxError, ValueError):
+        return []
+    return version_visitor.visit(nodes)
+
+
+def parse_blobs(blobs: List[Tuple[str, bytes]]) -> List[Tuple[str, List[str]]]:
+    """Returns the versions of `(sha, data)` pairs. Runs in the process pool."""
+    return [(sha, blob_versions(data)) for sha, data in blobs]
+
+
+def read_blob_versions(shas: Sequence[str], cwd: str,
+                       memo: Dict[str, List[str]],
+                       n_workers: Optional[int] = None) -> None:
+    """Reads blobs and adds their versions to `memo`.
+
+    The contents of all blobs are streamed from a single
+    `git cat-file --batch`. Blobs passing the byte filter are collected in
+    chunks of `PARSE_CHUNK`. Full chunks are parsed in a process pool, which
+    is only started, if there are enough blobs to fill a chunk. The rest is
+    parsed in this process.
+
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    executor = None
+    futures = []
+    chunk = []
+    try:
+        for sha, data in _git.cat_blobs(shas, cwd=cwd):
+            if VERSION_ASSIGNMENT.search(data) is None:
+                memo[sha] = []
+                continue
+            chunk.append((sha, data))
+            if len(chunk) >= PARSE_CHUNK:
+                if executor is None:
+                    executor = ProcessPoolExecutor(
+                        n_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                futures.append(executor.submit(parse_blobs, chunk))
+                chunk = []
+        memo.update(parse_blobs(chunk))
+        for future in as_completed(futures):
+            memo.update(future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def collect_blobs(tree, memo: Dict[str, List[str]], blobs: Dict[str, None],
+                  seen: Set[str], suffix: str = ".py") -> None:
+    """Adds the shas of blobs in `tree`, that aren't in `memo`, to `blobs`."""
+    if tree.hexsha in memo or tree.hexsha in seen:
+        return
+    seen.add(tree.hexsha)
+    for blob in tree.blobs:
+        if blob.path.endswith(suffix) and blob.hexsha not in memo:
+            blobs[blob.hexsha] = None
+    for subtree in tree.trees:
+        collect_blobs(subtree, memo, blobs, seen, suffix=suffix)
+
+
+def tree_versions(tree, memo: Dict[str, List[str]], suffix: str = ".py"
+                  ) -> List[str]:
+    """Returns the versions defined in the .py files of a git tree.
+
+    The versions of every tree and blob are memoized in `memo`, so that
+    subtrees and files shared by several commits are only read once.
+
+    """
+    if tree.hexsha in memo:
+        return memo[tree.hexsha]
+    versions = set()
+    for blob in tree.blobs:
+        if not blob.path.endswith(suffix):
+            continue
+        if blob.hexsha not in memo:
+            memo[blob.hexsha] = blob_versions(blob.data_stream.read())
+        versions.update(memo[blob.hexsha])
+    for subtree in tree.trees:
+        versions.update(tree_versions(subtree, memo, suffix=suffix))
+    memo[tree.hexsha] = sorted(versions)
+    return memo[tree.hexsha]
+
+
+def scan_versions(commits: Iterable,
+                  memo: Optional[Dict[str, List[str]]] = None) -> List[str]:
+    """Returns the versions defined in the .py files of all `commits`.
+
+    Commits found in `memo` are not read at all. Defaults to
+    `VERSIONS_BY_SHA`, pass the result of `load_index` to reuse the
+    results of earlier runs.
+
+    """
+    memo = VERSIONS_BY_SHA if memo is None else memo
+    commits = list(commits)
+
+    # read all new blobs in bulk first
+    blobs = {}
+    seen = set()
+    for commit in commits:
+        if commit.hexsha not in memo:
+            collect_blobs(commit.tree, memo, blobs, seen)
+    if blobs:
+        read_blob_versions(list(blobs), commits[0].repo.git_dir, memo)
+
+    versions = set()
+    for commit in commits:
+        if commit.hexsha not in memo:
+            memo[commit.hexsha] = tree_versions(commit.tree, memo)
+        versions.update(memo[commit.hexsha])
+    return sorted(versions)
+
+
+def find_higher_version(commits: Iterable, bound: version.Version,
+                        memo: Dict[str, List[str]],
+                        tagged: Iterable[str] = (),
+                        full_scan: bool = False) -> Optional[version.Version]:
+    """Searches commits newest-first for a version higher than `bound`.
+
+    The search stops at the first commit defining a higher version and at
+    the first commit with a semver tag. The tags are known not to be higher
+    than `bound` and versions only advance, so older commits can't define
+    a higher version.
+
+    Args:
+        commits (Iterable): The commits, newest first.
+        bound (version.Version): The version to compare against.
+        memo (Dict[str, List[str]]): Passed to `scan_versions`.
+        tagged (Iterable[str]): The shas of commits with semver tags.
+        full_scan (bool): Scan all commits and return the highest version
+            higher than `bound`. Defaults to False.
+
+    Returns:
+        Optional[version.Version]: The higher version or None.
+
+    """
+    from packaging import version
+    tagged = set(tagged)
+    highest = None
+    commits = iter(commits)
+    # the commits are read in batches, which double in size up to
+    # SCAN_CHUNK, so that a usual push reads one commit and a long search
+    # starts few `git cat-file` processes
+    size = None if full_scan else 1
+    while True:
+        batch = list(itertools.islice(commits, size))
+        if not batch:
+            return highest
+        scan_versions(batch, memo)
+        for commit in batch:
+            versions = [v for v in map(version.parse, memo[commit.hexsha])
+                        if v > bound]
+            if versions:
+                highest = max(versions if highest is None
+                              else [highest, *versions])
+            if not full_scan and (highest is not None
+                                  or commit.hexsha in tagged):
+                return highest
+        if size is not None:
+            size = min(2 * size, SCAN_CHUNK)
+
+
+class VersionIndex(dict):
+    """The versions of scanned commits, trees and blobs stored in SQLite.
+
+    Only the rows of the shas a run looks at are read: `load_index` queries
+    the commits to check up front, trees and blobs are queried on their
+    first lookup.
+
+    """
+    def __init__(self, conn=None) -> None:
+        super().__init__()
+        self.conn = conn
+        # shas read from or known to be missing in the database
+        self.stored: Set[str] = set()
+        self.absent: Set[str] = set()
+
+    def query(self, shas: Iterable[str]) -> None:
+        """Reads the rows of `shas`, that haven't been looked up yet."""
+        import sqlite3
+        shas = [sha for sha in dict.fromkeys(shas)
+                if not dict.__contains__(self, sha) and sha not in self.absent]
+        if self.conn is None:
+            self.absent.update(shas)
+            return
+        for i in range(0, len(shas), QUERY_CHUNK):
+            chunk = shas[i:i + QUERY_CHUNK]
+            try:
+                rows = self.conn.execute(
+                    "SELECT sha, versions FROM objects WHERE sha IN "
+                    f"({', '.join('?' * len(chunk))})", chunk,
+                ).fetchall()
+            except sqlite3.DatabaseError:
+                rows = []
+            for sha, versions in rows:
+                dict.__setitem__(self, sha, json.loads(versions))
+                self.stored.add(sha)
+            self.absent.update(sha for sha in chunk
+                               if not dict.__contains__(self, sha))
+
+    def __contains__(self, sha: object) -> bool:
+        if not dict.__contains__(self, sha) and isinstance(sha, str):
+            self.query([sha])
+        return dict.__contains__(self, sha)
+
+    def __missing__(self, sha: str) -> List[str]:
+        if sha in self:
+            return dict.__getitem__(self, sha)
+        raise KeyError(sha)
+
+    def new_entries(self) -> Dict[str, List[str]]:
+        """Returns the entries, that aren't in the database yet."""
+        return {k: v for k, v in self.items() if k not in self.stored}
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def load_index(path: Union[str, Path], shas: Iterable[str] = ()
+               ) -> VersionIndex:
+    """Opens the index and reads the versions of `shas`.
+
+    Args:
+        path (Union[str, Path]): The SQLite file. A missing file is an
+            empty index.
+        shas (Iterable[str]): The shas of the commits to check, read in
+            chunks of `QUERY_CHUNK`. Other shas are read on their first
+            lookup.
+
+    Returns:
+        VersionIndex: The index. Close it after use.
+
+    """
+    import sqlite3
+    path = Path(path)
+    index = VersionIndex(sqlite3.connect(path) if path.is_file() else None)
+    index.query(shas)
+    return index
+
+
+def save_index(path: Union[str, Path], entries: Dict[str, List[str]]) -> None:
+    """Adds the versions of newly scanned commits, trees and blobs."""
+    import sqlite3
+    if not entries:
+        return
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS objects "
+                         "(sha TEXT PRIMARY KEY, versions TEXT NOT NULL)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO objects VALUES (?, ?)",
+                [(k, json.dumps(v)) for k, v in entries.items()],
+            )
+    finally:
+        conn.close()
+
+
+def python_file_version(path: Union[str, Path],
+                        name: Optional[str] = None) -> Optional[str]:
+    """Returns the first semver assigned to `__version__` or `version`.
+
+    If `name` is given, only assignments to `name` are considered.
+
+    """
+    path = Path(path)
+    if not path.is_file():
+        return None
+    try:
+        nodes = ast.parse(path.read_bytes())
+    except (SyntaxError, ValueError):
+        return None
+    if name is None:
+        versions = version_visitor.visit(nodes)
+        return versions[0] if versions else None
+    for node in ast.walk(nodes):
+        if (isinstance(node, ast.Assign)
+                and any(getattr(t, "id", None) == name for t in node.targets)
+                and isinstance(node.value, ast.Constant)
+                and isinstance(node.value.value, str)
+                and R.match(node.value.value)):
+            return node.value.value
+    return None
+
+
+def module_file(root: Path, module: str) -> Optional[Path]:
+    """Finds the file of `module` in `root` or `root/src`."""
+    parts = module.split(".")
+    for base in (root, root / "src"):
+        for file in (base.joinpath(*parts).with_suffix(".py"),
+                     base.joinpath(*parts, "__init__.py")):
+            if file.is_file():
+                return file
+    return None
+
+
+def dynamic_version(root: Path, spec: Union[str, Dict]) -> Optional[str]:
+    """Resolves setuptools' `attr:` and `file:` version directives."""
+    if isinstance(spec, dict):
+        if "attr" in spec:
+            spec = f"attr: {spec['attr']}"
+        elif "file" in spec:
+            files = spec["file"]
+            spec = f"file: {files if isinstance(files, str) else files[0]}"
+        else:
+            return None
+    kind, _, value = spec.partition(":")
+    value = value.strip()
+    if kind.strip() == "attr":
+        module, _, name = value.rpartition(".")
+        file = module_file(root, module)
+        return None if file is None else python_file_version(file, name)
+    if kind.strip() == "file":
+        return text_file_version(root / value.split(",")[0].strip())
+    return None
+
+
+def text_file_version(path: Union[str, Path]) -> Optional[str]:
+    """Reads a version from a .py, .toml or .cfg file or a plain text file."""
+    path = Path(path)
+    if not path.is_file():
+        return None
+    if path.suffix == ".py":
+        return python_file_version(path)
+    if path.name == "pyproject.toml":
+        return pyproject_version(path)
+    if path.name == "setup.cfg":
+        return setup_cfg_version(path)
+    text = path.read_text().strip()
+    if R.match(text):
+        return text
+    match = VERSION_TEXT.search(text)
+    return match.group(1) if match and R.match(match.group(1)) else None
+
+
+def pyproject_version(path: Path) -> Optional[str]:
+    """Reads the version from the [project] or [tool.poetry] table."""
+    try:
+        data = _config.read_toml(path)
+    except (OSError, ValueError):
+        return None
+    project = data.get("project", {})
+    if "version" in project:
+        return project["version"]
+    if "version" in project.get("dynamic", []):
+        spec = (data.get("tool", {}).get("setuptools", {})
+                .get("dynamic", {}).get("version"))
+        if spec is not None:
+            return dynamic_version(path.parent, spec)
+    return data.get("tool", {}).get("poetry", {}).get("version")
+
+
+def setup_cfg_version(path: Path) -> Optional[str]:
+    """Reads the version from the [metadata] section."""
+    import configparser
+    parser = configparser.ConfigParser()
+    try:
+        parser.read(path)
+    except configparser.Error:
+        return None
+    spec = parser.get("metadata", "version", fallback=None)
+    if spec is None:
+        return None
+    if spec.startswith(("attr:", "file:")):
+        return dynamic_version(path.parent, spec)
+    return spec.strip()
+
+
+def setup_py_version(path: Path) -> Optional[str]:
+    """Reads the version passed to `setup()` in a setup.py.
+
+    The `version` argument of `setup()` can be a string or a name. Versions
+    are also read from files, that setup.py passes to `exec()` (like
+    `exec(Path('pkg/_version.py').read_text())`) and from modules, that it
+    imports `__version__` from.
+
+    """
+    try:
+        nodes = ast.parse(path.read_bytes())
+    except (OSError, SyntaxError, ValueError):
+        return None
+    root = path.parent
+    for node in ast.walk(nodes):
+        if (isinstance(node, ast.Call)
+                and getattr(node.func, "id", getattr(node.func, "attr", None))
+                == "setup"):
+            for keyword in node.keywords:
+                if (keyword.arg == "version"
+                        and isinstance(keyword.value, ast.Constant)):
+                    return keyword.value.value
+    versions = version_visitor.visit(nodes)
+    if versions:
+        return versions[0]
+    for node in ast.walk(nodes):
+        if (isinstance(node, ast.Call)
+                and getattr(node.func, "id", None) == "exec"):
+            for arg in ast.walk(node):
+                if (isinstance(arg, ast.Constant) and isinstance(arg.value, str)
+                        and (root / arg.value).is_file()):
+                    found = python_file_version(root / arg.value)
+                    if found is not None:
+                        return found
+        elif (isinstance(node, ast.ImportFrom) and node.module
+                and any(a.name == "__version__" for a in node.names)):
+            file = module_file(root, node.module)
+            if file is not None:
+                found = python_file_version(file, "__version__")
+                if found is not None:
+                    return found
+    return None
+
+
+def read_local_version(root: Union[str, Path],
+                       version_file: Optional[str] = None) -> Optional[str]:
+    """Reads the version of the project in `root` without executing code.
+
+    The version is read from `version_file`, if given. Otherwise
+    pyproject.toml, setup.cfg and setup.py are tried in this order.
+
+    """
+    root = Path(root)
+    if version_file is not None:
+        return text_file_version(root / version_file)
+    for name, reader in [("pyproject.toml", pyproject_version),
+                         ("setup.cfg", setup_cfg_version),
+                         ("setup.py", setup_py_version)]:
+        if (root / name).is_file():
+            found = reader(root / name)
+            if found is not None:
+                return found
+    return None
+
+
+class GitHubAPI:
+    """A pooled session for the GitHub REST API with an on-disk ETag cache.
+
+    Every response with an ETag is cached together with its data. Later
+    requests of the same url send `If-None-Match` and unchanged listings are
+    answered with a 304, which doesn't count against the rate limit.
+
+    Args:
+        api_url (str): The url of the repository, e.g.
+            'https://api.github.com/repos/owner/name/'.
+        auth (str): An OAuth token. Defaults to '', meaning no authorization.
+        cache_file (Optional[Union[str, Path]]): Where to store the ETags.
+            Defaults to None, in which case nothing is stored on disk.
+        max_workers (int): The maximum number of concurrent requests and
+            pooled connections. Defaults to 8.
+
+    """
+    def __init__(self, api_url: str, auth: str = "",
+                 cache_file: Optional[Union[str, Path]] = None,
+                 max_workers: int = 8) -> None:
+        import requests
+        import requests.adapters
+        self.api_url = api_url.rstrip("/") + "/"
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if auth:
+            self.session.headers["Authorization"] = f"token {auth}"
+        self.cache_file = None if cache_file is None else Path(cache_file)
+        self.cache = {}
+        if self.cache_file is not None and self.cache_file.is_file():
+            try:
+                self.cache = json.loads(self.cache_file.read_text())
+            except ValueError:
+                pass
+        self.lock = threading.Lock()
+
+    def get(self, path: str, fields: Optional[Sequence[str]] = None,
+            **params) -> Tuple[List, int]:
+        """Requests one page of a listing.
+
+        Args:
+            path (str): The path relative to `api_url`.
+            fields (Optional[Sequence[str]]): Only keep these keys of every
+                item to keep the cache small. Defaults to None.
+            **params: The query parameters.
+
+        Returns:
+            Tuple[List, int]: The items and the number of the last page.
+
+        """
+        import requests
+        from urllib.parse import urlparse, parse_qs
+        url = requests.Request("GET", self.api_url + path,
+                               params=params).prepare().url
+        with self.lock:
+            cached = self.cache.get(url)
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+        response = self.session.get(url, headers=headers, timeout=30)
+        if response.status_code == 304 and cached:
+            return cached["data"], cached["last"]
+        response.raise_for_status()
+        data = response.json()
+        if fields is not None:
+            data = [{k: d[k] for k in fields} for d in data]
+        last = response.links.get("last", {}).get("url")
+        last = int(parse_qs(urlparse(last).query)["page"][0]) if last else 1
+        if "ETag" in response.headers:
+            with self.lock:
+                self.cache[url] = {"etag": response.headers["ETag"],
+                                   "data": data, "last": last}
+        return data, last
+
+    def get_all(self, path: str, fields: Optional[Sequence[str]] = None,
+                **params) -> List:
+        """Requests all pages of a listing.
+
+        The first page tells the number of pages from its `Link` header.
+        All other pages are requested concurrently.
+
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        data, last = self.get(path, fields=fields, page=1, **params)
+        if last > 1:
+            with ThreadPoolExecutor(min(self.max_workers, last - 1)) as ex:
+                pages = ex.map(
+                    lambda page: self.get(path, fields=fields, page=page,
+                                          **params)[0],
+                    range(2, last + 1),
+                )
+                data = data + [d for page in pages for d in page]
+        return data
+
+    def save(self) -> None:
+        if self.cache_file is None:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.cache))
+        tmp.replace(self.cache_file)
+
+    def close(self) -> None:
+        self.save()
+        self.session.close()
+
+
+def github_remote_history(repo: Repo, remote: str, branch: str,
+                          api_url: str = GITHUB_API, per_page: int = 100
+                          ) -> Tuple[List, List[str]]:
+    """Returns the commits of the remote `branch` and the remote tags.
+
+    Both are requested from the GitHub API of the repository `remote`
+    points to.
+
+    """
+    # get the owner and name of the repository from the remote url
     remotes = repo.remotes
     for remote_ in remotes:
         if remote_.name == remote:
-            remote_user, remote_repo_name = list(remote_.urls)[0].lstrip("git@github.com:").rstrip(".git").split("/")
+            match = GITHUB_REPO.search(list(remote_.urls)[0])
+            if match is None:
+                raise Exception(
+                    f"Could not read the owner and name of the repository "
+                    f"from the url of {remote}. Use --offline for remotes, "
+                    f"that aren't on GitHub."
+                )
+            remote_user, remote_repo_name = match.groups()
             break
     else:
         raise Exception(
             f"Could not find a remote with name {remote}. Available remotes are: {remotes}"
         )
-    api_url = f"https://api.github.com/repos/{remote_user}/{remote_repo_name}/"
 
     # if there's an act.vault file, read the GIT_API_OAUTH
     vault_file = Path("act.vault")
@@ -137,115 +709,159 @@ def assert_version_advance(
         auth = ""
 
     # get the remote commits and tags to compare
-    if auth:
-        req = requests.get(
-            api_url + "branches",
-            headers={"Authorization": f"token {auth}"},
-        )
-    else:
-        req = requests.get(
-            api_url + "branches",
-        )
-    data = json.loads(req.text)
-    remote_commits = []
-    for d in data:
-        if d["name"] == "main":
-            data = d
-            break
-    start_sha = data["commit"]["sha"]
-    start_commit = repo.commit(start_sha)
-    remote_commits.append(start_commit)
-    iter_ = 0
-    while True:
-        if auth:
-            data = json.loads(
-                requests.get(
-                    api_url + f"commits?per_page=100&sha={start_commit}",
-                    headers={"Authorization": f"token {auth}"}
-                ).text
-            )
-        else:
-            data = json.loads(
-                requests.get(
-                    api_url + f"commits?per_page=100&sha={start_commit}",
-                ).text
-            )
+    api = GitHubAPI(
+        f"{api_url.rstrip('/')}/repos/{remote_user}/{remote_repo_name}/",
+        auth, cache_file=Path(repo.git_dir) / ETAG_FILE,
+    )
+    try:
+        data = api.get_all("commits", fields=["sha"], sha=branch,
+                           per_page=per_page)
+        tags = api.get_all("git/refs/tags", fields=["ref"], per_page=per_page)
+    finally:
+        api.close()
+    try:
+        remote_commits = [repo.commit(sha) for sha
+                          in dict.fromkeys(d["sha"] for d in data)]
+    except Exception as e:
+        raise Exception("This might be, because a remote sha is not in the local shas. Run git fetch all") from e
+    remote_tags = [d["ref"][len("refs/tags/"):] for d in tags]
+    return remote_commits, remote_tags
+
+
+def remote_refs(repo: Repo, remote: str) -> Dict[str, str]:
+    """Maps the branches and tags of a remote to commit shas.
+
+    The refs are listed with `git ls-remote`. Annotated tags are mapped to
+    the commits they point to.
+
+    """
+    refs = {}
+    for line in repo.git.ls_remote("--heads", "--tags", remote).splitlines():
+        sha, ref = line.split("\t", 1)
+        if ref.endswith("^{}"):
+            ref = ref[:-3]
+        refs[ref] = sha
+    return refs
+
+
+def local_remote_history(repo: Repo, branch: str, remote: str
+                         ) -> Tuple[List, List[str]]:
+    """Returns the commits of the remote `branch` and the remote tags.
+
+    No HTTP API is used. The head of the remote branch and the remote tags
+    are listed with `git ls-remote`. If the remote can't be reached, the
+    remote-tracking ref `refs/remotes/<remote>/<branch>` and the tags
+    reachable from it are used instead.
+
+    """
+    from git import GitCommandError
+    tracking = f"refs/remotes/{remote}/{branch}"
+    try:
+        refs = remote_refs(repo, remote)
+    except GitCommandError:
+        print(f"Could not reach the remote {remote}. Using {tracking} and the "
+              f"local tags instead.")
+        refs = None
+
+    rev = tracking
+    if refs is not None and f"refs/heads/{branch}" in refs:
+        head = refs[f"refs/heads/{branch}"]
         try:
-            new_commits = [repo.commit(d["sha"]) for d in data]
-        except Exception as e:
-            raise Exception("This might be, because a remote sha is not in the local shas. Run git fetch all") from e
-        for c in new_commits:
-            if c not in remote_commits:
-                remote_commits.append(c)
-        # found all shas
-        if all([s in remote_commits for s in new_commits]):
-            break
-        if iter_ >= 100:
-            raise Exception("Too many commits (100,000). Time to reevaluate.")
-        iter_ += 1
-
-    if auth:
-        data = json.loads(
-            requests.get(
-                api_url + "git/refs/tags",
-                headers={"Authorization": f"token {auth}"}
-            ).text
+            repo.git.cat_file("-e", f"{head}^{{commit}}")
+            rev = head
+        except GitCommandError:
+            print(f"The head of {remote}/{branch} ({head}) is not in the local "
+                  f"repository. Using {tracking}. Run git fetch {remote} to "
+                  f"compare against the current remote.")
+    try:
+        remote_commits = list(repo.iter_commits(rev=rev))
+    except GitCommandError as e:
+        raise Exception(f"Could not find the branch {branch} of the remote "
+                        f"{remote}. Run git fetch {remote}.") from e
+
+    if refs is not None:
+        remote_tags = [ref[len("refs/tags/"):] for ref in refs
+                       if ref.startswith("refs/tags/")]
+    else:
+        remote_tags = repo.git.tag("--merged", tracking).split()
+    return remote_commits, remote_tags
+
+
+################################################################################
+# Main
+################################################################################
+
+
+def assert_version_advance(
+    filenames: Sequence[str],
+    branch: str = "main",
+    remote: str = "origin",
+    version_file: Optional[str] = None,
+    offline: bool = False,
+    api_url: str = GITHUB_API,
+    full_scan: bool = False,
+) -> int:
+    from git import Repo
+    from packaging import version
+    cwd = Path(".").resolve()
+    repo = Repo(cwd)
+    branch = getattr(repo.branches, branch)
+
+    # get the current version without executing any project code
+    local_version = read_local_version(cwd, version_file)
+    if local_version is None:
+        raise Exception("Could not determine the local version.")
+
+    # get all tags on the commits in branch, that match semver
+    graph = _git.CommitGraph(cwd=str(cwd))
+    local_tags_semvers = [tag for tag in graph.tags_in(branch.name)
+                          if R.match(tag)]
+
+    # get remote tags and remote setup.py versions
+    if offline:
+        remote_commits, remote_tags = local_remote_history(
+            repo, branch.name, remote
         )
     else:
-        data = json.loads(
-            requests.get(
-                api_url + "git/refs/tags",
-            ).text
+        remote_commits, remote_tags = github_remote_history(
+            repo, remote, branch.name, api_url=api_url
         )
-    remote_tags = [d["ref"].lstrip("refs/tags/") for d in data]
     remote_tags_semvers = [t for t in remote_tags if R.match(t)]
 
-    def yield_files(tree, suffix=".py"):
-        for b in tree.blobs:
-            if b.path.endswith(".py"):
-                yield b
-        for subtree in tree.trees:
-            yield from yield_files(subtree, suffix=suffix)
-
-    # get the remote software versions
-    remote_versions = []
-    for remote_commit in remote_commits:
-        # get a list of files
-        file_list = list(yield_files(remote_commit.tree))
-        for file in file_list:
-            with io.BytesIO(file.data_stream.read()) as f:
-                content = f.read().decode()
-            try:
-                nodes = ast.parse(content)
-            except SyntaxError:
-                continue
-            remote_versions.extend(version_visitor.visit(nodes))
-
     # make versions
     # local
     local_version = version.parse(local_version)
-    local_tags_semvers = list(map(lambda x: version.parse(x), list(set(local_tags_semvers))))
-    max_local_tag = max(local_tags_semvers)
-
-    # remote
-    remote_versions = list(map(lambda x: version.parse(x), list(set(remote_versions))))
-    max_remote_version = max(remote_versions)
-    remote_tags_semvers = list(map(lambda x: version.parse(x), list(set(remote_tags_semvers))))
-    max_remote_tag = max(remote_tags_semvers)
-    max_remote_version = max([max_remote_tag, max_remote_version])
-
-    # make sure local version and max local tag are the same
-    if local_version < max_local_tag:
+    max_local_tag = max(map(version.parse, set(local_tags_semvers)),
+                        default=None)
+
+    # make sure local version and max local tag are the same. a branch
+    # without semver tags has nothing to compare against
+    if max_local_tag is not None and local_version < max_local_tag:
         print(f"The current local version of the software {local_version} does not "
               f"match the highest version in the local tags ({max_local_tag}). "
               f"Either create this tag before pushing or advance the version.")
         return 1
 
-    # make sure local changes are higher than anything remote
-    if max_remote_version == max_remote_tag == max_local_tag == local_version:
-        return 0
+    # remote tags need no history scan
+    max_remote_version = max(map(version.parse, set(remote_tags_semvers)),
+                             default=None)
+    if max_remote_version is None or not local_version < max_remote_version:
+        # search the remote commits newest-first. commits scanned by earlier
+        # runs are looked up in the index in .git
+        index_file = Path(repo.git_dir) / INDEX_FILE
+        index = load_index(index_file, [c.hexsha for c in remote_commits])
+        tagged = {graph.tags[t] for t in remote_tags_semvers if t in graph.tags}
+        try:
+            max_remote_version = find_higher_version(
+                remote_commits, local_version, index, tagged,
+                full_scan=full_scan,
+            )
+        finally:
+            index.close()
+        save_index(index_file, index.new_entries())
 
-    if local_version < max_remote_version:
+    # make sure local changes are higher than anything remote
+    if max_remote_version is not None and local_version < max_remote_version:
         print (f"The maximum remote version is {max_remote_version}. You "
                f"are trying to push a smaller version ({local_version}). "
                f"This operation is forbidden.")
@@ -281,10 +897,31 @@ def main(argv: Optional[Sequence[str]] = None) -> int:  # pragma: no cover
         "--version-file",
         help="The name of the file defining the pip version of the software. Can be "
              "left empty in which case, the script will try to determine the version "
-             "from the setup.py file."
+             "from the pyproject.toml, setup.cfg or setup.py file. The files are "
+             "parsed and never executed."
+    )
+    parser.add_argument(
+        "--offline", action="store_true",
+        help="Read the remote branch and tags with git ls-remote and the local "
+             "remote-tracking refs instead of the GitHub API. Works with any "
+             "remote. Run git fetch before pushing to compare against the "
+             "current remote history."
+    )
+    parser.add_argument(
+        "--api-url", default=GITHUB_API,
+        help="The url of the GitHub API. Set this for GitHub Enterprise "
+             "servers. Defaults to 'https://api.github.com'."
+    )
+    parser.add_argument(
+        "--full-scan", action="store_true",
+        help="Search every remote commit for higher versions. By default, the "
+             "search stops at the newest commit with a semver tag."
     )
     args = parser.parse_args(argv)
-    return assert_version_advance(args.filenames, args.branch, args.remote, args.version_file)
+    return assert_version_advance(args.filenames, args.branch, args.remote,
+                                  args.version_file, offline=args.offline,
+                                  api_url=args.api_url,
+                                  full_scan=args.full_scan)
 
 
 if __name__ == '__main__':
@@ -8,15 +8,21 @@
 
 
 from __future__ import annotations
-import toml
-import pathlib
 import argparse
 import sys
 import os
+import pathlib
 import importlib
-import coverage
 import textwrap
-import unittest
+import contextlib
+import fnmatch
+import json
+import hashlib
+import subprocess
+if __name__ == '__main__':
+    # run as a script, e.g. `python pre_commit_hooks/run_coverage.py`
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from pre_commit_hooks import _cache, _config, _git
 
 
 ################################################################################
@@ -24,8 +30,13 @@ import unittest
 ################################################################################
 
 
-from typing import Optional, Sequence, List, Union, Tuple, Dict
+from typing import (Optional, Sequence, List, Union, Tuple, Dict, Set,
+                    Iterator, TYPE_CHECKING)
 OptionsDict = Dict[str, Union[str, int]]
+if TYPE_CHECKING:
+    # imported where they are used to keep the startup of the hook fast
+    import unittest
+    import coverage
 
 
 ################################################################################
@@ -40,44 +51,471 @@ class MyParser(argparse.ArgumentParser):
         sys.exit(2)
 
 
-def unittests_not_leading_to_recursion(tests,
-                                       method_substring='test_coverage_with'):
-    """Gives sorting keys for `unittest.TestSuite` instances based on a substring.
+class ContextResultMixin:
+    """Switches the coverage context `cov` to the id of the running test."""
+    cov = None
 
-    Args:
-        tests (unittest.TestSuite): The test-suite or sub-test suite to use
-            and return 1 if the substring is in the method names and 2 otherwise.
+    def startTest(self, test: unittest.TestCase) -> None:
+        if not hasattr(self, 'test_files'):
+            self.test_files = {}
+        module = sys.modules.get(type(test).__module__)
+        if getattr(module, '__file__', None) is not None:
+            file = os.path.abspath(module.__file__)
+            self.test_files.setdefault(file, set()).add(test.id())
+        self.cov.switch_context(test.id())
+        super().startTest(test)
+
+    def stopTest(self, test: unittest.TestCase) -> None:
+        super().stopTest(test)
+        self.cov.switch_context('')
 
-    Keyword Args:
-        method_substring (str, optional): The substring that should be executed
-            first. Defaults to 'quickstart'.
-        even_higher_prio (list[str], optional): A list of strings that should have
-            even higher priority.
+
+def make_coverage(config: OptionsDict,
+                  data_file: Optional[str] = None) -> coverage.Coverage:
+    """Creates a `coverage.Coverage` instance with the configured patterns.
+
+    Create and start it in a `coverage_core` block to use the configured
+    core.
+
+    """
+    import coverage
+    if data_file is None:
+        cov = coverage.Coverage(cover_pylib=False)
+    else:
+        cov = coverage.Coverage(cover_pylib=False, data_file=data_file)
+    apply_patterns(cov, config, measure=True)
+    package = os.path.dirname(os.path.abspath(__file__))
+    if not package.startswith(os.path.join(os.getcwd(), '')):
+        # the result classes of this package run while measuring, but they
+        # aren't part of the project
+        omit = cov.get_option('run:omit') or []
+        cov.set_option('run:omit', [*omit, os.path.join(package, '*')])
+    return cov
+
+
+@contextlib.contextmanager
+def coverage_core(config: OptionsDict) -> Iterator[None]:
+    """Sets coverage's COVERAGE_CORE environment variable in the block.
+
+    Coverage reads the variable, when a `coverage.Coverage` is created
+    (coverage 7.9+) or started (older versions), so both belong in the
+    block. The previous value is restored afterwards. Without a configured
+    `core`, coverage's default core is used.
+
+    The 'sysmon' core measures with PEP 669 `sys.monitoring`. It needs
+    python 3.12 and can't switch contexts per test, so the default core is
+    used on older interpreters and in `impact` mode.
+
+    """
+    core = config['core']
+    if core == 'sysmon' and (sys.version_info < (3, 12) or config['impact']):
+        if config['verbose'] > 1:
+            print("The sysmon core is not available. Using the default core.")
+        core = None
+    if core is None:
+        yield
+        return
+    previous = os.environ.get('COVERAGE_CORE')
+    os.environ['COVERAGE_CORE'] = core
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ['COVERAGE_CORE']
+        else:
+            os.environ['COVERAGE_CORE'] = previous
+
+
+def apply_patterns(cov: coverage.Coverage, config: OptionsDict,
+                   measure: bool = False) -> None:
+    """Adds the include and omit globs of the config to `cov`.
+
+    With `measure`, files not matching them are not measured at all.
+
+    """
+    sections = ['report', 'run'] if measure else ['report']
+    for section in sections:
+        for option in ['include', 'omit']:
+            if config[option]:
+                patterns = cov.get_option(f'{section}:{option}') or []
+                cov.set_option(f'{section}:{option}',
+                               list(patterns) + list(config[option]))
+
+
+def run_file_worker(file: str, config: OptionsDict, data_file: str) -> None:
+    """Runs `main` of `file` under coverage. Target of the isolated worker.
+
+    The coverage data is saved to `data_file`. A `SystemExit` raised by
+    `main` becomes the exit code of the worker.
+
+    """
+    if config['memory_limit'] is not None:
+        try:
+            import resource
+            limit = int(config['memory_limit'] * 1024 ** 2)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            print("Could not set the memory limit on this platform.")
+    sys.path.insert(0, os.path.split(os.path.abspath(file))[0])
+    module = importlib.import_module(
+        os.path.splitext(os.path.basename(file))[0])
+    with coverage_core(config):
+        cov = make_coverage(config, data_file=data_file)
+        cov.start()
+    exit_code = 0
+    try:
+        module.main(verbosity=config['verbose'])
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    finally:
+        cov.stop()
+        cov.save()
+    sys.exit(exit_code)
+
+
+def run_file_isolated(config: OptionsDict) -> Tuple[int, Optional[coverage.Coverage]]:
+    """Runs `config['file']` in a spawned worker process.
 
     Returns:
-        int: Either 1 or 2 to be used in sorting.
+        Tuple[int, Optional[coverage.Coverage]]: The exit code of the worker
+            and the coverage data it measured. The coverage is None, if the
+            worker timed out or did not save any data.
+
+    """
+    import coverage
+    import multiprocessing
+    cov = coverage.Coverage(cover_pylib=False)
+    data_file = os.path.abspath(cov.config.data_file)
+    if os.path.isfile(data_file):
+        os.remove(data_file)
+    ctx = multiprocessing.get_context('spawn')
+    proc = ctx.Process(target=run_file_worker,
+                       args=(config['file'], config, data_file))
+    proc.start()
+    proc.join(config['timeout'])
+    if proc.is_alive():
+        proc.terminate()
+        proc.join()
+        print(f"Running {config['file']} timed out after "
+              f"{config['timeout']} seconds.")
+        return 1, None
+    if not os.path.isfile(data_file):
+        return proc.exitcode or 1, None
+    cov = coverage.Coverage(cover_pylib=False, data_file=data_file)
+    apply_patterns(cov, config)
+    cov.load()
+    return proc.exitcode, cov
+
+
+def staged_python_hunks(base: Optional[str] = None) -> Dict[str, Set[int]]:
+    hunks = _git.diff_hunks(base=base, side='new')
+    return {f: l for f, l in hunks.items()
+            if f.endswith('.py') and os.path.isfile(f)}
+
+
+def is_omitted(file: str, cov: coverage.Coverage) -> bool:
+    """Uses the include and omit patterns of the coverage report config."""
+    def matches(patterns):
+        for pattern in patterns or []:
+            if not pattern.startswith(('*', os.sep)):
+                pattern = os.path.abspath(pattern)
+            if fnmatch.fnmatch(file, pattern):
+                return True
+        return False
+    include = cov.config.report_include or cov.config.run_include
+    omit = (cov.config.report_omit or []) + (cov.config.run_omit or [])
+    if include and not matches(include):
+        return True
+    return matches(omit)
+
+
+def load_fresh_coverage(hunks: Dict[str, Set[int]], config: OptionsDict
+                        ) -> Optional[coverage.Coverage]:
+    """Loads the existing coverage data, if it is newer than the sources.
+
+    The sources are all measured files, the changed files in `hunks` and the
+    test files, which are usually not measured.
 
     """
-    if hasattr(tests, '__iter__'):
-        iterable = tests
+    import coverage
+    from pre_commit_hooks import _testing
+    cov = coverage.Coverage(cover_pylib=False)
+    apply_patterns(cov, config)
+    data_file = os.path.abspath(cov.config.data_file)
+    if not os.path.isfile(data_file):
+        return None
+    cov.load()
+    mtime = os.path.getmtime(data_file)
+    sources = set(cov.get_data().measured_files()) | set(hunks)
+    if config['file'] is not None:
+        sources.add(os.path.abspath(config['file']))
     else:
-        if method_substring in tests._testMethodName:
-            return False
+        tests = _testing.find_test_files(os.getcwd())
+        if tests is None:
+            # the `load_tests` protocol can import any module
+            tests = _cache.python_files(os.getcwd())
+        sources.update(tests)
+    for source in sources:
+        if not os.path.isfile(source) or os.path.getmtime(source) > mtime:
+            return None
+    return cov
+
+
+def diff_percentage(cov: coverage.Coverage,
+                    hunks: Dict[str, Set[int]]) -> float:
+    """The percentage of covered statements among the changed lines."""
+    import coverage
+    statements = 0
+    covered = 0
+    for file, lines in hunks.items():
+        if is_omitted(file, cov):
+            continue
+        try:
+            _, stmts, _, missing, _ = cov.analysis2(file)
+        except coverage.exceptions.CoverageException:
+            continue
+        changed = set(stmts) & lines
+        statements += len(changed)
+        covered += len(changed - set(missing))
+    if statements == 0:
+        return 100.0
+    return 100 * covered / statements
+
+
+ANALYSIS_CACHE = 'coverage_analysis.json'
+
+
+def total_percentage(cov: coverage.Coverage,
+                     include: Optional[Sequence[str]] = None) -> float:
+    """Computes the total percentage without building a report.
+
+    The numbers of statements and branches and the missing ones of every
+    file are cached by the hash of the file, the executed lines (or arcs)
+    and the exclusion settings, so unchanged files are not analyzed again.
+    Like `coverage report`, branches count as much as statements, if the
+    data contains branch coverage.
+
+    Args:
+        cov (coverage.Coverage): The coverage with measured or loaded data.
+        include (Optional[Sequence[str]]): If given, only these files are
+            considered.
+
+    Raises:
+        coverage.exceptions.NoDataError: If no file is reported.
+
+    """
+    import coverage
+    data = cov.get_data()
+    cache = _cache.load_json(ANALYSIS_CACHE, {})
+    settings = json.dumps([coverage.__version__, cov.config.exclude_list,
+                           cov.config.partial_list,
+                           cov.config.partial_always_list])
+    if include is not None:
+        include = {os.path.abspath(f) for f in include}
+    n_statements = n_missing = n_branches = n_missing_branches = 0
+    reported = False
+    for file in data.measured_files():
+        file = os.path.abspath(file)
+        if (include is not None and file not in include) or is_omitted(file, cov):
+            continue
+        try:
+            sha = _cache.file_sha(file)
+        except OSError:
+            continue
+        if data.has_arcs():
+            executed = sorted(data.arcs(file) or [])
         else:
-            return True
-    for test in iterable:
-        if isinstance(test, SortableSuite):
-            test.sort()
+            executed = sorted(data.lines(file) or [])
+        key = hashlib.sha1(f'{settings}{sha}{executed}'.encode()).hexdigest()
+        entry = cache.get(file, [None])
+        if entry[0] == key and len(entry) == 5:
+            numbers = entry[1:]
         else:
-            raise NotImplementedError()
-    return True
+            try:
+                _, statements, _, missing, _ = cov.analysis2(file)
+                # {line: (exits, taken exits)} of every branch
+                branches = (cov.branch_stats(file) if data.has_arcs()
+                            else {}).values()
+            except coverage.exceptions.CoverageException:
+                continue
+            numbers = [len(statements), len(missing),
+                       sum(exits for exits, _ in branches),
+                       sum(exits - taken for exits, taken in branches)]
+            cache[file] = [key, *numbers]
+        reported = True
+        n_statements += numbers[0]
+        n_missing += numbers[1]
+        n_branches += numbers[2]
+        n_missing_branches += numbers[3]
+    _cache.dump_json(ANALYSIS_CACHE, cache)
+    if not reported:
+        raise coverage.exceptions.NoDataError("No data to report.")
+    total = n_statements + n_branches
+    if total == 0:
+        return 100.0
+    return 100 * (total - n_missing - n_missing_branches) / total
+
+
+def write_report(kind: str, data_file: str, config: OptionsDict) -> str:
+    """Writes a 'html', 'xml' or 'json' report of the data in `data_file`."""
+    import coverage
+    cov = coverage.Coverage(cover_pylib=False, data_file=data_file)
+    apply_patterns(cov, config)
+    cov.load()
+    getattr(cov, f'{kind}_report')()
+    return kind
+
+
+def make_reports(cov: coverage.Coverage, config: OptionsDict) -> None:
+    """Creates the reports listed in `config['reports']`.
+
+    'term' prints the usual table. The file based reports are written in
+    parallel worker processes from the saved data file.
 
+    """
+    import multiprocessing
+    import concurrent.futures
+    kinds = list(config['reports'])
+    unknown = set(kinds) - {'term', 'html', 'xml', 'json'}
+    if unknown:
+        raise ValueError(f"Unknown report types {unknown}. Choose from 'term', "
+                         f"'html', 'xml' and 'json'.")
+    if 'term' in kinds:
+        cov.report()
+        kinds.remove('term')
+    data_file = os.path.abspath(cov.config.data_file)
+    if len(kinds) == 1:
+        write_report(kinds[0], data_file, config)
+    elif kinds:
+        ctx = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(len(kinds), ctx) as pool:
+            futures = [pool.submit(write_report, k, data_file, config)
+                       for k in kinds]
+            for future in futures:
+                future.result()
+
+
+def check_threshold(cov_percentage: float, config: OptionsDict) -> int:
+    if cov_percentage > config['threshold']:
+        return 0
+    else:
+        print(f"Coverage ({cov_percentage:.2f}%) is smaller than threshold "
+              f"({config['threshold']}). Exiting.")
+        return 1
+
+
+RESULT_CACHE = 'run_coverage_result.json'
+
+
+def result_cache_key(config: OptionsDict) -> Optional[str]:
+    """Identifies the settings and, for git based modes, the staged diff.
+
+    Returns None, if the staged diff can not be determined.
+
+    """
+    key = dict(config, cwd=os.getcwd())
+    key.pop('slowest', None)
+    if config['diff_coverage'] or config['impact']:
+        args = ['diff', '--cached', '--no-color', '--no-ext-diff']
+        if config['diff_base'] is not None:
+            args.append(config['diff_base'])
+        try:
+            diff = _git.git(*args, '--', '*.py')
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        key['diff'] = hashlib.sha1(diff.encode()).hexdigest()
+    return json.dumps(key, sort_keys=True, default=str)
+
+
+IMPACT_MAP = 'impact_map.json'
+
+
+def record_impact_map(cov: coverage.Coverage,
+                      test_files: Dict[str, Set[str]]) -> None:
+    """Saves which test covered which lines of which file.
+
+    `test_files` maps the test files to the ids of their tests. The blob
+    shas of the measured files and test files are saved alongside the map,
+    so that `select_impacted_tests` can tell a stale map apart.
+
+    """
+    data = cov.get_data()
+    tests = sorted(c for c in data.measured_contexts() if c)
+    index = {t: i for i, t in enumerate(tests)}
+    files = {}
+    for file in data.measured_files():
+        lines = {}
+        for lineno, contexts in data.contexts_by_lineno(file).items():
+            ids = sorted(index[c] for c in contexts if c)
+            if ids:
+                lines[str(lineno)] = ids
+        if lines:
+            files[os.path.abspath(file)] = lines
+    try:
+        shas = _git.blob_shas(list(files) + list(test_files))
+    except (OSError, subprocess.CalledProcessError):
+        return
+    test_files = {f: sorted(index[t] for t in ids if t in index)
+                  for f, ids in test_files.items()}
+    _cache.dump_json(IMPACT_MAP, {'tests': tests, 'files': files,
+                                  'test_files': test_files, 'shas': shas})
+
+
+def select_impacted_tests(verbose: int = 0
+                          ) -> Optional[Tuple[List[str], List[str]]]:
+    """Selects the tests, whose covered lines overlap the staged changes.
+
+    Tests of deleted test files are left out.
+
+    Returns:
+        Optional[Tuple[List[str], List[str]]]: None, if a full run is needed,
+            because there is no map, the map is stale, a test file changed or
+            a changed file is not in the map, like a new file. Otherwise, the
+            ids of the selected tests and the changed python files.
 
-class SortableSuite(unittest.TestSuite):
-    def sort(self):
-        if hasattr(self, '_tests'):
-            self._tests = list(filter(unittests_not_leading_to_recursion,
-                                      self._tests))
+    """
+    impact = _cache.load_json(IMPACT_MAP)
+    if impact is None:
+        if verbose:
+            print("No test impact map found. Running all tests.")
+        return None
+    test_files = impact['test_files']
+    try:
+        hunks = _git.diff_hunks(side='old')
+        head_shas = _git.blob_shas(list(hunks), rev='HEAD')
+        test_shas = _git.blob_shas(list(test_files))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    hunks = {f: l for f, l in hunks.items() if f.endswith('.py')}
+
+    selected = set()
+    for file, lines in hunks.items():
+        if file in test_files or os.path.basename(file).startswith('test'):
+            if verbose:
+                print(f"Test file {file} changed. Running all tests.")
+            return None
+        if file not in impact['files']:
+            if verbose:
+                print(f"{file} is not in the test impact map. "
+                      f"Running all tests.")
+            return None
+        if impact['shas'].get(file) != head_shas.get(file):
+            if verbose:
+                print(f"Test impact map is stale for {file}. Running all tests.")
+            return None
+        covered = impact['files'][file]
+        for line in lines:
+            selected.update(covered.get(str(line), []))
+    for file, ids in test_files.items():
+        if file not in test_shas:
+            # the test file was deleted
+            selected.difference_update(ids)
+        elif impact['shas'].get(file) != test_shas[file]:
+            if verbose:
+                print(f"Test impact map is stale for {file}. Running all tests.")
+            return None
+    tests = [impact['tests'][i] for i in sorted(selected)]
+    return tests, [f for f in hunks if os.path.isfile(f)]
 
 
 ################################################################################
@@ -86,74 +524,195 @@ class SortableSuite(unittest.TestSuite):
 
 
 def make_config(tomlfile: Optional[Union[str, None]] = None) -> OptionsDict:
-    defaults = {'threshold': 100, 'file': None,
-                'verbose': False, 'testing': False}
-    default_str = "Default values have been used."
-    if tomlfile is None:
-        toml_path = pathlib.Path("pyproject.toml").resolve()
-        if toml_path.is_file():
-            tomlfile = str(toml_path)
-
-    if tomlfile is not None:
-        with open(tomlfile) as f:
-            data = toml.load(f)
-        settings = data.get("tool", {}).get("run_coverage", {})
-        defaults.update(settings)
-        default_str = f"Values have been loaded from {tomlfile}"
+    defaults, default_str = _config.load_config('run_coverage', tomlfile)
 
     if defaults['verbose'] > 2:
         print(f"Printing the settings for this run of pycodestyle:\n"
               f"{default_str}:\n"
               f"file:            {defaults['file']}\n"
               f"threshold:       {defaults['threshold']}\n"
+              f"impact:          {defaults['impact']}\n"
+              f"diff_coverage:   {defaults['diff_coverage']}\n"
+              f"diff_base:       {defaults['diff_base']}\n"
+              f"core:            {defaults['core']}\n"
+              f"cache:           {defaults['cache']}\n"
+              f"discovery_cache: {defaults['discovery_cache']}\n"
+              f"include_tests:   {defaults['include_tests']}\n"
+              f"exclude_tests:   {defaults['exclude_tests']}\n"
+              f"time_budget:     {defaults['time_budget']}\n"
+              f"memory_profile:  {defaults['memory_profile']}\n"
+              f"memory_budget:   {defaults['memory_budget']}\n"
+              f"memory_top:      {defaults['memory_top']}\n"
+              f"isolate:         {defaults['isolate']}\n"
+              f"timeout:         {defaults['timeout']}\n"
+              f"memory_limit:    {defaults['memory_limit']}\n"
+              f"include:         {defaults['include']}\n"
+              f"omit:            {defaults['omit']}\n"
+              f"reports:         {defaults['reports']}\n"
               f"verbose:         {defaults['verbose']}")
 
     return defaults
 
 
-def run_coverage(tomlfile: Optional[Union[str, None]] = None) -> int:
+def run_coverage(tomlfile: Optional[Union[str, None]] = None,
+                 slowest: int = 0) -> int:
     config = make_config(tomlfile)
+    config['slowest'] = slowest
+    if not config['cache']:
+        return measure(config)[0]
+
+    key = result_cache_key(config)
+    cached = _cache.load_json(RESULT_CACHE, {})
+    manifest = _cache.manifest(_cache.python_files(os.getcwd()),
+                               cached.get('files'))
+    if (key is not None and cached.get('key') == key
+            and not _cache.manifest_changed(cached['files'], manifest)):
+        print(f"No python file changed since the last passing run. "
+              f"Coverage: {cached['percentage']:.2f}%.")
+        return cached['exit_code']
+    exit_code, cov_percentage = measure(config)
+    if exit_code == 0 and key is not None:
+        _cache.dump_json(RESULT_CACHE, {
+            'key': key, 'files': manifest, 'exit_code': exit_code,
+            'percentage': 100.0 if cov_percentage is None else cov_percentage,
+        })
+    return exit_code
+
+
+def measure(config: OptionsDict) -> Tuple[int, Optional[float]]:
+    """Runs the tests under coverage and checks the threshold.
+
+    Returns:
+        Tuple[int, Optional[float]]: The exit code and the percentage, that
+            has been compared against the threshold. The percentage is None,
+            if no tests needed to be run.
+
+    """
+    import coverage
+    import unittest
+    from pre_commit_hooks import _testing
+    hunks = None
+    if config['diff_coverage']:
+        try:
+            hunks = staged_python_hunks(config['diff_base'])
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Could not get the staged changes from git: {e}")
+            return 1, None
+        if not hunks:
+            print("The staged changes contain no python files.")
+            return 0, None
+        cov = load_fresh_coverage(hunks, config)
+        if cov is not None:
+            if config['verbose']:
+                print("Reusing existing coverage data.")
+            cov_percentage = diff_percentage(cov, hunks)
+            return check_threshold(cov_percentage, config), cov_percentage
+
     if config['file'] is not None:
         assert os.path.isfile(config['file'])
-        dir_, file = os.path.split(config['file'])
-        sys.path.insert(0, os.path.split(os.path.abspath(config['file']))[0])
-        dir_ = '.' + dir_ + '.'
-        file = file.replace('.py', '')
-        print(dir_, file)
-        module = importlib.import_module(file)
-        cov = coverage.Coverage(cover_pylib=False)
-        cov.start()
-        module.main(verbosity=config['verbose'])
-        cov.stop()
-        cov_percentage = cov.report()
-        if cov_percentage > config['threshold']:
-            return 0
+        if config['isolate']:
+            exit_code, cov = run_file_isolated(config)
+            if exit_code != 0:
+                print(f"Running {config['file']} failed with exit code "
+                      f"{exit_code}.")
+                return 1, None
+        else:
+            file = os.path.basename(config['file'])
+            sys.path.insert(0, os.path.split(os.path.abspath(config['file']))[0])
+            file = file.replace('.py', '')
+            module = importlib.import_module(file)
+            with coverage_core(config):
+                cov = make_coverage(config)
+                cov.start()
+            module.main(verbosity=config['verbose'])
+            cov.stop()
+            cov.save()
+        if hunks is not None:
+            cov_percentage = diff_percentage(cov, hunks)
         else:
-            print(
-                f"Coverage percentage below threshold cov: {cov_percentage}% "
-                f"< thresh: {config['threshold']}%")
-            return 1
+            cov_percentage = total_percentage(cov)
+            print(f"Total coverage: {cov_percentage:.2f}%")
+        make_reports(cov, config)
+        return check_threshold(cov_percentage, config), cov_percentage
     else:
         loader = unittest.TestLoader()
-        if config['testing']:
-            loader.suiteClass = SortableSuite
-        test_suite = loader.discover(start_dir=os.getcwd(),
-                                     top_level_dir=os.path.split(os.getcwd())[0])
-        if config['testing']:
-            test_suite.sort()
-        runner = unittest.TextTestRunner(verbosity=config['verbose'])
-        cov = coverage.Coverage(cover_pylib=False)
-        cov.start()
+        top_level_dir = os.path.split(os.getcwd())[0]
+        selection = None
+        if config['impact']:
+            selection = select_impacted_tests(config['verbose'])
+        if selection is None:
+            exclude = list(config['exclude_tests'])
+            if config['testing']:
+                # tests of this hook would run this hook recursively
+                exclude.append('*.test_coverage_with*')
+            select = _testing.TestSelector(config['include_tests'], exclude)
+            test_suite = _testing.discover(loader, os.getcwd(), top_level_dir,
+                                           select=select,
+                                           use_index=config['discovery_cache'])
+        else:
+            tests, changed_files = selection
+            if not tests:
+                print("No tests cover the staged changes.")
+                return 0, None
+            if config['verbose']:
+                print(f"Running {len(tests)} tests affected by the staged "
+                      f"changes.")
+            if top_level_dir not in sys.path:
+                sys.path.insert(0, top_level_dir)
+            test_suite = loader.loadTestsFromNames(tests)
+        with coverage_core(config):
+            cov = make_coverage(config)
+        bases = [_testing.TimedTextResult]
+        attrs = {}
+        if config['impact']:
+            bases.insert(0, ContextResultMixin)
+            attrs['cov'] = cov
+        if config['memory_profile']:
+            bases.insert(0, _testing.MemoryResultMixin)
+            attrs['memory_budget'] = config['memory_budget']
+            attrs['memory_top'] = config['memory_top']
+        runner = unittest.TextTestRunner(
+            verbosity=config['verbose'],
+            resultclass=type('Result', tuple(bases), attrs),
+        )
+        # import the test modules of lazy suites before measuring, like a
+        # discovery without the index does, so that the coverage doesn't
+        # depend on the state of the index
+        list(_testing.iter_tests(test_suite))
+        with coverage_core(config):
+            cov.start()
         result = runner.run(test_suite)
         cov.stop()
-        cov_percentage = cov.report()
-
-        if cov_percentage > config['threshold']:
-            return 0
+        durations = getattr(result, 'durations', {})
+        _testing.record_durations(durations)
+        _testing.report_durations(durations, config['slowest'],
+                                  config['time_budget'])
+        memory_failed = False
+        if config['memory_profile']:
+            memory_failed = bool(result.report_memory())
+        if hunks is not None:
+            # a targeted run only measured the changed code and is not saved
+            if selection is None:
+                cov.save()
+            cov_percentage = diff_percentage(cov, hunks)
+        elif selection is None:
+            cov.save()
+            if config['impact'] and result.wasSuccessful():
+                # a failing run doesn't show which tests cover a file
+                record_impact_map(cov, result.test_files)
+            cov_percentage = total_percentage(cov)
+            print(f"Total coverage: {cov_percentage:.2f}%")
+            make_reports(cov, config)
         else:
-            print(f"Coverage ({cov_percentage:.2f}%) is smaller than threshold "
-                  f"({config['threshold']}). Exiting.")
-            return 1
+            try:
+                cov_percentage = total_percentage(cov, include=changed_files)
+            except coverage.exceptions.NoDataError:
+                print("The staged changes contain no measured lines.")
+                return int(memory_failed), None
+        exit_code = check_threshold(cov_percentage, config)
+        if memory_failed:
+            exit_code = 1
+        return exit_code, cov_percentage
 
 
 def main(argv: Optional[Sequence[str]] = None) -> int:  # pragma: no cover
@@ -169,9 +728,15 @@ def main(argv: Optional[Sequence[str]] = None) -> int:  # pragma: no cover
         'filenames', nargs='*',
         help='The files to run this pre-commit hook on.'
     )
+    parser.add_argument(
+        '--slowest', type=int, default=0,
+        help='Print the N slowest tests after the run.'
+    )
     if argv is not None:
         args = parser.parse_args(argv)
-    return run_coverage()
+    else:
+        args = parser.parse_known_args()[0]
+    return run_coverage(slowest=args.slowest)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+"""Script that runs several hooks of this package in one process.
+
+`pre-commit-hooks run` enumerates the files once, loads pyproject.toml once
+and runs the chosen hooks. Hooks, that mostly wait for subprocesses, run
+concurrently in threads. Hooks, that trace or import code in this process
+(run-coverage) or rewrite the notebooks (run-ipynb), run alone afterwards.
+
+"""
+################################################################################
+# Imports
+################################################################################
+
+
+from __future__ import annotations
+import argparse
+import textwrap
+import sys
+import os
+import io
+import time
+import pathlib
+import threading
+import traceback
+
+if __name__ == '__main__':
+    # run as a script, e.g. `python pre_commit_hooks/run_hooks.py`
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+
+################################################################################
+# Typing
+################################################################################
+
+
+from typing import Optional, Sequence, Callable, List, Dict, Tuple
+# options of single hooks given on the command line, e.g. the branch
+HookOptions = Dict[str, str]
+HookFunc = Callable[[Sequence[str], Optional[str], HookOptions], int]
+HookResult = Tuple[str, Optional[int], float, str]
+
+
+################################################################################
+# Custom Argparse
+################################################################################
+
+
+class MyParser(argparse.ArgumentParser):
+    def error(self, message):
+        sys.stderr.write('error: %s\n' % message)
+        self.print_help()
+        sys.exit(2)
+
+
+################################################################################
+# Hooks
+################################################################################
+
+
+def clear_ipynb_cells(filenames: Sequence[str], tomlfile: Optional[str],
+                      options: HookOptions) -> int:
+    from pre_commit_hooks.clear_ipynb_cells import clear_notebooks
+    return clear_notebooks(filenames, tomlfile)
+
+
+def run_ipynb(filenames: Sequence[str], tomlfile: Optional[str],
+              options: HookOptions) -> int:
+    from pre_commit_hooks.run_notebooks import run_notebooks
+    return run_notebooks(filenames, tomlfile)
+
+
+def run_pycodestyle(filenames: Sequence[str], tomlfile: Optional[str],
+                    options: HookOptions) -> int:
+    from pre_commit_hooks.run_pycodestyle import run_pycodestyle
+    return run_pycodestyle(filenames, tomlfile)
+
+
+def run_run_unittests(filenames: Sequence[str], tomlfile: Optional[str],
+                      options: HookOptions) -> int:
+    from pre_commit_hooks.run_run_unittests import run_run_unittests
+    return run_run_unittests(tomlfile=tomlfile, filenames=filenames)
+
+
+def run_coverage(filenames: Sequence[str], tomlfile: Optional[str],
+                 options: HookOptions) -> int:
+    from pre_commit_hooks.run_coverage import run_coverage
+    return run_coverage(tomlfile)
+
+
+def assert_version_advance(filenames: Sequence[str],
+                           tomlfile: Optional[str],
+                           options: HookOptions) -> int:
+    from pre_commit_hooks.assert_version_advance import assert_version_advance
+    return assert_version_advance(filenames, branch=options['branch'],
+                                  remote=options['remote'])
+
+
+# name: (function, suffixes of the files it runs on, runs alone)
+HOOKS: Dict[str, Tuple[HookFunc, Optional[Tuple[str, ...]], bool]] = {
+    'clear-ipynb-cells': (clear_ipynb_cells, ('.ipynb',), False),
+    'run-ipynb': (run_ipynb, ('.ipynb',), True),
+    'run-pycodestyle': (run_pycodestyle, ('.py',), False),
+    'run-run-unittests': (run_run_unittests, None, False),
+    'run-coverage': (run_coverage, None, True),
+    'assert-version-advance': (assert_version_advance, None, False),
+}
+DEFAULT_HOOKS = ['clear-ipynb-cells', 'run-pycodestyle', 'run-run-unittests',
+                 'run-coverage']
+DEFAULT_OPTIONS: HookOptions = {'branch': 'main', 'remote': 'origin'}
+
+
+################################################################################
+# Utils
+################################################################################
+
+
+class HookOutput:
+    """A `sys.stdout`, that writes to a separate stream in every thread.
+
+    Threads, that didn't `redirect` their output, write to `stream`.
+    Subprocesses of the hooks are started with `_process.call`, which
+    writes their output to this stream, too.
+
+    """
+    def __init__(self, stream: io.TextIOBase) -> None:
+        self.stream = stream
+        self.local = threading.local()
+
+    def redirect(self, stream: Optional[io.TextIOBase]
+                 ) -> Optional[io.TextIOBase]:
+        """Sets the stream of the current thread and returns the old one."""
+        previous = getattr(self.local, 'stream', None)
+        self.local.stream = stream
+        return previous
+
+    def current(self) -> io.TextIOBase:
+        stream = getattr(self.local, 'stream', None)
+        return self.stream if stream is None else stream
+
+    def write(self, s: str) -> int:
+        return self.current().write(s)
+
+    def flush(self) -> None:
+        self.current().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def collect_files(filenames: Sequence[str] = (),
+                  all_files: bool = False) -> List[str]:
+    """Enumerates the files once for all hooks.
+
+    Args:
+        filenames (Sequence[str]): Files given on the command line. If not
+            empty, they are used as they are.
+        all_files (bool): Use all files tracked by git instead of the staged
+            files.
+
+    """
+    if filenames:
+        return list(filenames)
+    from pre_commit_hooks import _git
+    if all_files:
+        out = _git.git('ls-files')
+    else:
+        out = _git.git('diff', '--cached', '--name-only', '--diff-filter=ACMR')
+    return out.splitlines()
+
+
+def hook_files(name: str, filenames: Sequence[str]) -> List[str]:
+    suffixes = HOOKS[name][1]
+    if suffixes is None:
+        return list(filenames)
+    return [f for f in filenames if f.endswith(suffixes)]
+
+
+def run_hook(name: str, filenames: Sequence[str], tomlfile: Optional[str],
+             output: HookOutput,
+             options: Optional[HookOptions] = None) -> HookResult:
+    """Runs a hook with the output of the current thread captured.
+
+    Returns:
+        HookResult: The name, the exit code (None, if the hook was skipped,
+            because no file matched), the duration and the output.
+
+    """
+    func, suffixes, _ = HOOKS[name]
+    files = hook_files(name, filenames)
+    if suffixes is not None and not files:
+        return name, None, 0.0, ''
+    buffer = io.StringIO()
+    previous = output.redirect(buffer)
+    start = time.perf_counter()
+    try:
+        code = func(files, tomlfile, DEFAULT_OPTIONS | (options or {}))
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc(file=buffer)
+        code = 1
+    finally:
+        output.redirect(previous)
+    return name, code, time.perf_counter() - start, buffer.getvalue()
+
+
+def report(result: HookResult, stream: io.TextIOBase) -> None:
+    name, code, duration, text = result
+    if code is None:
+        status = 'Skipped (no files to check)'
+    elif code == 0:
+        status = f'Passed ({duration:.2f}s)'
+    else:
+        status = f'Failed with exit code {code} ({duration:.2f}s)'
+    stream.write(f"{name:.<50}{status}\n")
+    if text and code:
+        stream.write(textwrap.indent(text.rstrip('\n'), '    ') + '\n')
+    stream.flush()
+
+
+################################################################################
+# Main
+################################################################################
+
+
+def run_hooks(hooks: Sequence[str] = DEFAULT_HOOKS,
+              filenames: Sequence[str] = (), all_files: bool = False,
+              tomlfile: Optional[str] = None, jobs: int = 4,
+              options: Optional[HookOptions] = None) -> int:
+    """Runs several hooks sharing the file list and the configuration.
+
+    Args:
+        hooks (Sequence[str]): The names of the hooks, see `HOOKS`.
+        filenames (Sequence[str]): The files to run the hooks on. Defaults to
+            the staged files.
+        all_files (bool): Run on all files tracked by git.
+        tomlfile (Optional[str]): The toml file with the `[tool.<hook>]`
+            sections. Defaults to pyproject.toml in the current directory.
+        jobs (int): The number of hooks running at the same time.
+        options (Optional[HookOptions]): Options of single hooks, see
+            `DEFAULT_OPTIONS`, e.g. the branch and the remote of
+            assert-version-advance.
+
+    Returns:
+        int: 0, if all hooks passed, 1 otherwise.
+
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from pre_commit_hooks import _config
+    unknown = [h for h in hooks if h not in HOOKS]
+    if unknown:
+        raise ValueError(f"Unknown hooks {unknown}. Available hooks are: "
+                         f"{', '.join(HOOKS)}.")
+    filenames = collect_files(filenames, all_files)
+    if tomlfile is None and os.path.isfile('pyproject.toml'):
+        tomlfile = os.path.abspath('pyproject.toml')
+    if tomlfile is not None:
+        # parsed once, the hooks get the parsed file from memory
+        _config.read_toml(tomlfile)
+
+    stdout = sys.stdout
+    output = HookOutput(stdout)
+    sys.stdout = output
+    results = []
+    try:
+        concurrent = [h for h in hooks if not HOOKS[h][2]]
+        alone = [h for h in hooks if HOOKS[h][2]]
+        with ThreadPoolExecutor(max(1, jobs)) as pool:
+            futures = [pool.submit(run_hook, h, filenames, tomlfile, output,
+                                   options)
+                       for h in concurrent]
+            for future in as_completed(futures):
+                results.append(future.result())
+                report(results[-1], stdout)
+        for hook in alone:
+            results.append(run_hook(hook, filenames, tomlfile, output,
+                                    options))
+            report(results[-1], stdout)
+    finally:
+        sys.stdout = stdout
+    failed = [name for name, code, *_ in results if code not in (None, 0)]
+    total = sum(duration for _, _, duration, _ in results)
+    print(f"\n{len(results) - len(failed)} of {len(results)} hooks passed "
+          f"({total:.2f}s in total).")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:  # pragma: no cover
+    description = """\
+    run_hooks.py
+
+    Runs several hooks of this package in one process. Use
+    `pre-commit-hooks run --hooks run-pycodestyle run-coverage` to choose
+    the hooks.
+
+    """
+    description = textwrap.dedent(description)
+    parser = MyParser(description=description, add_help=True)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help='Run the hooks.')
+    run.add_argument(
+        'filenames', nargs='*',
+        help='The files to run the hooks on. Defaults to the staged files.',
+    )
+    run.add_argument(
+        '--hooks', nargs='+', default=DEFAULT_HOOKS, choices=list(HOOKS),
+        help=f"The hooks to run. Defaults to {' '.join(DEFAULT_HOOKS)}.",
+    )
+    run.add_argument(
+        '--all-files', action='store_true',
+        help='Run on all files tracked by git.',
+    )
+    run.add_argument(
+        '--config', default=None,
+        help='The toml file to read. Defaults to pyproject.toml.',
+    )
+    run.add_argument(
+        '--jobs', type=int, default=4,
+        help='The number of hooks running at the same time.',
+    )
+    run.add_argument(
+        '--branch', default=DEFAULT_OPTIONS['branch'],
+        help="The main branch checked by assert-version-advance. Defaults to "
+             "'main'.",
+    )
+    run.add_argument(
+        '--remote', default=DEFAULT_OPTIONS['remote'],
+        help="The remote checked by assert-version-advance. Defaults to "
+             "'origin'.",
+    )
+    args = parser.parse_args(argv)
+    return run_hooks(args.hooks, args.filenames, args.all_files, args.config,
+                     args.jobs, {'branch': args.branch, 'remote': args.remote})
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -9,7 +9,14 @@ from __future__ import annotations
 import argparse
 import textwrap
 import sys
-import subprocess
+import os
+import fnmatch
+import pathlib
+
+if __name__ == '__main__':
+    # run as a script, e.g. `python pre_commit_hooks/run_notebooks.py`
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from pre_commit_hooks import _process
 
 
 ################################################################################
@@ -17,7 +24,8 @@ import subprocess
 ################################################################################
 
 
-from typing import Optional, Sequence
+from typing import Any, Optional, Sequence, Dict
+OptionsDict = Dict[str, Any]
 
 
 ################################################################################
@@ -32,21 +40,55 @@ class MyParser(argparse.ArgumentParser):
         sys.exit(2)
 
 
+################################################################################
+# Utils
+################################################################################
+
+
+def make_config(tomlfile: Optional[str] = None) -> OptionsDict:
+    from pre_commit_hooks import _config
+    defaults, default_str = _config.load_config('run_notebooks', tomlfile)
+
+    if defaults['verbose'] > 2:
+        print(f"Printing the settings for this run of run_notebooks:\n"
+              f"{default_str}:\n"
+              f"excluded_files:  {defaults['excluded_files']}\n"
+              f"timeout:         {defaults['timeout']}\n"
+              f"kernel:          {defaults['kernel']}\n"
+              f"verbose:         {defaults['verbose']}\n")
+    return defaults
+
+
+def is_excluded(filename: str, config: OptionsDict) -> bool:
+    return any(fnmatch.fnmatch(filename, p)
+               or fnmatch.fnmatch(os.path.basename(filename), p)
+               for p in config['excluded_files'])
+
+
 ################################################################################
 # Main
 ################################################################################
 
 
-def run_notebooks(filenames: Sequence[str]) -> int:
+def run_notebooks(filenames: Sequence[str],
+                  tomlfile: Optional[str] = None) -> int:
     if not any([f.endswith('.ipynb') for f in filenames]):
         return 1
+    config = make_config(tomlfile)
     for filename in filenames:
-        if filename.endswith('ipynb'):
-            print(f"Clearing cells of {filename}")
+        if filename.endswith('ipynb') and is_excluded(filename, config):
+            if config['verbose']:
+                print(f"Skipping excluded notebook {filename}")
+        elif filename.endswith('ipynb'):
+            print(f"Running {filename}")
             cmd = (f'jupyter nbconvert --to notebook --execute --inplace {filename}')
-            return_code = subprocess.call(cmd.split())
+            if config['timeout'] is not None:
+                cmd += f' --ExecutePreprocessor.timeout={config["timeout"]}'
+            if config['kernel'] is not None:
+                cmd += f' --ExecutePreprocessor.kernel_name={config["kernel"]}'
+            return_code = _process.call(cmd.split())
             if return_code != 0:
-                print(f"Failed to clear cells of notebook at {filename}.")
+                print(f"Failed to run notebook at {filename}.")
                 return return_code
         else:
             print(f"File {filename} is not a .ipynb file")
@@ -66,7 +108,7 @@ def main(argv: Optional[Sequence[str]] = None) -> int:  # pragma: no cover
         help='The files to run this pre-commit hook on.',
     )
     args = parser.parse_args(argv)
-    return clear_notebooks(args.filenames)
+    return run_notebooks(args.filenames)
 
 
 if __name__ == '__main__':
@@ -11,19 +11,17 @@ are raised, the script exists with exit code 0.
 
 
 from __future__ import annotations
-
-import copy
-
-import pycodestyle
-from pycodestyle import StyleGuide
 import sys
 from io import StringIO
 import textwrap
 import argparse
 import pathlib
-import toml
 import os
 
+if __name__ == '__main__':
+    # run as a script, e.g. `python pre_commit_hooks/run_pycodestyle.py`
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
 
 ################################################################################
 # Typing
@@ -42,12 +40,21 @@ OptionsDict = Dict[str, Union[List[str], int, bool]]
 class Capturing(list):
     def __enter__(self):
         self._stdout = sys.stdout
-        sys.stdout = self._stringio = StringIO()
+        self._stringio = StringIO()
+        # `pre-commit-hooks run` captures the output of every thread separately
+        self._redirect = getattr(sys.stdout, 'redirect', None)
+        if self._redirect is not None:
+            self._previous = self._redirect(self._stringio)
+        else:
+            sys.stdout = self._stringio
         return self
     def __exit__(self, *args):
         self.extend(self._stringio.getvalue().splitlines())
         del self._stringio    # free up some memory
-        sys.stdout = self._stdout
+        if self._redirect is not None:
+            self._redirect(self._previous)
+        else:
+            sys.stdout = self._stdout
 
 
 class MyParser(argparse.ArgumentParser):
@@ -101,20 +108,8 @@ def sort_w_and_e(strings: Sequence[str],
 
 
 def make_config(tomlfile: Optional[Union[str, None]] = None) -> OptionsDict:
-    defaults = {'excluded_lines': [], 'paths': None, 'excluded_files': [],
-                'excluded_errors': [], 'max_line_length': 79, 'verbose': False}
-    default_str = "Default values have been used."
-    if tomlfile is None:
-        toml_path = pathlib.Path("pyproject.toml").resolve()
-        if toml_path.is_file():
-            tomlfile = str(toml_path)
-
-    if tomlfile is not None:
-        with open(tomlfile) as f:
-            data = toml.load(f)
-        settings = data.get("tool", {}).get("run_pycodestyle", {})
-        defaults.update(settings)
-        default_str = f"Values have been loaded from {tomlfile}"
+    from pre_commit_hooks import _config
+    defaults, default_str = _config.load_config('run_pycodestyle', tomlfile)
 
     if defaults['verbose'] > 2:
         print(f"Printing the settings for this run of pycodestyle:\n"
@@ -131,6 +126,9 @@ def make_config(tomlfile: Optional[Union[str, None]] = None) -> OptionsDict:
 
 def run_pycodestyle(filenames: Sequence[str],
                     tomlfile: Optional[Union[str, None]] = None) -> int:
+    import copy
+    import pycodestyle
+    from pycodestyle import StyleGuide
     sum_errors = 0
     sum_warnings = 0
 
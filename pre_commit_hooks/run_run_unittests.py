@@ -11,7 +11,15 @@ from __future__ import annotations
 import textwrap
 import argparse
 import sys
-import subprocess
+import os
+import pathlib
+import time
+import importlib.util
+
+if __name__ == '__main__':
+    # run as a script, e.g. `python pre_commit_hooks/run_run_unittests.py`
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from pre_commit_hooks import _process
 
 
 ################################################################################
@@ -19,7 +27,7 @@ import subprocess
 ################################################################################
 
 
-from typing import Optional, Sequence, List, Union, Tuple, Dict
+from typing import Optional, Sequence, List, Union, Dict
 OptionsDict = Dict[str, Union[List[str], int, bool]]
 
 
@@ -40,8 +48,189 @@ class MyParser(argparse.ArgumentParser):
 ################################################################################
 
 
-def run_run_unittests() -> int:
-    proc = subprocess.call(['python', 'tests/run_unittests.py'])
+def make_config(tomlfile: Optional[Union[str, None]] = None) -> OptionsDict:
+    from pre_commit_hooks import _config
+    defaults, default_str = _config.load_config('run_run_unittests', tomlfile)
+
+    if defaults['verbose'] > 2:
+        print(f"Printing the settings for this run of run_run_unittests:\n"
+              f"{default_str}:\n"
+              f"workers:         {defaults['workers']}\n"
+              f"start_method:    {defaults['start_method']}\n"
+              f"preload:         {defaults['preload']}\n"
+              f"affected_only:   {defaults['affected_only']}\n"
+              f"full_run:        {defaults['full_run']}\n"
+              f"include_tests:   {defaults['include_tests']}\n"
+              f"exclude_tests:   {defaults['exclude_tests']}\n"
+              f"verbose:         {defaults['verbose']}")
+
+    return defaults
+
+
+def add_cwd_to_path() -> None:
+    """Makes the packages of the project importable for `preload`."""
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+
+
+def select_affected(test_ids: List[str], filenames: Sequence[str],
+                    config: OptionsDict, top_level_dir: str) -> List[str]:
+    """Keeps the tests of the test modules, that import a changed file.
+
+    All tests are kept, if the changes force a full run.
+
+    """
+    from pre_commit_hooks import _imports
+    affected = _imports.affected_files(filenames, os.getcwd(),
+                                       config['full_run'])
+    if affected is None:
+        return test_ids
+    modules = {_imports.module_name(f, top_level_dir) for f in affected}
+    selected = [test_id for test_id in test_ids
+                if any(test_id.startswith(m + '.') for m in modules)]
+    if config['verbose']:
+        print(f"Running {len(selected)} of {len(test_ids)} tests affected by "
+              f"the changed files.")
+    return selected
+
+
+def run_sharded(config: OptionsDict, slowest: int = 0,
+                filenames: Sequence[str] = ()) -> int:
+    """Discovers the tests and runs them in `config['workers']` processes.
+
+    If `filenames` are given, only the tests affected by them are run.
+
+    """
+    import unittest
+    from pre_commit_hooks import _testing
+    add_cwd_to_path()
+    top_level_dir = os.path.split(os.getcwd())[0]
+    select = _testing.TestSelector(config['include_tests'],
+                                   config['exclude_tests'])
+    loader = unittest.TestLoader()
+    suite = _testing.discover(loader, os.getcwd(), top_level_dir,
+                              select=select)
+    # modules, that can't be imported, are reported instead of being run
+    test_ids = [i for i in _testing.iter_ids(suite)
+                if not i.startswith('unittest.loader.')]
+    for error in loader.errors:
+        print(error)
+    if filenames:
+        test_ids = select_affected(test_ids, filenames, config, top_level_dir)
+        if not test_ids:
+            print("No tests are affected by the changed files.")
+            return 0
+    successful, durations = _testing.run_sharded(
+        test_ids, config['workers'], top_level_dir,
+        verbosity=config['verbose'], start_method=config['start_method'],
+        preload=config['preload'],
+    )
+    _testing.record_durations(durations)
+    _testing.report_durations(durations, slowest)
+    return 0 if successful and not loader.errors else 1
+
+
+def module_files(names: Sequence[str]) -> List[str]:
+    """Returns the files or package directories of importable modules."""
+    files = []
+    for name in names:
+        try:
+            spec = importlib.util.find_spec(name)
+        except (ImportError, ValueError):
+            continue
+        if spec is None:
+            continue
+        if spec.submodule_search_locations:
+            files.extend(spec.submodule_search_locations)
+        elif spec.origin is not None:
+            files.append(spec.origin)
+    return [os.path.abspath(f) for f in files]
+
+
+def watch(config: OptionsDict, slowest: int = 0, interval: float = 1.0,
+          max_runs: Optional[int] = None) -> int:
+    """Runs the tests again, whenever a .py file changes.
+
+    The .py files below the current directory are polled every `interval`
+    seconds. Test modules, that changed, are dropped from `sys.modules`
+    before the next discovery. If a changed file belongs to one of the
+    modules in `config['preload']`, the fork server is restarted, or the
+    'spawn' start method is used, if it can't be restarted.
+
+    Returns:
+        int: The exit code of the last run.
+
+    """
+    from pre_commit_hooks import _cache, _testing
+    root = os.getcwd()
+    add_cwd_to_path()
+    preloaded = module_files(config['preload'])
+    previous = None
+    runs = result = 0
+    try:
+        while True:
+            current = _cache.manifest(_cache.python_files(root), previous)
+            if previous is None or _cache.manifest_changed(previous, current):
+                if previous is not None:
+                    changed = {f for f in current.keys() | previous.keys()
+                               if current.get(f) != previous.get(f)}
+                    for name, module in list(sys.modules.items()):
+                        file = getattr(module, '__file__', None)
+                        if file and os.path.abspath(file) in changed:
+                            del sys.modules[name]
+                    if any(f == p or f.startswith(p + os.sep)
+                           for f in changed for p in preloaded):
+                        if not _testing.stop_forkserver():
+                            # the workers would be forked with the old imports
+                            print("Can't restart the fork server. Using the "
+                                  "'spawn' start method.")
+                            config = dict(config, start_method='spawn')
+                result = run_sharded(config, slowest)
+                runs += 1
+                if max_runs is not None and runs >= max_runs:
+                    return result
+                print(f"\nWatching {root} for changes. Press Ctrl+C to stop.",
+                      flush=True)
+            previous = current
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return result
+
+
+def run_run_unittests(slowest: int = 0,
+                      tomlfile: Optional[Union[str, None]] = None,
+                      watch_: bool = False,
+                      filenames: Sequence[str] = ()) -> int:
+    config = make_config(tomlfile)
+    if watch_:
+        return watch(config, slowest)
+    if config['affected_only'] and filenames:
+        return run_sharded(config, slowest, filenames)
+    if config['workers'] > 1 or config['start_method'] == 'forkserver':
+        return run_sharded(config, slowest)
+    # tests/run_unittests.py takes no arguments. Selecting the tests affected
+    # by the staged files needs `affected_only`, which uses the sharded runner
+    if slowest <= 0:
+        return _process.call([sys.executable, 'tests/run_unittests.py'])
+    # tests/run_unittests.py records the durations of its tests with
+    # `record_durations`, which also writes them to the file named in the env
+    import json
+    import tempfile
+    from pre_commit_hooks import _testing
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_file = os.path.join(tmpdir, 'durations.json')
+        env = dict(os.environ, **{_testing.RUN_DURATIONS_ENV: run_file})
+        proc = _process.call([sys.executable, 'tests/run_unittests.py'],
+                             env=env)
+        try:
+            with open(run_file) as f:
+                durations = json.load(f)
+        except (OSError, ValueError):
+            durations = {}
+    if durations:
+        _testing.report_durations(durations, slowest)
+    else:
+        print("tests/run_unittests.py recorded no durations.")
     return proc
 
 
@@ -49,7 +238,7 @@ def main(argv: Optional[Sequence[str]] = None) -> int:  # pragma: no cover
     description = """\
     run_run_unittests.py
 
-    A script to run pycodestyle automatically with pre-commit
+    A script to run the unit tests automatically with pre-commit
 
     """
     description = textwrap.dedent(description)
@@ -58,9 +247,20 @@ def main(argv: Optional[Sequence[str]] = None) -> int:  # pragma: no cover
         'filenames', nargs='*',
         help='The files to run this pre-commit hook on.',
     )
+    parser.add_argument(
+        '--slowest', type=int, default=0,
+        help='Print the N slowest tests recorded by tests/run_unittests.py.'
+    )
+    parser.add_argument(
+        '--watch', action='store_true',
+        help='Run the tests again, whenever a .py file changes.'
+    )
     if argv is not None:
         args = parser.parse_args(argv)
-    return run_run_unittests()
+    else:
+        args = parser.parse_known_args()[0]
+    return run_run_unittests(slowest=args.slowest, watch_=args.watch,
+                             filenames=args.filenames)
 
 
 if __name__ == '__main__':
@@ -28,10 +28,11 @@ setup(name='pre_commit_hooks',
               'clear-ipynb-cells = pre_commit_hooks.clear_ipynb_cells:main',
               'run-ipynb = pre_commit_hooks.run_notebooks:main',
               'run-pycodestyle = pre_commit_hooks.run_pycodestyle:main',
-              'test-hook = pre_commit_hooks.test_hooks_always_true:main',
+              'test-hook = pre_commit_hooks.test_hook_always_true:main',
               'run-run-unittests = pre_commit_hooks.run_run_unittests:main',
               'run-coverage = pre_commit_hooks.run_coverage:main',
               'assert-version-advance = pre_commit_hooks.assert_version_advance:main',
+              'pre-commit-hooks = pre_commit_hooks.run_hooks:main',
           ]
       },
       classifiers=[
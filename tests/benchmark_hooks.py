@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+"""Benchmarks of the hooks on synthetic projects.
+
+The projects are generated at a configurable scale: notebooks with large
+outputs, python files with style violations, git histories with many commits
+and tags and test suites with many tests. Every hook is timed and its peak
+python allocations are measured with tracemalloc (memory used by subprocesses
+like nbconvert is not included). The results are saved as json and two
+result files can be compared::
+
+    python tests/benchmark_hooks.py run --files 500 --output new.json
+    python tests/benchmark_hooks.py compare old.json new.json
+
+"""
+################################################################################
+# Imports
+################################################################################
+
+
+import argparse
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import tracemalloc
+
+
+################################################################################
+# Typing
+################################################################################
+
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+Scale = Dict[str, int]
+Benchmark = Tuple[Callable[[], int], Optional[Callable[[], None]]]
+
+
+################################################################################
+# Globals
+################################################################################
+
+
+SCALE = {
+    'notebooks': 5,  # number of notebooks
+    'notebook_output': 1000,  # lines of output in every notebook
+    'files': 100,  # number of python files
+    'violations': 10,  # style violations in every python file
+    'commits': 500,  # commits in the git history
+    'tags': 20,  # tags in the git history
+    'tests': 200,  # tests in the test suite
+}
+
+
+VIOLATIONS = ['x=1', 'y = [1,2]', 'z = 1  ', 'def f( a):\n    return a']
+
+
+################################################################################
+# Fixtures
+################################################################################
+
+
+def git(cwd: str, *args: str, **kwargs) -> str:
+    return subprocess.run(
+        ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@bench',
+         '-c', 'commit.gpgsign=false', *args],
+        cwd=cwd, check=True, capture_output=True, text=True, **kwargs,
+    ).stdout
+
+
+def write_notebooks(root: str, n: int, output_lines: int) -> List[str]:
+    """Writes `n` executed notebooks, the i-th with `output_lines * i / n`
+    lines of output."""
+    files = []
+    for i in range(n):
+        lines = max(1, output_lines * (i + 1) // n)
+        cell = {
+            'cell_type': 'code', 'execution_count': 1, 'metadata': {},
+            'source': [f'for i in range({lines}):\n', '    print(i)'],
+            'outputs': [{'name': 'stdout', 'output_type': 'stream',
+                         'text': [f'{j}\n' for j in range(lines)]}],
+        }
+        notebook = {
+            'cells': [cell],
+            'metadata': {'kernelspec': {'display_name': 'Python 3',
+                                        'language': 'python',
+                                        'name': 'python3'}},
+            'nbformat': 4, 'nbformat_minor': 4,
+        }
+        file = os.path.join(root, f'notebook_{i}.ipynb')
+        with open(file, 'w') as f:
+            json.dump(notebook, f)
+        files.append(file)
+    return files
+
+
+def write_python_files(root: str, n: int, violations: int) -> List[str]:
+    """Writes `n` python files with `violations` style violations each."""
+    files = []
+    for i in range(n):
+        lines = [f'"""Module {i}."""', '', '']
+        for j in range(20):
+            lines += [f'def func_{j}(x):', f'    return x + {j}', '', '']
+        for j in range(violations):
+            lines.append(VIOLATIONS[j % len(VIOLATIONS)])
+        file = os.path.join(root, f'module_{i}.py')
+        with open(file, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        files.append(file)
+    return files
+
+
+def write_test_suite(root: str, n_tests: int) -> None:
+    """Writes a package with a module and `n_tests` tests of it."""
+    with open(os.path.join(root, '__init__.py'), 'w') as f:
+        f.write('')
+    with open(os.path.join(root, 'mod.py'), 'w') as f:
+        f.write(''.join(f'def func_{i}(x):\n    return x + {i}\n\n\n'
+                        for i in range(10)))
+    per_file = 50
+    for k in range(0, n_tests, per_file):
+        lines = ['import unittest', 'from . import mod', '', '',
+                 'class TestMod(unittest.TestCase):']
+        for i in range(k, min(k + per_file, n_tests)):
+            lines += [f'    def test_{i}(self):',
+                      f'        self.assertEqual(mod.func_{i % 10}(0), '
+                      f'{i % 10})', '']
+        with open(os.path.join(root, f'test_mod_{k // per_file}.py'), 'w') as f:
+            f.write('\n'.join(lines))
+    with open(os.path.join(root, 'pyproject.toml'), 'w') as f:
+        f.write('[tool.run_coverage]\nthreshold = 0\n')
+
+
+def write_history(root: str, n_commits: int, n_tags: int) -> None:
+    """Creates a repository with `n_commits` commits and a bare remote.
+
+    Every commit advances the version in setup.py and changes one of ten
+    modules. `n_tags` evenly spaced commits are tagged with their version.
+    The history is written with a single `git fast-import`. A local commit
+    with a higher version is added on top, like before a push.
+
+    """
+    setup_py = ("from setuptools import setup\n"
+                "version = '0.0.{}'\n"
+                "setup(name='pkg', version=version)\n")
+    every = max(1, n_commits // max(1, n_tags))
+    stream = []
+    for i in range(n_commits):
+        files = {'setup.py': setup_py.format(i),
+                 f'pkg/mod_{i % 10}.py': f'__version__ = "0.0.{i}"\n'}
+        stream.append(f'commit refs/heads/main\nmark :{i + 1}\n'
+                      f'committer bench <bench@bench> {1600000000 + i} +0000\n'
+                      f'data {len(str(i))}\n{i}\n')
+        if i > 0:
+            stream.append(f'from :{i}\n')
+        for name, content in files.items():
+            data = content.encode()
+            stream.append(f'M 100644 inline {name}\ndata {len(data)}\n'
+                          f'{content}\n')
+        if (n_commits - 1 - i) % every == 0 and n_tags:
+            stream.append(f'reset refs/tags/0.0.{i}\nfrom :{i + 1}\n\n')
+    git(root, 'init', '-q')
+    git(root, 'fast-import', '--quiet', input=''.join(stream))
+    git(root, 'symbolic-ref', 'HEAD', 'refs/heads/main')
+    git(root, 'reset', '-q', '--hard')
+    remote = root + '.git'
+    git(root, 'clone', '-q', '--bare', root, remote)
+    git(root, 'remote', 'add', 'origin', remote)
+    git(root, 'fetch', '-q', 'origin')
+    with open(os.path.join(root, 'setup.py'), 'w') as f:
+        f.write(setup_py.format(n_commits))
+    git(root, 'commit', '-qam', 'advance')
+    git(root, 'tag', f'0.0.{n_commits}')
+
+
+################################################################################
+# Benchmarks
+################################################################################
+
+
+def quiet(func: Callable[..., int], *args, **kwargs) -> Callable[[], int]:
+    """Runs `func` with its output captured."""
+    def run():
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        with Capturing():
+            return func(*args, **kwargs)
+    return run
+
+
+def bench_clear_notebooks(root: str, scale: Scale) -> Benchmark:
+    from pre_commit_hooks.clear_ipynb_cells import clear_notebooks
+    files = write_notebooks(root, scale['notebooks'], scale['notebook_output'])
+
+    def reset():
+        write_notebooks(root, scale['notebooks'], scale['notebook_output'])
+
+    return quiet(clear_notebooks, files), reset
+
+
+def bench_run_notebooks(root: str, scale: Scale) -> Benchmark:
+    from pre_commit_hooks.run_notebooks import run_notebooks
+    files = write_notebooks(root, scale['notebooks'], scale['notebook_output'])
+    return quiet(run_notebooks, files), None
+
+
+def bench_run_pycodestyle(root: str, scale: Scale) -> Benchmark:
+    from pre_commit_hooks.run_pycodestyle import run_pycodestyle
+    files = write_python_files(root, scale['files'], scale['violations'])
+    return quiet(run_pycodestyle, files), None
+
+
+def bench_run_coverage(root: str, scale: Scale) -> Benchmark:
+    from pre_commit_hooks.run_coverage import run_coverage
+    write_test_suite(root, scale['tests'])
+    return quiet(run_coverage, 'pyproject.toml'), None
+
+
+def bench_assert_version_advance(root: str, scale: Scale) -> Benchmark:
+    from pre_commit_hooks.assert_version_advance import assert_version_advance
+    write_history(root, scale['commits'], scale['tags'])
+    return quiet(assert_version_advance, [], offline=True), None
+
+
+def bench_assert_version_advance_full_scan(root: str, scale: Scale
+                                           ) -> Benchmark:
+    from pre_commit_hooks.assert_version_advance import assert_version_advance
+    write_history(root, scale['commits'], scale['tags'])
+    return quiet(assert_version_advance, [], offline=True, full_scan=True), None
+
+
+BENCHMARKS = {
+    'clear_notebooks': (bench_clear_notebooks, 'jupyter'),
+    'run_notebooks': (bench_run_notebooks, 'jupyter'),
+    'run_pycodestyle': (bench_run_pycodestyle, None),
+    'run_coverage': (bench_run_coverage, None),
+    'assert_version_advance': (bench_assert_version_advance, 'git'),
+    'assert_version_advance_full_scan': (
+        bench_assert_version_advance_full_scan, 'git'),
+}
+
+
+################################################################################
+# Utils
+################################################################################
+
+
+def measure(run: Callable[[], int], reset: Optional[Callable[[], None]],
+            repeat: int) -> Dict[str, Any]:
+    """Times `repeat` runs and measures the peak allocations of one more run.
+
+    tracemalloc slows python code down, so the traced run is not timed.
+    `reset` is called before every run and is not timed either.
+
+    """
+    times = []
+    exit_code = None
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        exit_code = run()
+        times.append(time.perf_counter() - start)
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'times': times, 'first': times[0],
+            'median': statistics.median(times), 'peak_memory': peak,
+            'exit_code': exit_code}
+
+
+def revision() -> Optional[str]:
+    try:
+        return git(os.path.dirname(os.path.abspath(__file__)),
+                   'rev-parse', 'HEAD').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scale: Optional[Scale] = None,
+                   only: Optional[Sequence[str]] = None,
+                   repeat: int = 3) -> Dict[str, Any]:
+    """Runs the benchmarks in fresh temporary projects.
+
+    Args:
+        scale (Optional[Scale]): Overrides of `SCALE`.
+        only (Optional[Sequence[str]]): The names of the benchmarks to run.
+            Defaults to None, in which case all benchmarks are run.
+        repeat (int): The number of timed runs of every benchmark.
+
+    Returns:
+        Dict[str, Any]: The results with the scale, the python version and
+            the git revision of this repository.
+
+    """
+    scale = {**SCALE, **(scale or {})}
+    results = {}
+    for name, (bench, tool) in BENCHMARKS.items():
+        if only is not None and name not in only:
+            continue
+        if tool is not None and shutil.which(tool) is None:
+            results[name] = {'skipped': f'{tool} is not installed'}
+            continue
+        root = tempfile.mkdtemp(prefix=f'bench_{name}_')
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            run, reset = bench(root, scale)
+            results[name] = measure(run, reset, repeat)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(root, ignore_errors=True)
+            shutil.rmtree(root + '.git', ignore_errors=True)
+        print(f"{name:<35}{results[name]['median']:9.3f} s"
+              f"{results[name]['peak_memory'] / 2 ** 20:9.1f} MB")
+    return {'revision': revision(), 'python': platform.python_version(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'scale': scale,
+            'repeat': repeat, 'results': results}
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any],
+            threshold: float = 1.2) -> int:
+    """Prints the change of the median times and peak allocations.
+
+    Returns:
+        int: 1, if a benchmark got slower or allocates more than `threshold`
+            times the old value, 0 otherwise.
+
+    """
+    if old['scale'] != new['scale']:
+        print(f"Warning: The scales differ: {old['scale']} and {new['scale']}.")
+    regressions = []
+    print(f"{'benchmark':<35}{'old':>9}{'new':>9}{'ratio':>7}"
+          f"{'old MB':>9}{'new MB':>9}{'ratio':>7}")
+    for name, result in new['results'].items():
+        before = old['results'].get(name)
+        if 'median' not in result or before is None or 'median' not in before:
+            continue
+        time_ratio = result['median'] / max(before['median'], 1e-9)
+        memory_ratio = result['peak_memory'] / max(before['peak_memory'], 1)
+        print(f"{name:<35}{before['median']:9.3f}{result['median']:9.3f}"
+              f"{time_ratio:7.2f}{before['peak_memory'] / 2 ** 20:9.1f}"
+              f"{result['peak_memory'] / 2 ** 20:9.1f}{memory_ratio:7.2f}")
+        if time_ratio > threshold or memory_ratio > threshold:
+            regressions.append(name)
+    if regressions:
+        print(f"\nRegressions (more than {threshold:.2f} times the old "
+              f"value): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+################################################################################
+# Main
+################################################################################
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    description = """\
+    benchmark_hooks.py
+
+    Benchmarks the hooks on synthetic projects and compares the results
+    of two revisions.
+
+    """
+    parser = argparse.ArgumentParser(description=textwrap.dedent(description))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help='Run the benchmarks.')
+    for key, value in SCALE.items():
+        run.add_argument(f"--{key.replace('_', '-')}", type=int,
+                         default=value, help=f'Default is {value}.')
+    run.add_argument('--repeat', type=int, default=3,
+                     help='The number of timed runs. Default is 3.')
+    run.add_argument('--only', nargs='+', choices=list(BENCHMARKS),
+                     help='The benchmarks to run. Default is all.')
+    run.add_argument('--output', default=None,
+                     help='The json file to write the results to.')
+    cmp = subparsers.add_parser('compare', help='Compare two result files.')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=1.2,
+                     help='The ratio counted as a regression. Default is 1.2.')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        return compare(old, new, args.threshold)
+    scale = {key: getattr(args, key) for key in SCALE}
+    results = run_benchmarks(scale, args.only, args.repeat)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+    raise SystemExit(main())
@@ -1,57 +1,24 @@
 import unittest
 import os
 
-FORBIDDEN_METHODS = [
-    "test_coverage_with",
-    "test_assert_version_advance",
+EXCLUDE_TESTS = [
+    "*.test_coverage_with*",
+    "*.test_assert_version_advance*",
 ]
 
-def unittests_not_leading_to_recursion(tests):
-    """Gives sorting keys for `unittest.TestSuite` instances based on a substring.
 
-    Args:
-        tests (unittest.TestSuite): The test-suite or sub-test suite to use
-            and return 1 if the substring is in the method names and 2 otherwise.
-
-    Keyword Args:
-        method_substring (str, optional): The substring that should be executed
-            first. Defaults to 'quickstart'.
-        even_higher_prio (list[str], optional): A list of strings that should have
-            even higher priority.
-
-    Returns:
-        int: Either 1 or 2 to be used in sorting.
-
-    """
-    if hasattr(tests, '__iter__'):
-        iterable = tests
-    else:
-        if any([f in tests._testMethodName for f in FORBIDDEN_METHODS]):
-            return False
-        else:
-            return True
-    for test in iterable:
-        if isinstance(test, SortableSuite):
-            test.sort()
-        else:
-            raise NotImplementedError()
-    return True
-
-
-class SortableSuite(unittest.TestSuite):
-    def sort(self):
-        if hasattr(self, '_tests'):
-            self._tests = list(filter(unittests_not_leading_to_recursion, self._tests))
-
-def main(verbosity=0):
+def main(verbosity=0, use_index=True):
+    from pre_commit_hooks._testing import (discover, TestSelector,
+                                           TimedResult, record_durations)
     loader = unittest.TestLoader()
-    loader.suiteClass = SortableSuite
-    test_suite = loader.discover(start_dir=os.getcwd(),
-                                 top_level_dir=os.path.split(os.getcwd())[0])
-    test_suite.sort()
+    test_suite = discover(loader, start_dir=os.getcwd(),
+                          top_level_dir=os.path.split(os.getcwd())[0],
+                          select=TestSelector(exclude=EXCLUDE_TESTS),
+                          use_index=use_index)
     # runner = unittest.TextTestRunner(verbosity=verbosity)
-    result = unittest.result.TestResult()
+    result = TimedResult()
     test_suite.run(result)
+    record_durations(getattr(result, 'durations', {}))
     print("Unittest result: ", result.wasSuccessful())
     if not result.wasSuccessful():
         exit(1)
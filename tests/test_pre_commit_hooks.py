@@ -9,6 +9,10 @@ import os
 import json
 import glob
 import subprocess
+import sys
+import tempfile
+import textwrap
+import multiprocessing
 
 
 ################################################################################
@@ -27,6 +31,80 @@ def is_notebook_executed(filepath):
         return False
 
 
+def make_tmpdir(test):
+    """Creates a temporary directory, that is removed after `test`."""
+    tmpdir = tempfile.TemporaryDirectory()
+    test.addCleanup(tmpdir.cleanup)
+    return tmpdir.name
+
+
+def make_git_project(test, files):
+    """Creates a temporary, committed git repository containing `files`.
+
+    The directory contains an `__init__.py`, so that it can be used as
+    a start directory for unittest discovery. It is removed after `test`.
+
+    """
+    tmpdir = make_tmpdir(test)
+    files = {'__init__.py': ''} | files
+    for name, content in files.items():
+        path = os.path.join(tmpdir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent(content))
+    git(tmpdir, 'init', '-q')
+    git(tmpdir, 'add', '-A')
+    git(tmpdir, 'commit', '-q', '-m', 'initial')
+    return tmpdir
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@test',
+         '-c', 'commit.gpgsign=false', *args],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout
+
+
+class chdir:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.old = os.getcwd()
+        os.chdir(self.path)
+
+    def __exit__(self, *args):
+        os.chdir(self.old)
+
+
+MODULE = """\
+def a(x):
+    return x + 1
+
+
+def b(x):
+    y = x * 2
+    return y
+"""
+
+
+TEST_MODULE = """\
+import unittest
+from .mod import a, b
+
+
+class TestA(unittest.TestCase):
+    def test_a(self):
+        self.assertEqual(a(1), 2)
+
+
+class TestB(unittest.TestCase):
+    def test_b(self):
+        self.assertEqual(b(1), 2)
+"""
+
+
 ################################################################################
 # Unittest Classes
 ################################################################################
@@ -43,6 +121,16 @@ class TestPreCommitHooksGeneralDocstyle(unittest.TestCase):
                 shebang = open(file).readline().rstrip()
                 self.assertEqual(self.SHEBANG, shebang)
 
+    def test_hooks_run_as_scripts(self):
+        cwd = make_tmpdir(self)
+        for file in self.FILES:
+            if not os.path.basename(file).startswith('_'):
+                with self.subTest(file=os.path.basename(file)):
+                    proc = subprocess.run([sys.executable, file, '--help'],
+                                          cwd=cwd, capture_output=True,
+                                          text=True)
+                    self.assertEqual(proc.returncode, 0, msg=proc.stderr)
+
 
 class TestRunRunUnittests(unittest.TestCase):
 
@@ -55,6 +143,175 @@ class TestRunRunUnittests(unittest.TestCase):
         proc = subprocess.call([f'{module.__file__}'])
         self.assertEqual(0, proc)
 
+    def test_sharded_run(self):
+        from pre_commit_hooks.run_run_unittests import run_run_unittests
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        failing = TEST_MODULE.replace('TestB', 'TestFailing').replace(
+            'self.assertEqual(b(1), 2)', 'self.assertEqual(b(1), 3)')
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE,
+            'test_other.py': TEST_MODULE.replace('TestA', 'TestC'),
+            'pyproject.toml': '[tool.run_run_unittests]\nworkers = 2\n',
+        })
+        with chdir(project):
+            with Capturing() as output:
+                self.assertEqual(run_run_unittests(tomlfile='pyproject.toml'), 0)
+            self.assertIn('Ran 4 tests', '\n'.join(output))
+            self.assertIn('OK', output)
+
+            with open('test_failing.py', 'w') as f:
+                f.write(failing)
+            with Capturing() as output:
+                self.assertEqual(run_run_unittests(tomlfile='pyproject.toml'), 1)
+        output = '\n'.join(output)
+        self.assertIn('Ran 6 tests', output)
+        self.assertIn('FAIL: ', output)
+        self.assertIn('test_failing.TestFailing.test_b', output)
+        self.assertIn('AssertionError: 2 != 3', output)
+        self.assertIn('FAILED (failures=1)', output)
+
+        # a module, that can't be imported, fails the run
+        with chdir(project):
+            os.remove('test_failing.py')
+            with open('test_broken.py', 'w') as f:
+                f.write('raise RuntimeError("boom")\n')
+            with Capturing() as output:
+                self.assertEqual(run_run_unittests(tomlfile='pyproject.toml'), 1)
+        output = '\n'.join(output)
+        self.assertIn('Ran 4 tests', output)
+        self.assertIn('RuntimeError: boom', output)
+
+    @unittest.skipIf('forkserver' not in multiprocessing.get_all_start_methods(),
+                     'The forkserver start method is not available.')
+    def test_watch_with_forkserver(self):
+        from unittest import mock
+        from pre_commit_hooks import _testing
+        from pre_commit_hooks.run_run_unittests import make_config, watch
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE,
+            'pyproject.toml': ("[tool.run_run_unittests]\n"
+                               "start_method = 'forkserver'\n"
+                               "preload = ['mod']\n"),
+        })
+
+        def change_code(interval):
+            with open('test_other.py', 'w') as f:
+                f.write(TEST_MODULE.replace('TestA', 'TestC'))
+            with open('mod.py', 'a') as f:
+                f.write('\n\ndef c():\n    return 3\n')
+
+        with chdir(project):
+            config = make_config('pyproject.toml')
+            with mock.patch.object(sys, 'path', sys.path[:]), \
+                    mock.patch('time.sleep', side_effect=change_code), \
+                    mock.patch('pre_commit_hooks._testing.stop_forkserver',
+                               wraps=_testing.stop_forkserver) as stop, \
+                    Capturing() as output:
+                self.assertEqual(watch(config, max_runs=2), 0)
+        output = '\n'.join(output)
+        self.assertIn('Ran 2 tests', output)
+        self.assertIn('Ran 4 tests', output)
+        stop.assert_called_once()
+
+        # without a way to restart the fork server, the workers are spawned
+        with chdir(project):
+            with mock.patch.object(sys, 'path', sys.path[:]), \
+                    mock.patch('time.sleep', side_effect=change_code), \
+                    mock.patch('pre_commit_hooks._testing.stop_forkserver',
+                               return_value=False), \
+                    Capturing() as output:
+                self.assertEqual(watch(config, max_runs=2), 0)
+        self.assertIn("Can't restart the fork server. Using the 'spawn' "
+                      "start method.", output)
+
+    def test_stop_forkserver_without_private_api(self):
+        from unittest import mock
+        from multiprocessing import forkserver
+        from pre_commit_hooks import _testing
+        with mock.patch.object(forkserver, '_forkserver', object()):
+            self.assertFalse(_testing.stop_forkserver())
+
+    def test_affected_only(self):
+        from pre_commit_hooks.run_run_unittests import run_run_unittests
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'other.py': 'def c(x):\n    return x\n',
+            'test_mod.py': TEST_MODULE,
+            'test_other.py': textwrap.dedent("""\
+                import unittest
+                from . import other
+
+
+                class TestC(unittest.TestCase):
+                    def test_c(self):
+                        self.assertEqual(other.c(1), 1)
+                """),
+            'pyproject.toml': '[tool.run_run_unittests]\naffected_only = true\n',
+        })
+        with chdir(project):
+            for filenames, n_tests in [(['other.py'], 1), (['mod.py'], 2),
+                                       (['mod.py', 'other.py'], 3),
+                                       (['pyproject.toml'], 3),
+                                       (['README.md', 'other.py'], 1)]:
+                with self.subTest(filenames=filenames):
+                    with Capturing() as output:
+                        run_run_unittests(tomlfile='pyproject.toml',
+                                          filenames=filenames)
+                    self.assertIn(f'Ran {n_tests} tests', '\n'.join(output))
+
+            with Capturing() as output:
+                self.assertEqual(run_run_unittests(
+                    tomlfile='pyproject.toml', filenames=['test_mod.py']), 0)
+            self.assertIn('Ran 2 tests', '\n'.join(output))
+
+            # docs don't affect any test
+            with Capturing() as output:
+                self.assertEqual(run_run_unittests(
+                    tomlfile='pyproject.toml', filenames=['README.md']), 0)
+            self.assertIn('No tests are affected', '\n'.join(output))
+
+    def test_imported_names(self):
+        from pre_commit_hooks._imports import imported_names
+        source = textwrap.dedent("""\
+            import os.path
+            from .. import sibling
+            from .helpers import *
+            import importlib
+            importlib.import_module('json')
+            """)
+        names, dynamic = imported_names(source, 'pkg.tests.test_x')
+        self.assertEqual(names, ['importlib', 'json', 'os.path', 'pkg',
+                                 'pkg.sibling', 'pkg.tests.helpers'])
+        self.assertFalse(dynamic)
+        names, dynamic = imported_names('__import__(name)', 'x')
+        self.assertTrue(dynamic)
+
+    def test_slowest_reports_this_run(self):
+        from pre_commit_hooks import _testing
+        from pre_commit_hooks.run_run_unittests import run_run_unittests
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        root = os.path.split(os.path.split(__file__)[0])[0]
+        run_unittests = textwrap.dedent(f'''\
+            import sys
+            sys.path.insert(0, {root!r})
+            from pre_commit_hooks._testing import record_durations
+            record_durations({{'tests.test_fast': 0.5}})
+            ''')
+        project = make_git_project(
+            self, {'tests/run_unittests.py': run_unittests})
+        with chdir(project):
+            _testing.record_durations({'stale.test': 9.0})
+            with Capturing() as output:
+                self.assertEqual(run_run_unittests(slowest=5), 0)
+            self.assertIn('stale.test', _testing.load_durations())
+        output = '\n'.join(output)
+        self.assertIn('tests.test_fast', output)
+        self.assertNotIn('stale.test', output)
+
     def test_run_run_unittests_myparser(self):
         from pre_commit_hooks.run_run_unittests import MyParser
         parser = MyParser(description='description', add_help=True)
@@ -74,6 +331,337 @@ class TestAssertVersionAdvance(unittest.TestCase):
         result = assert_version_advance([])
         self.assertEqual(result, 0, msg=f"The result of `assert_version_advance` is {result}")
 
+    def test_version_visitor(self):
+        import ast
+        from pre_commit_hooks.assert_version_advance import version_visitor
+        nodes = ast.parse("__version__ = '1.0.0'\n"
+                          "if True:\n    version = '1.1.0'\n"
+                          "name = 'pkg'\n")
+        # statements after an assignment don't reset the found versions
+        self.assertEqual(version_visitor.visit(nodes), ['1.0.0', '1.1.0'])
+
+    def test_offline_with_local_bare_remote(self):
+        from unittest import mock
+        from pre_commit_hooks.assert_version_advance import assert_version_advance
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        setup_py = ("from setuptools import setup\n"
+                    "version = '{}'\n"
+                    "setup(name='pkg', version=version)\n")
+        project = make_git_project(
+            self, {'setup.py': setup_py.format('0.1.0')})
+        git(project, 'branch', '-M', 'main')
+        git(project, 'tag', '0.1.0')
+        remote = os.path.join(make_tmpdir(self), 'remote.git')
+        git(project, 'clone', '-q', '--bare', project, remote)
+        git(project, 'remote', 'add', 'origin', remote)
+        git(project, 'fetch', '-q', 'origin')
+
+        with open(os.path.join(project, 'setup.py'), 'w') as f:
+            f.write(setup_py.format('0.2.0'))
+        git(project, 'commit', '-qam', 'advance')
+        git(project, 'tag', '0.2.0')
+
+        def run():
+            with mock.patch('requests.get') as get, Capturing() as output:
+                result = assert_version_advance([], offline=True)
+            get.assert_not_called()
+            return result, '\n'.join(output)
+
+        with chdir(project):
+            self.assertEqual(run()[0], 0)
+
+            # a higher version was tagged on the remote
+            git(remote, 'tag', '0.5.0', 'main')
+            result, output = run()
+            self.assertEqual(result, 1)
+            self.assertIn('The maximum remote version is 0.5.0', output)
+
+            # without the remote, the remote-tracking branch is used
+            git(project, 'remote', 'set-url', 'origin', remote + '.missing')
+            result, output = run()
+            self.assertEqual(result, 0)
+            self.assertIn('Could not reach the remote origin', output)
+
+    def test_offline_without_tags(self):
+        from pre_commit_hooks.assert_version_advance import assert_version_advance
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        setup_py = ("from setuptools import setup\n"
+                    "version = '{}'\n"
+                    "setup(name='pkg', version=version)\n")
+        project = make_git_project(
+            self, {'setup.py': setup_py.format('0.1.0')})
+        git(project, 'branch', '-M', 'main')
+        remote = os.path.join(make_tmpdir(self), 'remote.git')
+        git(project, 'clone', '-q', '--bare', project, remote)
+        git(project, 'remote', 'add', 'origin', remote)
+        git(project, 'fetch', '-q', 'origin')
+        with open(os.path.join(project, 'setup.py'), 'w') as f:
+            f.write(setup_py.format('0.2.0'))
+        git(project, 'commit', '-qam', 'advance')
+
+        with chdir(project):
+            with Capturing():
+                self.assertEqual(assert_version_advance([], offline=True), 0)
+
+            # the remote history still bounds the version
+            with open('setup.py', 'w') as f:
+                f.write(setup_py.format('0.0.1'))
+            git(project, 'commit', '-qam', 'regress')
+            with Capturing() as output:
+                self.assertEqual(assert_version_advance([], offline=True), 1)
+        self.assertIn('The maximum remote version is 0.1.0', '\n'.join(output))
+
+    def test_github_api_with_local_server(self):
+        import threading
+        import hashlib
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        from urllib.parse import urlparse, parse_qs
+        from git import Repo
+        from pre_commit_hooks.assert_version_advance import (
+            github_remote_history, ETAG_FILE
+        )
+        project = make_git_project(self, {'setup.py': "version = '0.0.0'\n"})
+        git(project, 'branch', '-M', 'main')
+        for i in range(1, 5):
+            with open(os.path.join(project, 'setup.py'), 'w') as f:
+                f.write(f"version = '0.{i}.0'\n")
+            git(project, 'commit', '-qam', f'version {i}')
+            git(project, 'tag', f'0.{i}.0')
+        git(project, 'remote', 'add', 'origin',
+            'git@github.com:owner/name.git')
+        repo = Repo(project)
+        shas = [c.hexsha for c in repo.iter_commits('main')]
+        requests_ = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                per_page = int(query['per_page'][0])
+                page = int(query['page'][0])
+                if url.path == '/repos/owner/name/commits':
+                    items = [{'sha': sha, 'commit': {}} for sha in shas]
+                elif url.path == '/repos/owner/name/git/refs/tags':
+                    items = [{'ref': f'refs/tags/0.{i}.0'} for i in range(1, 5)]
+                else:
+                    self.send_error(404)
+                    return
+                last = (len(items) - 1) // per_page + 1
+                body = json.dumps(
+                    items[(page - 1) * per_page:page * per_page]
+                ).encode()
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                status = 304 if self.headers.get('If-None-Match') == etag else 200
+                requests_.append((url.path, page, status))
+                self.send_response(status)
+                self.send_header('ETag', etag)
+                self.send_header('Link', f'<http://localhost/{url.path}'
+                                         f'?per_page={per_page}&page={last}>; '
+                                         f'rel="last"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if status == 200:
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        api_url = f'http://127.0.0.1:{server.server_port}'
+
+        commits, tags = github_remote_history(repo, 'origin', 'main',
+                                              api_url=api_url, per_page=2)
+        self.assertEqual([c.hexsha for c in commits], shas)
+        self.assertEqual(sorted(tags), ['0.1.0', '0.2.0', '0.3.0', '0.4.0'])
+        # 5 commits on 3 pages and 4 tags on 2 pages
+        self.assertEqual(len(requests_), 5)
+        self.assertEqual({r[2] for r in requests_}, {200})
+        self.assertTrue(os.path.isfile(os.path.join(project, '.git',
+                                                    ETAG_FILE)))
+
+        requests_.clear()
+        commits, tags = github_remote_history(repo, 'origin', 'main',
+                                              api_url=api_url, per_page=2)
+        self.assertEqual([c.hexsha for c in commits], shas)
+        self.assertEqual(len(tags), 4)
+        self.assertEqual({r[2] for r in requests_}, {304})
+
+    def test_commit_graph(self):
+        from pre_commit_hooks._git import CommitGraph
+        project = make_git_project(self, {'setup.py': "version = '0.1.0'\n"})
+        git(project, 'branch', '-M', 'main')
+        git(project, 'tag', '0.1.0')
+        git(project, 'commit', '-q', '--allow-empty', '-m', 'second')
+        git(project, 'tag', '-a', '0.2.0', '-m', 'annotated')
+        git(project, 'checkout', '-q', '-b', 'feature')
+        git(project, 'commit', '-q', '--allow-empty', '-m', 'feature')
+        git(project, 'tag', '0.3.0')
+        git(project, 'checkout', '-q', 'main')
+        main, first = git(project, 'rev-list', 'main').split()
+
+        graph = CommitGraph(cwd=project)
+        self.assertEqual(graph.tags_in('main'), {'0.1.0': first,
+                                                 '0.2.0': main})
+        self.assertEqual(set(graph.tags_in('feature')),
+                         {'0.1.0', '0.2.0', '0.3.0'})
+        self.assertTrue(graph.is_ancestor(first, 'main'))
+        self.assertFalse(graph.is_ancestor(graph.tags['0.3.0'], 'main'))
+        self.assertEqual(graph.parents[main], [first])
+
+    def test_read_local_version(self):
+        from pre_commit_hooks.assert_version_advance import read_local_version
+        from pre_commit_hooks import __version__
+        root = os.path.split(os.path.split(__file__)[0])[0]
+        self.assertEqual(read_local_version(root), __version__)
+
+        layouts = [
+            ({'pyproject.toml': "[project]\nname = 'pkg'\nversion = '1.0.0'\n"},
+             None),
+            ({'pyproject.toml': "[project]\nname = 'pkg'\n"
+                                "dynamic = ['version']\n"
+                                "[tool.setuptools.dynamic]\n"
+                                "version = {attr = 'pkg.__version__'}\n",
+              'src/pkg/__init__.py': "__version__ = '1.0.0'\n"}, None),
+            ({'pyproject.toml': "[tool.poetry]\nversion = '1.0.0'\n"}, None),
+            ({'setup.cfg': "[metadata]\nversion = attr: pkg._version.__version__\n",
+              'pkg/_version.py': "__version__ = '1.0.0'\n"}, None),
+            ({'setup.cfg': "[metadata]\nversion = file: VERSION\n",
+              'VERSION': "1.0.0\n"}, None),
+            ({'setup.py': "from setuptools import setup\n"
+                          "setup(name='pkg', version='1.0.0')\n"}, None),
+            ({'setup.py': "from pkg import __version__\n"
+                          "setup(version=__version__)\n",
+              'pkg/__init__.py': "__version__ = '1.0.0'\n"}, None),
+            ({'setup.py': "raise SystemExit('never executed')\n",
+              'pkg/version.txt': "version: '1.0.0'\n"}, 'pkg/version.txt'),
+        ]
+        for files, version_file in layouts:
+            with self.subTest(files=list(files)):
+                project = make_tmpdir(self)
+                for name, content in files.items():
+                    path = os.path.join(project, name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, 'w') as f:
+                        f.write(content)
+                self.assertEqual(read_local_version(project, version_file),
+                                 '1.0.0')
+
+        # pyproject.toml is parsed like the hook configurations
+        from pre_commit_hooks.assert_version_advance import pyproject_version
+        project = Path(make_tmpdir(self))
+        (project / 'pyproject.toml').write_text("[project\nversion = '1'\n")
+        self.assertIsNone(pyproject_version(project / 'pyproject.toml'))
+        self.assertIsNone(pyproject_version(project / 'missing.toml'))
+
+    def test_find_higher_version(self):
+        from git import Repo
+        from packaging import version
+        from pre_commit_hooks.assert_version_advance import find_higher_version
+        # an old commit had a wrong version, that was reverted and tagged
+        project = make_git_project(self, {'setup.py': "version = '9.9.9'\n"})
+        for v in ['0.1.0', '0.2.0', '0.3.0']:
+            with open(os.path.join(project, 'setup.py'), 'w') as f:
+                f.write(f"version = '{v}'\n")
+            git(project, 'commit', '-qam', v)
+        commits = list(Repo(project).iter_commits())
+        tagged = [commits[2].hexsha]
+
+        for bound, full_scan, expected, n_scanned in [
+                ('0.3.0', False, None, 3), ('0.2.0', False, '0.3.0', 1),
+                ('0.3.0', True, '9.9.9', 4)]:
+            with self.subTest(bound=bound, full_scan=full_scan):
+                memo = {}
+                found = find_higher_version(commits, version.parse(bound),
+                                            memo, tagged, full_scan=full_scan)
+                self.assertEqual(found, expected and version.parse(expected))
+                self.assertEqual(len([c for c in commits if c.hexsha in memo]),
+                                 n_scanned)
+
+        # the blobs of several commits are read with one git process
+        from unittest import mock
+        import pre_commit_hooks.assert_version_advance as module
+        for full_scan, n_calls in [(False, 3), (True, 1)]:
+            with self.subTest(full_scan=full_scan), \
+                    mock.patch.object(module._git, 'cat_blobs',
+                                      wraps=module._git.cat_blobs) as cat_blobs:
+                memo = {}
+                found = find_higher_version(commits, version.parse('9.9.9'),
+                                            memo, full_scan=full_scan)
+                self.assertIsNone(found)
+                self.assertTrue(all(c.hexsha in memo for c in commits))
+                self.assertEqual(cat_blobs.call_count, n_calls)
+
+    def test_scan_versions(self):
+        from unittest import mock
+        from git import Repo
+        from pre_commit_hooks import assert_version_advance as module
+        project = make_git_project(self, {
+            'pkg/_version.py': "__version__ = '0.1.0'\n",
+            'pkg/other.py': "x = 1\n",
+            'setup.py': "from pkg._version import __version__\n",
+        })
+        with open(os.path.join(project, 'pkg/_version.py'), 'w') as f:
+            f.write("__version__ = '0.2.0'\n")
+        git(project, 'commit', '-qam', 'advance')
+        with open(os.path.join(project, 'setup.py'), 'w') as f:
+            f.write("version = get_version()\n")
+        git(project, 'commit', '-qam', 'dynamic version')
+
+        commits = list(Repo(project).iter_commits())
+        module.VERSIONS_BY_SHA.clear()
+        with mock.patch.object(module._git, 'cat_blobs',
+                               wraps=module._git.cat_blobs) as cat_blobs:
+            self.assertEqual(module.scan_versions(commits), ['0.1.0', '0.2.0'])
+            # __init__.py, other.py, two setup.py and two _version.py
+            # are read in one batch
+            cat_blobs.assert_called_once()
+            self.assertEqual(len(cat_blobs.call_args[0][0]), 6)
+            module.scan_versions(commits)
+            cat_blobs.assert_called_once()
+
+        # only the new commit is scanned with a persistent index
+        index_file = os.path.join(project, '.git', module.INDEX_FILE)
+        index = {}
+        module.scan_versions(commits[1:], index)
+        module.save_index(index_file, index)
+        index = module.load_index(index_file, [c.hexsha for c in commits])
+        # only the rows of the commits to check are read up front
+        self.assertEqual(set(index), {c.hexsha for c in commits[1:]})
+        with mock.patch.object(module, 'blob_versions',
+                               wraps=module.blob_versions) as blob_versions:
+            self.assertEqual(module.scan_versions(commits, index),
+                             ['0.1.0', '0.2.0'])
+            # only the new setup.py is read, the unchanged trees are
+            # looked up in the database
+            blob_versions.assert_called_once()
+        new_entries = index.new_entries()
+        self.assertIn(commits[0].hexsha, new_entries)
+        self.assertNotIn(commits[1].hexsha, new_entries)
+        index.close()
+        module.save_index(index_file, new_entries)
+        index = module.load_index(index_file, [commits[0].hexsha])
+        self.assertEqual(index[commits[0].hexsha], ['0.2.0'])
+        self.assertEqual(index.new_entries(), {})
+        self.assertNotIn('0' * 40, index)
+        index.close()
+        self.assertEqual(module.load_index(index_file + '.missing',
+                                           ['0' * 40]), {})
+
+        # chunks are parsed in a process pool
+        memo = {}
+        shas = [git(project, 'rev-parse', f'HEAD~{i}:pkg/_version.py').strip()
+                for i in (1, 2)]
+        with mock.patch.object(module, 'PARSE_CHUNK', 1):
+            module.read_blob_versions(shas, project, memo, n_workers=2)
+        self.assertEqual(memo, {shas[0]: ['0.2.0'], shas[1]: ['0.1.0']})
+        self.assertEqual(module.blob_versions(b"x = 1\n"), [])
+        self.assertEqual(module.blob_versions(b"version = '1.2.3'\n"),
+                         ['1.2.3'])
+
 
 class TestRunCoverage(unittest.TestCase):
 
@@ -83,6 +671,379 @@ class TestRunCoverage(unittest.TestCase):
         from pre_commit_hooks.run_coverage import run_coverage
         self.assertEqual(run_coverage(tomlfile), 0)
 
+    def test_coverage_with_impact_map(self):
+        from pre_commit_hooks.run_coverage import (run_coverage,
+                                                   select_impacted_tests)
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE,
+            'pyproject.toml': '[tool.run_coverage]\nthreshold = 0\nimpact = true\n',
+        })
+        with chdir(project):
+            self.assertIsNone(select_impacted_tests())
+            self.assertEqual(run_coverage('pyproject.toml'), 0)
+
+            # change a line of `b`
+            with open('mod.py') as f:
+                content = f.read()
+            with open('mod.py', 'w') as f:
+                f.write(content.replace('x * 2', '2 * x'))
+            git(project, 'add', 'mod.py')
+            tests, changed = select_impacted_tests()
+            self.assertEqual([t.split('.', 1)[1] for t in tests],
+                             ['test_mod.TestB.test_b'])
+            self.assertEqual(changed, [os.path.join(project, 'mod.py')])
+            self.assertEqual(run_coverage('pyproject.toml'), 0)
+
+            # tests of a deleted test file are skipped
+            os.rename('test_mod.py', 'test_mod.bak')
+            self.assertEqual(select_impacted_tests(), ([], changed))
+            self.assertEqual(run_coverage('pyproject.toml'), 0)
+            os.rename('test_mod.bak', 'test_mod.py')
+
+            # a new file, that isn't in the map, forces a full run
+            with open('new.py', 'w') as f:
+                f.write('def c(x):\n    return x\n')
+            git(project, 'add', 'new.py')
+            self.assertIsNone(select_impacted_tests())
+            git(project, 'rm', '-q', '--cached', 'new.py')
+
+            # a changed test file forces a full run
+            with open('test_mod.py', 'a') as f:
+                f.write('\n')
+            self.assertIsNone(select_impacted_tests())
+            git(project, 'add', 'test_mod.py')
+            self.assertIsNone(select_impacted_tests())
+
+            # a failing run doesn't record an impact map
+            impact_map = os.path.join('.pre_commit_hooks_cache',
+                                      'impact_map.json')
+            os.remove(impact_map)
+            with open('test_failing.py', 'w') as f:
+                f.write(TEST_MODULE.replace('b(1), 2', 'b(1), 3'))
+            run_coverage('pyproject.toml')
+            self.assertFalse(os.path.isfile(impact_map))
+
+    def test_coverage_with_diff_coverage(self):
+        from unittest import mock
+        from pre_commit_hooks.run_coverage import run_coverage
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE,
+            'pyproject.toml': '[tool.run_coverage]\nthreshold = 50\n'
+                              'diff_coverage = true\n',
+        })
+        with chdir(project):
+            # nothing staged
+            self.assertEqual(run_coverage('pyproject.toml'), 0)
+
+            # a staged, uncovered function fails the threshold
+            with open('mod.py', 'a') as f:
+                f.write('\n\ndef c(x):\n    y = x - 1\n    return y\n')
+            git(project, 'add', 'mod.py')
+            self.assertEqual(run_coverage('pyproject.toml'), 1)
+            self.assertTrue(os.path.isfile('.coverage'))
+
+            # the data is newer than the sources and is reused
+            with mock.patch('coverage.Coverage.start') as start:
+                self.assertEqual(run_coverage('pyproject.toml'), 1)
+            start.assert_not_called()
+
+            # a changed test file isn't measured, but makes the data stale
+            stat = os.stat('.coverage')
+            with open('test_mod.py', 'a') as f:
+                f.write('\n')
+            os.utime('test_mod.py', ns=(stat.st_atime_ns,
+                                        stat.st_mtime_ns + 10 ** 9))
+            with mock.patch('coverage.Coverage.start') as start:
+                run_coverage('pyproject.toml')
+            start.assert_called()
+
+            # a staged change to covered code passes
+            git(project, 'reset', '-q', 'mod.py')
+            git(project, 'checkout', '--', 'mod.py')
+            with open('mod.py') as f:
+                content = f.read()
+            with open('mod.py', 'w') as f:
+                f.write(content.replace('x * 2', '2 * x'))
+            git(project, 'add', 'mod.py')
+            self.assertEqual(run_coverage('pyproject.toml'), 0)
+
+    def test_coverage_core(self):
+        from unittest import mock
+        from pre_commit_hooks.run_coverage import (make_coverage, make_config,
+                                                   coverage_core)
+        config = make_config(os.path.join(os.path.split(__file__)[0],
+                                          'data/pyproject.toml'))
+        self.assertIsNone(config['core'])
+        with mock.patch.dict(os.environ, {'COVERAGE_CORE': 'ctrace'}):
+            # without a core, coverage's own settings apply
+            with coverage_core(config):
+                self.assertEqual(os.environ['COVERAGE_CORE'], 'ctrace')
+            with coverage_core(config | {'core': 'pytrace'}):
+                self.assertEqual(os.environ['COVERAGE_CORE'], 'pytrace')
+                cov = make_coverage(config)
+            self.assertEqual(cov.config.core, 'pytrace')
+            self.assertEqual(os.environ['COVERAGE_CORE'], 'ctrace')
+            with coverage_core(config | {'core': 'sysmon', 'impact': True}):
+                self.assertEqual(os.environ['COVERAGE_CORE'], 'ctrace')
+        with mock.patch.dict(os.environ):
+            os.environ.pop('COVERAGE_CORE', None)
+            with coverage_core(config | {'core': 'sysmon'}):
+                if sys.version_info < (3, 12):
+                    self.assertNotIn('COVERAGE_CORE', os.environ)
+                else:
+                    self.assertEqual(os.environ['COVERAGE_CORE'], 'sysmon')
+            self.assertNotIn('COVERAGE_CORE', os.environ)
+
+    @unittest.skipIf(sys.version_info < (3, 12), 'sys.monitoring needs 3.12')
+    def test_coverage_with_sysmon_core_matches_tracer(self):
+        from pre_commit_hooks.run_coverage import run_coverage
+        percentages = []
+        for core in ['sysmon', 'ctrace']:
+            project = make_git_project(self, {
+                'mod.py': MODULE + '\n\ndef c(x):\n    return x\n',
+                'test_mod.py': TEST_MODULE,
+                'pyproject.toml': f'[tool.run_coverage]\nthreshold = 0\n'
+                                  f'core = "{core}"\n',
+            })
+            with chdir(project):
+                self.assertEqual(run_coverage('pyproject.toml'), 0)
+                import coverage
+                cov = coverage.Coverage()
+                cov.load()
+                percentages.append(cov.report())
+        self.assertEqual(percentages[0], percentages[1])
+
+    def test_coverage_with_result_cache(self):
+        from unittest import mock
+        import pre_commit_hooks.run_coverage as module
+        from pre_commit_hooks.run_coverage import run_coverage
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE,
+            'pyproject.toml': '[tool.run_coverage]\nthreshold = 0\n'
+                              'cache = true\n',
+            '.gitignore': 'venv/\n',
+        })
+        with chdir(project):
+            self.assertEqual(run_coverage('pyproject.toml'), 0)
+
+            # files ignored by git are not part of the key
+            os.makedirs('venv')
+            with open('venv/site.py', 'w') as f:
+                f.write('x = 1\n')
+            with mock.patch.object(module, 'measure', wraps=module.measure) as measure:
+                self.assertEqual(run_coverage('pyproject.toml'), 0)
+            measure.assert_not_called()
+
+            # only docs changed
+            with open('README.md', 'w') as f:
+                f.write('docs')
+            with mock.patch.object(module, 'measure', wraps=module.measure) as measure:
+                self.assertEqual(run_coverage('pyproject.toml'), 0)
+            measure.assert_not_called()
+
+            # touching a file without changing it is still cached
+            os.utime('mod.py')
+            with mock.patch.object(module, 'measure', wraps=module.measure) as measure:
+                self.assertEqual(run_coverage('pyproject.toml'), 0)
+            measure.assert_not_called()
+
+            # a changed python file is measured again
+            with open('mod.py', 'a') as f:
+                f.write('\n\ndef c(x):\n    return x\n')
+            with mock.patch.object(module, 'measure', wraps=module.measure) as measure:
+                run_coverage('pyproject.toml')
+            measure.assert_called()
+
+    def test_coverage_with_memory_budget(self):
+        from pre_commit_hooks.run_coverage import run_coverage
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE + textwrap.dedent('''\
+
+
+                LEAK = []
+
+
+                class TestLarge(unittest.TestCase):
+                    def test_large(self):
+                        LEAK.append(bytearray(20 * 1024 ** 2))
+                        self.assertEqual(len(LEAK[0]), 20 * 1024 ** 2)
+                '''),
+            'pyproject.toml': '[tool.run_coverage]\nthreshold = 0\n'
+                              'memory_profile = true\nmemory_budget = 10\n',
+        })
+        with chdir(project):
+            with Capturing() as output:
+                self.assertEqual(run_coverage('pyproject.toml'), 1)
+        output = '\n'.join(output)
+        self.assertIn('test_mod.TestLarge.test_large exceeds the memory budget',
+                      output)
+        self.assertNotIn('TestA.test_a exceeds', output)
+        self.assertIn('test_mod.py:20 +2048', output)
+
+    def test_memory_budget_fails_instead_of_passing(self):
+        from pre_commit_hooks._testing import MemoryResultMixin
+
+        class Recording(unittest.TestResult):
+            def addSuccess(self, test):
+                self.successes = getattr(self, 'successes', 0) + 1
+                super().addSuccess(test)
+
+        class TestMemory(unittest.TestCase):
+            def test_small(self):
+                pass
+
+            def test_large(self):
+                self.data = bytearray(2 * 1024 ** 2)
+
+        result = type('Result', (MemoryResultMixin, Recording),
+                      {'memory_budget': 1, 'memory_top': 0})()
+        suite = unittest.TestSuite([TestMemory('test_small'),
+                                    TestMemory('test_large')])
+        result.startTestRun()
+        suite.run(result)
+        result.stopTestRun()
+        # the test over the budget counts as a failure only
+        self.assertEqual(result.testsRun, 2)
+        self.assertEqual(result.successes, 1)
+        self.assertEqual(len(result.failures), 1)
+        self.assertIn('exceeds the memory budget', result.failures[0][1])
+        self.assertEqual(result.over_memory_budget,
+                         [TestMemory('test_large').id()])
+
+    def test_coverage_with_isolated_file(self):
+        from pre_commit_hooks.run_coverage import run_coverage
+        runner = textwrap.dedent('''\
+            import sys
+            import time
+            from mod import a
+
+
+            def main(verbosity=0):
+                assert a(1) == 2
+                if verbosity == 1:
+                    time.sleep(60)
+                if verbosity == 2:
+                    sys.exit(3)
+            ''')
+        project = make_git_project(self, {'mod.py': MODULE,
+                                          'run_tests.py': runner})
+        with chdir(project):
+            for verbose, expected in [(0, 0), (1, 1), (2, 1)]:
+                with open('pyproject.toml', 'w') as f:
+                    f.write(f'[tool.run_coverage]\nthreshold = 0\n'
+                            f'file = "run_tests.py"\nisolate = true\n'
+                            f'timeout = 2\nverbose = {verbose}\n')
+                self.assertEqual(run_coverage('pyproject.toml'), expected)
+        self.assertNotIn('run_tests', sys.modules)
+
+    def test_coverage_with_file_in_process(self):
+        from unittest import mock
+        from pre_commit_hooks.run_coverage import run_coverage
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        runner = 'from mod import a\n\n\ndef main(verbosity=0):\n' \
+                 '    assert a(1) == 2\n'
+        project = make_git_project(self, {'mod.py': MODULE,
+                                          'run_in_process.py': runner})
+        with chdir(project):
+            with open('pyproject.toml', 'w') as f:
+                f.write('[tool.run_coverage]\nthreshold = 0\n'
+                        'file = "run_in_process.py"\n')
+            # the file and its imports are removed with the project
+            self.addCleanup(sys.modules.pop, 'mod', None)
+            self.addCleanup(sys.modules.pop, 'run_in_process', None)
+            with mock.patch.object(sys, 'path', sys.path[:]), \
+                    Capturing() as output:
+                self.assertEqual(run_coverage('pyproject.toml'), 0)
+        # isolate is off by default
+        self.assertIn('run_in_process', sys.modules)
+        self.assertTrue(output[-1].startswith('Total coverage'), output)
+
+    def test_coverage_with_cached_total_and_reports(self):
+        from unittest import mock
+        import coverage
+        from pre_commit_hooks.run_coverage import run_coverage, total_percentage
+        project = make_git_project(self, {
+            'mod.py': MODULE + '\n\ndef c(x):\n    return (x +\n            1)\n',
+            'vendored/__init__.py': '',
+            'vendored/lib.py': 'def d(x):\n    return x\n',
+            'test_mod.py': TEST_MODULE + '\nfrom .vendored.lib import d\n',
+            'pyproject.toml': '[tool.run_coverage]\nthreshold = 0\n'
+                              'omit = ["*/vendored/*"]\n'
+                              'reports = ["xml", "json"]\n',
+        })
+        with chdir(project):
+            self.assertEqual(run_coverage('pyproject.toml'), 0)
+            self.assertTrue(os.path.isfile('coverage.xml'))
+            self.assertTrue(os.path.isfile('coverage.json'))
+
+            cov = coverage.Coverage(omit=['*/vendored/*'])
+            cov.load()
+            expected = cov.report()
+            self.assertEqual(total_percentage(cov), expected)
+            # the second run reads the numbers from the cache
+            with mock.patch.object(cov, 'analysis2',
+                                   wraps=cov.analysis2) as analysis2:
+                self.assertEqual(total_percentage(cov), expected)
+            analysis2.assert_not_called()
+
+    def test_coverage_with_branches(self):
+        import coverage
+        from pre_commit_hooks.run_coverage import run_coverage, total_percentage
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_git_project(self, {
+            'mod.py': 'def a(x):\n    if x:\n        x += 1\n    return x\n',
+            'test_mod.py': ('import unittest\nfrom .mod import a\n\n\n'
+                            'class TestA(unittest.TestCase):\n'
+                            '    def test_a(self):\n'
+                            '        self.assertEqual(a(1), 2)\n'),
+            'pyproject.toml': '[tool.run_coverage]\nthreshold = 90\n'
+                              'include = ["*/mod.py"]\n'
+                              '[tool.coverage.run]\nbranch = true\n',
+        })
+        with chdir(project):
+            # the branch skipping the `if` never runs
+            with Capturing() as output:
+                self.assertEqual(run_coverage('pyproject.toml'), 1)
+            cov = coverage.Coverage(include=['*/mod.py'])
+            cov.load()
+            with Capturing():
+                expected = cov.report()
+            self.assertIn(f'Total coverage: {expected:.2f}%', output)
+            self.assertAlmostEqual(total_percentage(cov), expected)
+            _, statements, _, missing, _ = cov.analysis2('mod.py')
+            self.assertLess(expected, 100 * (1 - len(missing) / len(statements)))
+
+    def test_coverage_with_warm_discovery_index(self):
+        import coverage
+        from pre_commit_hooks.run_coverage import run_coverage
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE,
+            'pyproject.toml': '[tool.run_coverage]\nthreshold = 0\n',
+        })
+        package = os.path.basename(project)
+        measured = []
+        with chdir(project):
+            for _ in range(2):
+                # the first run builds the index, the second one uses it
+                for name in [package, f'{package}.mod', f'{package}.test_mod']:
+                    sys.modules.pop(name, None)
+                with Capturing():
+                    self.assertEqual(run_coverage('pyproject.toml'), 0)
+                cov = coverage.Coverage()
+                cov.load()
+                files = cov.get_data().measured_files()
+                self.assertFalse([f for f in files if 'pre_commit_hooks' in f])
+                with Capturing():
+                    measured.append(cov.report(include=['*/mod.py']))
+        self.assertEqual(measured[0], measured[1])
+
     def test_coverage_without_unittest_file(self):
         from pre_commit_hooks.run_coverage import main
         self.assertEqual(main(), 1)
@@ -100,6 +1061,268 @@ class TestRunCoverage(unittest.TestCase):
             args = parser.parse_args(['all.tex', 'test.py', '-test', 'lol'])
 
 
+class TestDiscoveryIndex(unittest.TestCase):
+
+    def test_discover_with_index(self):
+        from pre_commit_hooks._testing import (discover, LazySuite, iter_tests,
+                                               TestSelector)
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE,
+            'test_other.py': TEST_MODULE.replace('TestA', 'TestC'),
+        })
+        package = os.path.basename(project)
+        top_level_dir = os.path.dirname(project)
+        with chdir(project):
+            loader = unittest.TestLoader()
+            suite = discover(loader, project, top_level_dir)
+            self.assertEqual(suite.countTestCases(), 4)
+            self.assertIn(f'{package}.test_other', sys.modules)
+
+            # unchanged modules are not imported during discovery
+            for name in [f'{package}.test_mod', f'{package}.test_other']:
+                del sys.modules[name]
+            with open('test_other.py', 'a') as f:
+                f.write('\n')
+            suite = discover(loader, project, top_level_dir,
+                             select=TestSelector(exclude=['*.TestB.*']))
+            self.assertNotIn(f'{package}.test_mod', sys.modules)
+            self.assertIn(f'{package}.test_other', sys.modules)
+            self.assertIsInstance(suite._tests[0], LazySuite)
+            self.assertEqual(suite.countTestCases(), 2)
+
+            ids = [t.id() for t in iter_tests(suite)]
+            self.assertIn(f'{package}.test_mod.TestA.test_a', ids)
+            self.assertIn(f'{package}.test_mod', sys.modules)
+            result = unittest.TestResult()
+            suite.run(result)
+            self.assertTrue(result.wasSuccessful())
+            self.assertEqual(result.testsRun, 2)
+
+    def test_discover_with_changed_base_class(self):
+        from pre_commit_hooks._testing import discover, iter_ids
+        project = make_git_project(self, {
+            'base.py': 'import unittest\n\n\n'
+                       'class Base(unittest.TestCase):\n'
+                       '    def test_a(self):\n'
+                       '        pass\n',
+            'test_mod.py': 'from .base import Base\n\n\n'
+                           'class TestMod(Base):\n'
+                           '    pass\n',
+        })
+        package = os.path.basename(project)
+        top_level_dir = os.path.dirname(project)
+        with chdir(project):
+            loader = unittest.TestLoader()
+            suite = discover(loader, project, top_level_dir)
+            self.assertIn(f'{package}.test_mod.TestMod.test_a',
+                          list(iter_ids(suite)))
+            # a new test in the base class is found, although test_mod.py
+            # didn't change
+            with open('base.py', 'a') as f:
+                f.write('\n    def test_b(self):\n        pass\n')
+            for name in [f'{package}.base', f'{package}.test_mod']:
+                del sys.modules[name]
+            suite = discover(loader, project, top_level_dir)
+            self.assertIn(f'{package}.test_mod.TestMod.test_b',
+                          list(iter_ids(suite)))
+
+    def test_discover_broken_modules(self):
+        from pre_commit_hooks._testing import discover
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE,
+            'test_raises.py': 'raise RuntimeError("boom")\n',
+            'test_indent.py': 'def f():\nreturn 1\n',
+        })
+        top_level_dir = os.path.dirname(project)
+        with chdir(project):
+            for use_index in (True, True, False):
+                loader = unittest.TestLoader()
+                suite = discover(loader, project, top_level_dir,
+                                 use_index=use_index)
+                result = unittest.TestResult()
+                suite.run(result)
+                # like unittest.TestLoader.discover, every broken module is
+                # one error
+                self.assertEqual(result.testsRun, 4)
+                self.assertEqual(len(result.errors), 2)
+                self.assertEqual(len(loader.errors), 2)
+                messages = '\n'.join(loader.errors)
+                self.assertIn('RuntimeError: boom', messages)
+                self.assertIn('IndentationError', messages)
+
+    def test_select_by_patterns_and_markers(self):
+        from pre_commit_hooks._testing import discover, iter_tests, TestSelector
+        project = make_git_project(self, {
+            'mod.py': MODULE,
+            'test_mod.py': TEST_MODULE.replace(
+                '    def test_b(self):',
+                '    markers = ["slow"]\n\n    def test_b(self):'),
+            'test_heavy.py': 'raise ImportError("must not be imported")\n',
+        })
+        package = os.path.basename(project)
+        top_level_dir = os.path.dirname(project)
+        loader = unittest.TestLoader()
+        with chdir(project):
+            for use_index in [True, True, False]:
+                select = TestSelector(exclude=['*.test_heavy.*', 'marker:slow'])
+                suite = discover(loader, project, top_level_dir, select=select,
+                                 use_index=use_index)
+                ids = [t.id() for t in iter_tests(suite)]
+                self.assertEqual(ids, [f'{package}.test_mod.TestA.test_a'])
+            self.assertNotIn(f'{package}.test_heavy', sys.modules)
+
+            select = TestSelector(include=['re:Test[BC]'],
+                                  exclude=['*.test_heavy.*'])
+            suite = discover(loader, project, top_level_dir, select=select)
+            ids = [t.id() for t in iter_tests(suite)]
+            self.assertEqual(ids, [f'{package}.test_mod.TestB.test_b'])
+
+        select = TestSelector(exclude=['re:test_heavy', '*slow*'])
+        self.assertTrue(select.excludes_module('pkg.test_heavy'))
+        self.assertTrue(select.excludes_module('pkg.test_slow_things'))
+        self.assertFalse(select.excludes_module('pkg.test_mod'))
+
+
+class TestStartup(unittest.TestCase):
+    ROOT = os.path.split(os.path.split(__file__)[0])[0]
+    # the cumulative import time of a hook module may be this multiple of the
+    # import time of `REFERENCE` on the same machine, so that the budget
+    # scales with slow runners. The environment variable sets a fixed budget
+    # in ms instead
+    IMPORT_BUDGET_FACTOR = 3
+    IMPORT_BUDGET_ENV = 'PRE_COMMIT_HOOKS_IMPORT_BUDGET'
+    REFERENCE = 'unittest'
+    HEAVY = ['coverage', 'git', 'requests', 'toml', 'packaging', 'setuptools',
+             'pycodestyle', 'unittest', 'multiprocessing', 'sqlite3']
+
+    def entry_points(self):
+        import ast
+        with open(os.path.join(self.ROOT, 'setup.py')) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if (isinstance(node, ast.Constant) and isinstance(node.value, str)
+                    and ' = pre_commit_hooks.' in node.value):
+                name, target = node.value.split(' = ')
+                yield name, target
+
+    def test_entry_points_exist(self):
+        import importlib
+        entry_points = dict(self.entry_points())
+        self.assertEqual(len(entry_points), 8)
+        for name, target in entry_points.items():
+            with self.subTest(name=name):
+                module, func = target.split(':')
+                self.assertTrue(callable(getattr(
+                    importlib.import_module(module), func)))
+
+    def import_time(self, module, code=''):
+        """Returns the fastest of three import times (µs) and the output."""
+        times = []
+        for _ in range(3):
+            proc = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c',
+                 f'import {module}; {code}'],
+                cwd=self.ROOT, capture_output=True, text=True, check=True,
+            )
+            cumulative = [int(line.split('|')[1])
+                          for line in proc.stderr.splitlines()
+                          if line.rstrip().endswith(f'| {module}')]
+            self.assertEqual(len(cumulative), 1)
+            times.append(cumulative[0])
+        return min(times), proc.stdout
+
+    def test_import_time_budget(self):
+        code = ('import sys; '
+                'print([m for m in {heavy} if m in sys.modules])')
+        if os.environ.get(self.IMPORT_BUDGET_ENV):
+            budget = float(os.environ[self.IMPORT_BUDGET_ENV]) * 1000
+        else:
+            budget = (self.IMPORT_BUDGET_FACTOR
+                      * self.import_time(self.REFERENCE)[0])
+        for name, target in self.entry_points():
+            module = target.split(':')[0]
+            with self.subTest(name=name):
+                cumulative, stdout = self.import_time(
+                    module, code.format(heavy=self.HEAVY))
+                self.assertEqual(stdout.strip(), '[]')
+                self.assertLess(cumulative, budget,
+                                msg=f"Importing {module} took "
+                                    f"{cumulative / 1000:.1f} ms, the "
+                                    f"budget is {budget / 1000:.1f} ms.")
+
+
+class TestDurations(unittest.TestCase):
+
+    def test_schedule_longest_first(self):
+        from pre_commit_hooks._testing import schedule
+        history = {'m.A.a1': [8.0], 'm.A.a2': [1.0], 'm.B.b1': [1.0, 5.0, 3.0],
+                   'm.B.b2': [4.0], 'n.C.c1': [3.0]}
+        test_ids = ['m.A.a1', 'm.A.a2', 'm.B.b1', 'm.B.b2', 'n.C.c1', 'n.C.new']
+        shards = schedule(test_ids, 2, history)
+        # A: 9, B: 7, C: 3 + 3 (the median for tests without history)
+        self.assertEqual(shards, [['m.A.a1', 'm.A.a2'],
+                                  ['m.B.b1', 'm.B.b2', 'n.C.c1', 'n.C.new']])
+
+    def test_sharded_run_sets_up_classes_once(self):
+        from pre_commit_hooks._testing import record_durations, run_sharded
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        test_module = textwrap.dedent('''\
+            import os
+            import unittest
+
+
+            class Setup(unittest.TestCase):
+                @classmethod
+                def setUpClass(cls):
+                    with open(os.path.join(os.path.dirname(__file__),
+                                           'setups.txt'), 'a') as f:
+                        f.write(cls.__name__ + ' ')
+
+                def test_1(self):
+                    pass
+
+                def test_2(self):
+                    pass
+
+
+            class A(Setup):
+                pass
+
+
+            class B(Setup):
+                pass
+            ''')
+        project = make_git_project(self, {'test_mod.py': test_module})
+        package = os.path.basename(project)
+        ids = [f'{package}.test_mod.{c}.test_{i}' for c in 'AB' for i in '12']
+        with chdir(project):
+            # recorded durations, that would interleave the classes
+            record_durations(dict(zip(ids, [5.0, 1.0, 3.0, 0.5])))
+            with Capturing():
+                successful, _ = run_sharded(ids, 1, os.path.dirname(project))
+            self.assertTrue(successful)
+            with open('setups.txt') as f:
+                self.assertEqual(f.read(), 'A B ')
+
+    def test_record_and_report_durations(self):
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        from pre_commit_hooks._testing import (record_durations,
+                                               report_durations, N_DURATIONS)
+        with chdir(make_tmpdir(self)):
+            for i in range(N_DURATIONS + 2):
+                history = record_durations({'a': float(i), 'b': 0.1})
+            self.assertEqual(history['a'], [2.0, 3.0, 4.0, 5.0, 6.0])
+            with Capturing() as output:
+                over = report_durations({'a': 6.0, 'b': 0.1, 'c': 2.0},
+                                        slowest=2, budget=1.0)
+        self.assertEqual(sorted(over), ['a', 'c'])
+        self.assertIn('Slowest 2 tests:', output[1])
+        self.assertTrue(output[2].endswith('a'))
+        self.assertTrue(output[3].endswith('c'))
+
+
 class TestPycodestyle(unittest.TestCase):
 
     def test_pycodestyle_parser(self):
@@ -174,6 +1397,173 @@ class TestPycodestyle(unittest.TestCase):
         self.assertEqual(options['paths'], ['data'])
 
 
+class TestConfig(unittest.TestCase):
+
+    def test_parse_cache(self):
+        from unittest import mock
+        from pre_commit_hooks import _config
+        project = make_tmpdir(self)
+        with chdir(project):
+            with open('pyproject.toml', 'w') as f:
+                f.write('[tool.run_pycodestyle]\nmax_line_length = 90\n')
+            with mock.patch.object(_config, 'parse_toml',
+                                   wraps=_config.parse_toml) as parse:
+                config, _ = _config.load_config('run_pycodestyle')
+                self.assertEqual(config['max_line_length'], 90)
+                self.assertEqual(config['excluded_files'], [])
+                # a new process reads the parsed file from the cache
+                _config.PARSED.clear()
+                config, _ = _config.load_config('run_pycodestyle')
+                self.assertEqual(config['max_line_length'], 90)
+                self.assertEqual(parse.call_count, 1)
+
+                # changing the file parses it again
+                with open('pyproject.toml', 'a') as f:
+                    f.write('verbose = 3\n')
+                config, _ = _config.load_config('run_pycodestyle')
+                self.assertEqual(config['verbose'], 3)
+                self.assertEqual(parse.call_count, 2)
+
+    def test_validation(self):
+        from pre_commit_hooks import _config
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_tmpdir(self)
+        tomlfile = os.path.join(project, 'pyproject.toml')
+        with open(tomlfile, 'w') as f:
+            f.write('[tool.run_run_unittests]\nworker = 2\n'
+                    'preload = "mod"\n')
+        with self.assertRaises(ValueError) as e:
+            _config.load_config('run_run_unittests', tomlfile)
+        self.assertIn("preload must be list", str(e.exception))
+        self.assertNotIn("worker", str(e.exception))
+        # unknown options are ignored with a warning
+        with open(tomlfile, 'w') as f:
+            f.write('[tool.run_run_unittests]\nworker = 2\n')
+        with Capturing() as output:
+            config, _ = _config.load_config('run_run_unittests', tomlfile)
+        self.assertNotIn('worker', config)
+        self.assertEqual(len(output), 1)
+        self.assertIn("Ignoring unknown option 'worker'", output[0])
+        self.assertIn("workers", output[0])
+        # other sections are not affected
+        config, _ = _config.load_config('run_pycodestyle', tomlfile)
+        self.assertEqual(config['max_line_length'], 79)
+
+    def test_notebook_config(self):
+        from unittest import mock
+        from pre_commit_hooks.run_notebooks import run_notebooks
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_tmpdir(self)
+        tomlfile = os.path.join(project, 'pyproject.toml')
+        with open(tomlfile, 'w') as f:
+            f.write('[tool.run_notebooks]\nexcluded_files = ["slow_*.ipynb"]\n'
+                    'timeout = 600\nkernel = "python3"\nverbose = true\n')
+        with mock.patch('subprocess.call', return_value=0) as call, \
+                Capturing() as output:
+            out = run_notebooks(['nbs/slow_training.ipynb',
+                                 'nbs/quick.ipynb'], tomlfile)
+        self.assertEqual(out, 0)
+        self.assertIn('Skipping excluded notebook nbs/slow_training.ipynb',
+                      output)
+        call.assert_called_once()
+        cmd = call.call_args[0][0]
+        self.assertIn('nbs/quick.ipynb', cmd)
+        self.assertIn('--ExecutePreprocessor.timeout=600', cmd)
+        self.assertIn('--ExecutePreprocessor.kernel_name=python3', cmd)
+
+
+class TestRunHooks(unittest.TestCase):
+
+    def test_run_hooks(self):
+        from pre_commit_hooks.run_hooks import run_hooks, HOOKS
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_git_project(self, {
+            'good.py': 'x = 1\n',
+            'tests/run_unittests.py': 'import sys\n'
+                                      'print(sys.argv[1:])\n',
+            'pyproject.toml': '[tool.run_pycodestyle]\nmax_line_length = 90\n',
+        })
+        with chdir(project):
+            with open('bad.py', 'w') as f:
+                f.write('x=1\n')
+            with open('good.py', 'a') as f:
+                f.write('y = 2\n')
+            git(project, 'add', 'bad.py', 'good.py')
+            with Capturing() as output:
+                out = run_hooks(['clear-ipynb-cells', 'run-pycodestyle',
+                                 'run-run-unittests'])
+        self.assertEqual(out, 1)
+        output = '\n'.join(output)
+        self.assertRegex(output, r'clear-ipynb-cells\.+Skipped')
+        self.assertRegex(output, r'run-run-unittests\.+Passed')
+        self.assertRegex(output, r'run-pycodestyle\.+Failed with exit code 1')
+        # the output of a failed hook is printed below it
+        self.assertIn('E225', output)
+        self.assertIn('2 of 3 hooks passed', output)
+
+        with self.assertRaises(ValueError):
+            run_hooks(['run-pycodestile'])
+        self.assertIn('run-coverage', HOOKS)
+
+    def test_run_hooks_captures_subprocesses(self):
+        from unittest import mock
+        from pre_commit_hooks.run_hooks import run_hooks
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        project = make_git_project(self, {
+            'tests/run_unittests.py': 'import sys\n'
+                                      'print("output of the tests")\n'
+                                      'sys.exit(1)\n',
+        })
+        with chdir(project):
+            with Capturing() as output:
+                out = run_hooks(['run-run-unittests'], all_files=True)
+        self.assertEqual(out, 1)
+        # the output of the subprocess is printed below its hook
+        self.assertRegex(output[0], r'run-run-unittests\.+Failed')
+        self.assertEqual(output[1], '    output of the tests')
+
+        with chdir(project), Capturing(), mock.patch(
+                'pre_commit_hooks.assert_version_advance.'
+                'assert_version_advance', return_value=0) as check:
+            run_hooks(['assert-version-advance'], all_files=True,
+                      options={'branch': 'master'})
+        check.assert_called_once_with(mock.ANY, branch='master',
+                                      remote='origin')
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_benchmarks_smoke(self):
+        import copy
+        from tests.benchmark_hooks import run_benchmarks, compare
+        from pre_commit_hooks.run_pycodestyle import Capturing
+        scale = {'files': 2, 'violations': 4, 'commits': 30, 'tags': 3}
+        with Capturing():
+            results = run_benchmarks(
+                scale, only=['run_pycodestyle', 'assert_version_advance'],
+                repeat=1,
+            )
+        results = json.loads(json.dumps(results))
+        self.assertEqual(results['scale']['commits'], 30)
+        self.assertEqual(set(results['results']),
+                         {'run_pycodestyle', 'assert_version_advance'})
+        # the synthetic violations fail pycodestyle, the history passes
+        self.assertEqual(results['results']['run_pycodestyle']['exit_code'], 1)
+        self.assertEqual(
+            results['results']['assert_version_advance']['exit_code'], 0)
+        for result in results['results'].values():
+            self.assertEqual(len(result['times']), 1)
+            self.assertGreater(result['peak_memory'], 0)
+
+        slower = copy.deepcopy(results)
+        slower['results']['run_pycodestyle']['median'] *= 2
+        with Capturing() as output:
+            self.assertEqual(compare(results, results), 0)
+            self.assertEqual(compare(results, slower), 1)
+        self.assertIn('Regressions (more than 1.20 times the old value): '
+                      'run_pycodestyle', output)
+
+
 class TestClearIpynbCells(unittest.TestCase):
 
     def test_clear_notebook_fails(self):